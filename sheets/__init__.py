@@ -1,4 +1,5 @@
-__all__ = ["Workbook", "CellError", "CellErrorType"]
+__all__ = ["Workbook", "CellError", "CellErrorType", "register_function", "unregister_function"]
 from .workbook import Workbook
 from .cell import CellError, CellErrorType
+from .user_functions import register_function, unregister_function
 version = "1.4"
\ No newline at end of file
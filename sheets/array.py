@@ -0,0 +1,61 @@
+from typing import Any, Callable, List
+
+from .error import CellError, CellErrorType
+from .range import CellRange
+
+class Array:
+    '''
+    The value of a formula that applies operators to cell ranges: a grid of
+    values computed element-wise, which spills into the cells below and to
+    the right of the formula's cell. The values are kept in one flat list in
+    row-major order.
+    '''
+
+    def __init__(self, cols: int, rows: int, values: List[Any]):
+        self.cols = cols
+        self.rows = rows
+        self.values = values
+
+    @staticmethod
+    def from_range(workbook, cell_range: CellRange):
+        sheet = workbook.sheet_map[cell_range.sheet_name.lower()]
+        start, end = cell_range.start_ref, cell_range.end_ref
+
+        values = []
+        for row in range(start.row, end.row + 1):
+            for col in range(start.col, end.col + 1):
+                c = sheet.cells.get((col, row))
+                values.append(None if c is None else c.value)
+
+        return Array(end.col - start.col + 1, end.row - start.row + 1, values)
+
+    def get(self, col: int, row: int):
+        # a single row or column is repeated to fill the other dimension, as
+        # is done with arrays of different shapes in spreadsheet programs
+        if self.cols == 1:
+            col = 0
+        if self.rows == 1:
+            row = 0
+
+        if col >= self.cols or row >= self.rows:
+            return CellError(CellErrorType.TYPE_ERROR, "arrays have different sizes")
+
+        return self.values[row * self.cols + col]
+
+    @staticmethod
+    def elementwise(f: Callable[[List[Any]], Any], operands: List[Any]):
+        '''
+        Applies f to each element of the given operands, which are arrays or
+        single values; single values are used for every element. The result
+        is as large as the largest operand in each dimension.
+        '''
+        arrays = [a for a in operands if isinstance(a, Array)]
+        cols = max(a.cols for a in arrays)
+        rows = max(a.rows for a in arrays)
+
+        values = []
+        for row in range(rows):
+            for col in range(cols):
+                values.append(f([a.get(col, row) if isinstance(a, Array) else a for a in operands]))
+
+        return Array(cols, rows, values)
@@ -1,4 +1,5 @@
 import decimal
+import numbers
 import re
 
 from typing import Any
@@ -78,21 +79,33 @@ def to_string(value: Any) -> str:
 
     return CellError(CellErrorType.TYPE_ERROR, f"failed to convert type {type(value)} to a string")
 
+# order of values of different types when sorting
+TYPE_RANKS = {type(None): 0, CellError: 1, decimal.Decimal: 2, str: 3, bool: 4}
+
+def sort_key(value):
+    # Returns a key that orders values the same way as lt(), so a list of
+    # values can be sorted without comparing them pairwise.
+    if isinstance(value, str):
+        return (3, value.lower())
+    elif isinstance(value, CellError):
+        return (1, value.get_type().value)
+    elif value is None:
+        return (0, 0)
+    return (TYPE_RANKS[type(value)], value)
+
 def lt(a, b):
-    if isinstance(a, type(b)):
-        if isinstance(a, str):
-            a = a.lower()
-            b = b.lower()
-
-        if isinstance(a, CellError):
-            a = a.get_type().value
-            b = b.get_type().value
-
-        if isinstance(a, type(None)):
-            a = "None"
-            b = "None"
-
-        return a < b
-    else:
-        types = {type(None): 0, CellError: 1, decimal.Decimal: 2, str: 3, bool: 4}
-        return types[type(a)] < types[type(b)]
+    return sort_key(a) < sort_key(b)
+
+def to_cell_value(value):
+    # a value from outside the workbook as it'd be stored in a cell: numbers
+    # become Decimals, and NumPy scalars are unwrapped without importing
+    # NumPy
+    if hasattr(value, "item") and not isinstance(value, (str, decimal.Decimal)):
+        value = value.item()
+
+    if isinstance(value, bool) or value is None or isinstance(value, (str, CellError, decimal.Decimal)):
+        return value
+    elif isinstance(value, numbers.Number):
+        return decimal.Decimal(str(value))
+
+    raise TypeError(f"can't use a {type(value)} as a cell value")
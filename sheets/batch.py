@@ -0,0 +1,351 @@
+from typing import Any, Dict, List, Sequence, Tuple
+
+from . import functions
+from . import interp
+from . import parallel
+
+from .array import Array
+from .base_types import to_cell_value
+from .cell import Cell
+from .error import CellError, CellErrorType, FormulaError
+from .operators import result_value
+from .range import CellRange
+from .reference import Reference
+
+# Batch evaluation runs a workbook as a function: given the values of some
+# input cells for each of N rows, it finds the values of some output cells
+# for each row without changing the workbook.
+#
+# The formulas that depend on the inputs are evaluated once per batch, in
+# dependency order. Each one's value is kept as an Array with one value per
+# row, so a formula made of operators, references and element-wise
+# functions is evaluated once over all of the rows by the Array operators
+# the interpreter already has. Formulas that use ranges or functions that
+# can't work element-wise fall back to being evaluated once per row.
+#
+# Cells that hold part of an array spilled from a formula are evaluated
+# after the formula, taking their values from its array for each row. The
+# arrays are taken to spill over the same region they do in the workbook:
+# cells that a row's larger array would spill into keep their values.
+
+def find_cell(workbook, sheet_name, ref, stand_ins):
+    '''
+    Returns the cell at ref. A cell that doesn't exist gets a stand-in that
+    isn't added to its sheet, which is kept in stand_ins so the same one is
+    found each time. Raises KeyError for a missing sheet.
+    '''
+    sheet = workbook.sheet_map[(ref.sheet_name or sheet_name).lower()]
+    c = sheet.cells.get(ref.tuple())
+    if c is None:
+        key = (sheet, ref.tuple())
+        if key not in stand_ins:
+            stand_ins[key] = Cell(sheet, Reference(sheet.sheet_name, ref.col, ref.row))
+        c = stand_ins[key]
+    return c
+
+def resolved_refs(workbook, c, stand_ins):
+    # the cells c's formula references, branches of lazy functions included
+    for ref in c.all_refs:
+        try:
+            yield find_cell(workbook, c.sheet.sheet_name, ref.check_bounds(), stand_ins)
+        except (KeyError, ValueError):
+            continue
+
+def is_vectorizable(tree) -> bool:
+    # Only operators, references, literals and element-wise functions; a
+    # range or a lazily evaluated function needs the values of one row.
+    for t in tree.iter_subtrees():
+        if t.data == "cell_range":
+            return False
+        if t.data == "func_expr" and str(t.children[0]).lower() not in functions.elementwise_functions:
+            return False
+    return True
+
+class BatchEvaluator(interp.FormulaEvaluator):
+    '''
+    Evaluates a formula using the batch's values for the cells that have
+    them: their whole Arrays, or with row given, their values for that row.
+    Nothing is linked in the dependency graph and no cells are created.
+    '''
+
+    def __init__(self, workbook, sheet, cell, values: Dict[Any, Array], stand_ins, row=None):
+        super().__init__(workbook, sheet, cell)
+        self.values = values
+        self.stand_ins = stand_ins
+        self.row = row
+
+        # the inputs' values are swapped in without changing their sheets'
+        # version stamps, so cached results can't be trusted
+        self.function_cache = None
+
+    def value_of(self, c):
+        array = self.values.get(c)
+        if array is None:
+            return c.value
+        return array if self.row is None else array.values[self.row]
+
+    def cell(self, tree):
+        location = str(tree.children[0])
+        try:
+            ref = Reference.from_string(self.sheet.sheet_name, location)
+            ref.check_bounds()
+            return self.value_of(find_cell(self.workbook, self.sheet.sheet_name, ref, self.stand_ins))
+        except (ValueError, KeyError):
+            return CellError(CellErrorType.BAD_REFERENCE, location)
+
+    def link_runtime(self, ref):
+        return find_cell(self.workbook, self.sheet.sheet_name, ref, self.stand_ins)
+
+    def link_runtime_range(self, cell_range):
+        pass
+
+    def func_expr(self, tree):
+        name = str(tree.children[0]).lower()
+
+        if self.row is not None or name not in functions.elementwise_functions:
+            return super().func_expr(tree)
+
+        f = functions.functions[name].f
+        args = self.visit_children(tree)[1:]
+
+        if not any(isinstance(a, Array) for a in args):
+            return f(self, args)
+        return Array.elementwise(lambda row_args: f(self, row_args), args)
+
+def in_range(c, sheet_name: str, r) -> bool:
+    # whether c is in the range r, which is on the sheet with the given
+    # lowercase name
+    return c.sheet.sheet_name.lower() == sheet_name \
+        and r.start_ref.col <= c.location.col <= r.end_ref.col \
+        and r.start_ref.row <= c.location.row <= r.end_ref.row
+
+def batch_nodes(workbook, inputs, stand_ins):
+    '''
+    Returns the formula cells, and the cells holding parts of their arrays,
+    that depend on any of the input cells, and for each of them the ones
+    among them that it reads; spilled cells read the cell they're spilled
+    from. Besides the
+    dependency graph's links, a formula reads the cells referenced by
+    arguments of lazy functions that weren't used last time, and every cell
+    in its whole-row, whole-column and criteria ranges, populated or not.
+    '''
+    readers = {}
+    range_readers = []
+    for s in workbook.sheets:
+        for c in s.cells.values():
+            if c.formula_tree is None:
+                continue
+
+            for other in resolved_refs(workbook, c, stand_ins):
+                readers.setdefault(other, set()).add(c)
+
+            for r in c.ranges:
+                range_readers.append((c, (r.sheet_name or s.sheet_name).lower(), r))
+
+    def readers_of(c):
+        result = set(workbook.dependency_graph.get_backward_links(c)) | readers.get(c, set())
+        result.update(w for w, sheet_name, r in range_readers if in_range(c, sheet_name, r))
+        return result
+
+    nodes = set()
+    queue = list(inputs)
+    while len(queue) > 0:
+        c = queue.pop()
+        for w in readers_of(c):
+            if w not in nodes and (w.formula_tree is not None or w.spilled_from is not None):
+                nodes.add(w)
+                queue.append(w)
+
+    reads = {c: set() for c in nodes}
+    for c in nodes:
+        for w in readers_of(c):
+            if w in nodes:
+                reads[w].add(c)
+
+    return nodes, reads
+
+def order_nodes(nodes, reads):
+    # Kahn's algorithm; cells on or depending on a cycle are left out, and
+    # keep the values they have in the workbook
+    waiting = {c: len(reads[c]) for c in nodes}
+    readers = {}
+    for c in nodes:
+        for w in reads[c]:
+            readers.setdefault(w, []).append(c)
+
+    order = [c for c, count in waiting.items() if count == 0]
+    for c in order:
+        for r in readers.get(c, []):
+            waiting[r] -= 1
+            if waiting[r] == 0:
+                order.append(r)
+
+    return order
+
+def cells_read(workbook, c, values, stand_ins):
+    # the cells with batch values that the formula in c can read, which have
+    # to hold their row's values when it's evaluated one row at a time
+    if parallel.uses_indirect(c.formula_tree):
+        return list(values)
+
+    result = set(other for other in resolved_refs(workbook, c, stand_ins) if other in values)
+
+    for r in c.ranges:
+        sheet_name = (r.sheet_name or c.sheet.sheet_name).lower()
+        result.update(other for other in values if in_range(other, sheet_name, r))
+
+    return list(result)
+
+def evaluate_vectorized(workbook, c, values, stand_ins, n):
+    evaluator = BatchEvaluator(workbook, c.sheet, c, values, stand_ins)
+    value = evaluator.visit(c.formula_tree)
+
+    if isinstance(value, Array) and value.cols == 1 and value.rows == n:
+        return [result_value(v) for v in value.values]
+    return [result_value(value)] * n
+
+def range_array(workbook, r, values, stand_ins, row):
+    # the range's values in the given row, including those of the stand-ins
+    # in it, which aren't on its sheet
+    array = Array.from_range(workbook, r)
+    for other in stand_ins.values():
+        if other in values and in_range(other, r.sheet_name.lower(), r):
+            index = (other.location.row - r.start_ref.row) * array.cols + other.location.col - r.start_ref.col
+            array.values[index] = values[other].values[row]
+    return array
+
+def evaluate_rows(workbook, c, values, stand_ins, n, arrays):
+    # arrays gets the Arrays c evaluates to, one per row (or None), for the
+    # cells they spill into
+    swapped = cells_read(workbook, c, values, stand_ins)
+    saved = [(other, other.value) for other in swapped]
+    sheets = set(other.sheet for other in swapped)
+    saved_indexes = [(s, s.column_indexes) for s in sheets]
+
+    # inputs that are empty in the workbook, whether they're stand-ins or
+    # cells that are only there because formulas refer to them, are put in
+    # their sheets' spatial indexes for as long as they hold values, so
+    # functions that look through a range's populated cells find them
+    placed = [other for other in swapped if not other.sheet.is_populated(other.location)]
+    added = [other for other in placed if other.location.tuple() not in other.sheet.cells]
+    for other in placed:
+        other.sheet.add_populated(other.location)
+    for other in added:
+        other.sheet.cells[other.location.tuple()] = other
+
+    results = []
+    try:
+        for row in range(n):
+            # functions that read ranges look at the cells themselves, so
+            # they're given this row's values for as long as it takes;
+            # column indexes are rebuilt from them as needed
+            for other in swapped:
+                other.value = values[other].values[row]
+            for s in sheets:
+                s.column_indexes = {}
+
+            evaluator = BatchEvaluator(workbook, c.sheet, c, values, stand_ins, row)
+            try:
+                value = evaluator.visit(c.formula_tree)
+            except FormulaError as e:
+                value = e.value
+
+            if isinstance(value, CellRange):
+                value = range_array(workbook, value, values, stand_ins, row)
+
+            array = None
+            if isinstance(value, Array):
+                array = value if len(value.values) > 1 else None
+                value = value.values[0]
+
+            results.append(result_value(value))
+            arrays.append(array)
+    finally:
+        for other, value in saved:
+            other.value = value
+        for s, indexes in saved_indexes:
+            s.column_indexes = indexes
+        for other in placed:
+            other.sheet.remove_populated(other.location)
+        for other in added:
+            del other.sheet.cells[other.location.tuple()]
+
+    return results
+
+def spilled_values(c, arrays, n):
+    # the values of a cell holding part of an array, from the arrays its
+    # formula evaluated to; it's empty in rows where there's no array
+    anchor = c.spilled_from
+    col = c.location.col - anchor.location.col
+    row = c.location.row - anchor.location.row
+
+    results = []
+    for array in arrays.get(anchor, [None] * n):
+        if array is None or col >= array.cols or row >= array.rows:
+            results.append(None)
+        else:
+            results.append(result_value(array.values[row * array.cols + col]))
+    return results
+
+def evaluate_batch(workbook,
+                   inputs: Sequence[Tuple[str, str]],
+                   outputs: Sequence[Tuple[str, str]],
+                   rows) -> List[List[Any]]:
+    '''
+    Returns the values of the output cells for each row of input values.
+    inputs and outputs are (sheet name, location) pairs, and rows is a
+    sequence of rows (or a 2-D NumPy array) with one value per input cell.
+    The workbook itself is left as it was.
+
+    The order cells are evaluated in comes from every reference in their
+    formulas, including those in arguments of lazy functions like IF that
+    may not be evaluated. A cell that reaches itself through such references
+    is taken to be on a cycle even when the branches that close it aren't
+    taken: it isn't evaluated, and it and the cells that depend on it give
+    their values in the workbook for every row.
+
+    Raises KeyError for a missing sheet, ValueError for a bad location or a
+    row of the wrong length, and TypeError for an input value that can't be
+    stored in a cell.
+    '''
+    def find(sheet_name, location):
+        ref = Reference.from_string(sheet_name, location).check_bounds()
+        return find_cell(workbook, sheet_name, ref, stand_ins)
+
+    stand_ins = {}
+
+    input_cells = [find(sheet_name, location) for sheet_name, location in inputs]
+    output_cells = [find(sheet_name, location) for sheet_name, location in outputs]
+
+    rows = [list(row) for row in rows]
+    n = len(rows)
+    if any(len(row) != len(input_cells) for row in rows):
+        raise ValueError("every row needs one value per input cell")
+
+    values = {}
+    for i, c in enumerate(input_cells):
+        values[c] = Array(1, n, [to_cell_value(row[i]) for row in rows])
+
+    arrays = {}
+    nodes, reads = batch_nodes(workbook, input_cells, stand_ins)
+    for c in order_nodes(nodes, reads):
+        if c in values:
+            continue
+
+        if c.formula_tree is None:
+            results = spilled_values(c, arrays, n)
+        elif is_vectorizable(c.formula_tree):
+            results = evaluate_vectorized(workbook, c, values, stand_ins, n)
+        else:
+            arrays[c] = []
+            results = evaluate_rows(workbook, c, values, stand_ins, n, arrays[c])
+        values[c] = Array(1, n, results)
+
+    columns = []
+    for c in output_cells:
+        if c in values:
+            columns.append(values[c].values)
+        else:
+            columns.append([c.value] * n)
+
+    return [list(row) for row in zip(*columns)] if len(columns) > 0 else [[] for _ in range(n)]
@@ -1,37 +1,107 @@
 import copy
-import decimal
 
 from typing import Tuple
 
 from . import interp
+from . import memo
 
+from .array import Array
 from .error import CellError, CellErrorType, FormulaError
+from .operators import contents_value, result_value
 from .range import CellRange
+from .reference import Reference
 
 def is_empty_content_string(contents):
     return contents is None or contents == "" or contents.isspace()
 
-def remove_trailing_zeros(d: decimal.Decimal):
-    num = str(d)
-    e = num.rfind("E") if "E" in num else len(num)
-    if "." in num:
-        num = num[:e].rstrip("0") + num[e:]
-    if num[-1] == ".":
-        num = num[:-1]
-    return decimal.Decimal(num)
-
 class Cell: 
     def __init__(self, sheet, location):
         self.sheet = sheet
         self.location = location
         self.value = None
-        self.contents = None
+        self._contents = None
         self.formula_tree = None
+
+        # False while formula_tree is shared with another cell (see
+        # share_cell); the tree must be copied before it's rewritten in place.
+        self.owns_tree = True
+
+        # Set when formula_tree has been moved or renamed in place; the
+        # contents string is then printed from the tree the next time it's
+        # asked for.
+        self.contents_stale = False
+
+        # references found in formula_tree, with sheet_name None for
+        # references to this cell's own sheet
+        self.static_refs = []
+        self.all_refs = []
+
+        # ranges found in formula_tree that are linked only to their
+        # populated cells (see Sheet.range_watchers). The sheets they're on
+        # are in watched_sheets, and link this cell to the cells in them as
+        # they become non-empty.
+        self.ranges = []
+        self.watched_sheets = set()
+
+        # For a formula whose value is an Array: the size of the region it
+        # spills into, with this cell at the top left, and the other cells in
+        # the region, which hold the rest of the array. spill_cells is empty
+        # while something else is in the way.
+        self.spill_shape = None
+        self.spill_cells = []
+
+        # the cell whose array value this empty cell holds part of
+        self.spilled_from = None
+
+        # cells and (lowercase) sheet names this cell's formula used through
+        # lazy functions, INDIRECT and lookups when it was last evaluated
+        self.runtime_cells = set()
+        self.runtime_sheets = set()
     
     def __str__(self):
         return str(self.contents)
+
+    def is_empty(self):
+        # doesn't print stale formula text just to check
+        return self._contents is None
+
+    @property
+    def contents(self):
+        if self.contents_stale:
+            self._contents = interp.print_formula(self.formula_tree)
+            self.contents_stale = False
+        return self._contents
+
+    @contents.setter
+    def contents(self, contents):
+        self.set_contents_text(contents, False)
+
+    def set_contents_text(self, contents, stale):
+        # anything entered into a cell that holds part of an array is in the
+        # way of the whole array
+        if contents is not None and self.spilled_from is not None:
+            self.spilled_from.clear_spill()
+            # this cell's own change is reported with its new contents
+            self.sheet.workbook.spill_changes.pop(self, None)
+
+        # the sheet counts the non-empty cells in each row and column
+        if (self._contents is None) != (contents is None):
+            self.sheet.set_occupied(self, contents is not None)
+
+        self._contents = contents
+        self.contents_stale = stale
         
     def set_value(self, value):
+        index = self.sheet.column_indexes.get(self.location.col)
+        if index is not None:
+            index.update(self.location.row, self.value, value)
+
+        # numbers that are equal but written differently count as changed
+        if value is not self.value and not (type(value) is type(self.value)
+                                            and value == self.value
+                                            and str(value) == str(self.value)):
+            self.sheet.version = next(memo.version_stamps)
+
         self.value = value
 
     def get_value(self):
@@ -43,86 +113,323 @@ class Cell:
         if self.formula_tree is None:
             raise FormulaError(CellError(CellErrorType.PARSE_ERROR, ""))
 
+        self.formula_tree = interp.fold_constants(self.formula_tree)
+        self.find_references()
+
+    def find_references(self):
+        self.static_refs, self.all_refs, self.ranges = interp.find_refs(self.formula_tree)
+
+    def resolve(self, workbook, ref):
+        '''
+        Returns the cell the given reference from this cell's formula points
+        to. Raises KeyError if the referenced sheet doesn't exist.
+        '''
+        return workbook.sheet_map[(ref.sheet_name or self.sheet.sheet_name).lower()].get_cell(ref)
+
     def check_references(self, workbook):
         if self.formula_tree is None:
             return
 
-        static_refs, all_refs = interp.find_refs(workbook, self.sheet, self.formula_tree)
-
         # link to all referenced sheet names - even if they're not used
-        for ref in all_refs:
-            workbook.sheet_references.link(self, ref.sheet_name.lower())
+        sheet_names = set((ref.sheet_name or self.sheet.sheet_name).lower() for ref in self.all_refs)
 
         # only link to the cells that are used in evaluation every time
         # (the static references)
-        for ref in static_refs:
+        cells = set()
+        for ref in self.static_refs:
             try:
                 ref.check_bounds()
-                cell = workbook.get_cell(ref)
-                workbook.dependency_graph.link(self, cell)
+                cells.add(self.resolve(workbook, ref))
             except (KeyError, ValueError):
                 pass
+
+        # whole-row and whole-column ranges, and ranges given to criteria
+        # functions, only link to the cells in them that are populated
+        for r in self.ranges:
+            sheet_name = (r.sheet_name or self.sheet.sheet_name).lower()
+            sheet_names.add(sheet_name)
+
+            sheet = workbook.sheet_map.get(sheet_name)
+            if sheet is None:
+                continue
+
+            # once the sheet is watching the range it links the cells that
+            # are populated later, so the ones populated now only have to be
+            # linked the first time
+            if not sheet.watch_range(self, r):
+                continue
+            self.watched_sheets.add(sheet)
+
+            for _location, c in sheet.get_cells_in_region(r.start_ref.tuple(), r.end_ref.tuple()):
+                cells.add(c)
+
+        workbook.sheet_references.link_many(self, sheet_names)
+        workbook.dependency_graph.link_many(self, cells)
                 
-    def check_cycles(self, workbook):
+    def in_cycle(self, workbook):
         for cycle in workbook.dependency_graph.get_cycles():
             if self in cycle:
-                raise FormulaError(CellError(CellErrorType.CIRCULAR_REFERENCE, ""))
+                return True
+        return False
+
+    def check_cycles(self, workbook):
+        if self.in_cycle(workbook):
+            raise FormulaError(CellError(CellErrorType.CIRCULAR_REFERENCE, ""))
+
+    def set_runtime_links(self, workbook, cells, sheet_names):
+        '''
+        Replace the runtime links from this cell with links to the given cells
+        and sheet names. Only links that actually change are touched, so the
+        graphs' cycles stay clean when a formula keeps using the same cells.
+        '''
+        for c in self.runtime_cells - cells:
+            workbook.dependency_graph.unlink_runtime(self, c)
+
+        for name in self.runtime_sheets - sheet_names:
+            workbook.sheet_references.unlink_runtime(self, name)
+
+        for c in cells - self.runtime_cells:
+            workbook.dependency_graph.link_runtime(self, c)
+
+        for name in sheet_names - self.runtime_sheets:
+            workbook.sheet_references.link_runtime(self, name)
+
+        self.runtime_cells = cells
+        self.runtime_sheets = sheet_names
 
     def evaluate_formula(self, workbook):
+        if len(self.runtime_cells) > 0 and self.in_cycle(workbook):
+            # one of last evaluation's runtime links may be what closes the
+            # cycle, and it might not be used this time
+            self.set_runtime_links(workbook, set(), set())
+
         self.check_cycles(workbook)
 
-        value = interp.evaluate_formula(workbook, self.sheet, self, self.formula_tree)
+        evaluator = interp.FormulaEvaluator(workbook, self.sheet, self)
+        try:
+            value = evaluator.visit(self.formula_tree)
+        finally:
+            self.set_runtime_links(workbook, evaluator.runtime_cells, evaluator.runtime_sheets)
+
+        if isinstance(value, CellRange):
+            value = Array.from_range(workbook, value)
 
-        if value is None:
-            value = decimal.Decimal(0)
+        array = None
+        if isinstance(value, Array):
+            array = value
+            value = array.values[0]
 
-        if type(value) == decimal.Decimal:
-            value = remove_trailing_zeros(value)
+        self.set_value(result_value(value))
+
+        if array is not None and len(array.values) > 1:
+            self.spill(array)
+        else:
+            self.set_spill_shape(None)
 
-        if type(value) == CellRange:
-            ref = next(value.generate())
-            value = workbook.get_cell(ref).value
+    def set_spill_shape(self, shape):
+        if shape != self.spill_shape:
+            self.clear_spill()
 
+            if shape is None:
+                self.sheet.spill_anchors.discard(self)
+            else:
+                self.sheet.spill_anchors.add(self)
+            self.spill_shape = shape
+
+    def spill(self, array):
+        '''
+        Puts the values of the array this cell's formula evaluated to into the
+        cells of its region, or if any of them has contents or holds part of
+        another array, sets this cell's value to an error.
+        '''
+        self.set_spill_shape((array.cols, array.rows))
+
+        if len(self.spill_cells) == 0:
+            locations = []
+            for row in range(array.rows):
+                for col in range(array.cols):
+                    if (col, row) != (0, 0):
+                        locations.append((self.location.col + col, self.location.row + row))
+
+            if any(col > Reference.MAX_COL or row > Reference.MAX_ROW for col, row in locations):
+                self.set_value(CellError(CellErrorType.BAD_REFERENCE, "array doesn't fit on the sheet"))
+                return
+
+            for location in locations:
+                c = self.sheet.cells.get(location)
+                if c is not None and (not c.is_empty() or c.spilled_from is not None):
+                    self.set_value(CellError(CellErrorType.BAD_REFERENCE, "array is blocked by other cells"))
+                    return
+
+            workbook = self.sheet.workbook
+            for location in locations:
+                c = self.sheet.get_cell(Reference(self.sheet.sheet_name, location[0], location[1]))
+                c.spilled_from = self
+                self.sheet.set_occupied(c, True)
+                workbook.dependency_graph.link(c, self)
+                self.spill_cells.append(c)
+
+            # the new links may close a cycle through this cell's own inputs
+            if self.in_cycle(workbook):
+                error = CellError(CellErrorType.CIRCULAR_REFERENCE, "")
+                self.set_value(error)
+                self.fill_spill(error)
+                return
+
+        for c, value in zip(self.spill_cells, array.values[1:]):
+            c.set_spilled_value(result_value(value))
+
+    def clear_spill(self):
+        '''
+        Empties the cells holding the rest of this cell's array value. The
+        array is spilled again the next time the cell is evaluated.
+        '''
+        workbook = self.sheet.workbook
+        for c in self.spill_cells:
+            c.set_spilled_value(None)
+            c.spilled_from = None
+            self.sheet.set_occupied(c, False)
+            workbook.dependency_graph.clear_forward_links(c)
+        self.spill_cells = []
+
+    def fill_spill(self, value):
+        # A cell on a cycle keeps its array's region, with the error in every
+        # cell of it; clearing the region could break the cycle and have the
+        # array spill back into it on the next update, over and over.
+        for c in self.spill_cells:
+            c.set_spilled_value(value)
+
+    def set_spilled_value(self, value):
+        # the workbook notifies about and updates cells whose spilled values
+        # change, if they aren't being recomputed already
+        workbook = self.sheet.workbook
+        if workbook.check_changed_cells(self.value, value):
+            workbook.spill_changes.setdefault(self, self.value)
+            workbook.scheduler.invalidate_memo()
         self.set_value(value)
 
-    def rename_sheet(self, workbook, old_name, new_name):
+    def clear_links(self, workbook):
+        workbook.sheet_references.clear_forward_links(self)
+        workbook.dependency_graph.clear_forward_links(self)
+        self.runtime_cells = set()
+        self.runtime_sheets = set()
+
+        for sheet in self.watched_sheets:
+            sheet.unwatch_ranges(self)
+        self.watched_sheets = set()
+
+    def formula_changed(self, workbook, evaluate_formulas):
+        # formula_tree was rewritten in place: relink it and mark the text
+        # for reprinting instead of going through set_contents
+        self.contents_stale = True
+        self.clear_links(workbook)
+        self.find_references()
+        self.check_references(workbook)
+
+        if evaluate_formulas:
+            try:
+                self.evaluate_formula(workbook)
+            except FormulaError as e:
+                self.set_value(e.value)
+                self.fill_spill(e.value)
+
+    def own_formula_tree(self):
+        if not self.owns_tree:
+            self.formula_tree = copy.deepcopy(self.formula_tree)
+            self.owns_tree = True
+
+    def rename_sheet(self, old_name, new_name):
+        '''
+        Point this cell's references to old_name at new_name instead. The
+        same cells are referenced afterwards, so the value and dependency
+        links stay as they are; the caller moves the sheet_references links.
+        '''
         if self.formula_tree is None:
             return
-        self.set_contents(workbook, interp.rename_sheet(old_name, new_name, self.formula_tree))
 
-    def move_formula(self, workbook, offset):
+        if old_name.lower() in self.runtime_sheets:
+            self.runtime_sheets = (self.runtime_sheets - {old_name.lower()}) | {new_name.lower()}
+
+        for ref in self.all_refs + self.ranges:
+            if ref.sheet_name is not None and ref.sheet_name.lower() == old_name.lower():
+                break
+        else:
+            # only references this cell's own sheet without naming it
+            return
+
+        self.own_formula_tree()
+        self.formula_tree = interp.rename_sheet(old_name, new_name, self.formula_tree)
+        self.contents_stale = True
+        self.find_references()
+
+    def move_formula(self, workbook, offset, evaluate_formulas = True):
         if self.formula_tree is None:
             return
-        self.set_contents(workbook, interp.move_formula(offset, self.formula_tree))
+        self.own_formula_tree()
+        self.formula_tree = interp.move_formula(offset, self.formula_tree)
+        self.formula_changed(workbook, evaluate_formulas)
 
     def recompute_value(self, workbook):
-        if self.contents is None or self.formula_tree is None:
+        if self.formula_tree is None:
             return
         try:
-            workbook.sheet_references.clear_forward_runtime_links((self.sheet, self))
-            workbook.dependency_graph.clear_forward_runtime_links(self)
-
             self.check_references(workbook)
             self.evaluate_formula(workbook)
         except FormulaError as e:
             self.set_value(e.value)
+            self.fill_spill(e.value)
 
-    def copy_cell(self, other_cell, workbook, offset: Tuple[int, int]):
-        workbook.sheet_references.clear_forward_links((self.sheet, self))
-        workbook.dependency_graph.clear_forward_links(self)
+    def share_cell(self, other_cell):
+        '''
+        Make this (new, unlinked) cell a copy of other_cell at the same
+        location on another sheet. The parsed formula and its references are
+        shared rather than copied, since references to the cell's own sheet
+        are stored without a sheet name; whichever cell rewrites the tree
+        first takes its own copy. The caller links the cell.
+        '''
+        self.set_contents_text(other_cell._contents, other_cell.contents_stale)
+        self.set_value(other_cell.value)
+
+        if other_cell.formula_tree is None:
+            return
+
+        self.formula_tree = other_cell.formula_tree
+        self.static_refs = other_cell.static_refs
+        self.all_refs = other_cell.all_refs
+        self.ranges = other_cell.ranges
+
+        self.owns_tree = False
+        other_cell.owns_tree = False
 
-        self.contents = other_cell.contents
-        self.formula_tree = copy.deepcopy(other_cell.formula_tree)
-        self.value = other_cell.value
+    def take_cell(self, other_cell, workbook, offset: Tuple[int, int]):
+        '''
+        Give this empty cell the contents and value of other_cell (usually a
+        snapshot of a cell being moved or copied), moving the formula's
+        relative references by offset. The tree is rewritten in place unless
+        other_cell doesn't own it. The value is not recomputed.
+        '''
+        self.set_contents_text(other_cell._contents, other_cell.contents_stale)
+        self.set_value(other_cell.value)
+
+        if other_cell.formula_tree is None:
+            return
 
-        if self.formula_tree is not None:
-            self.contents = interp.move_formula(offset, self.formula_tree)
+        self.formula_tree = other_cell.formula_tree
+        self.owns_tree = other_cell.owns_tree
+        self.static_refs = other_cell.static_refs
+        self.all_refs = other_cell.all_refs
+        self.ranges = other_cell.ranges
+
+        if offset != (0, 0):
+            self.move_formula(workbook, offset, False)
+        else:
             self.check_references(workbook)
 
     def set_contents(self, workbook, contents: str, evaluate_formulas = True):
-        workbook.sheet_references.clear_forward_links((self.sheet, self))
-        workbook.dependency_graph.clear_forward_links(self)
+        self.clear_links(workbook)
+        self.set_spill_shape(None)
         self.formula_tree = None
+        self.owns_tree = True
 
         if is_empty_content_string(contents):
             self.contents = None
@@ -141,18 +448,5 @@ class Cell:
                     self.evaluate_formula(workbook)
             except FormulaError as e:
                 self.set_value(e.value)
-        elif contents[0] == "'":
-            self.set_value(contents[1:])
-        elif contents.lower() == "true":
-            self.set_value(True)
-        elif contents.lower() == "false":
-            self.set_value(False)
-        elif CellError.from_string(contents) is not None:
-            self.set_value(CellError(CellError.from_string(contents), ""))
         else:
-            try:
-                self.set_value(remove_trailing_zeros(decimal.Decimal(contents)))
-                if not self.value.is_finite():
-                    self.set_value(contents)
-            except decimal.InvalidOperation:
-                self.set_value(contents)
+            self.set_value(contents_value(contents))
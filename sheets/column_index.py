@@ -0,0 +1,114 @@
+import bisect
+
+from . import base_types
+
+from .reference import Reference
+
+class ColumnIndex:
+    '''
+    Index of the values in one column of a sheet, so the rows holding a
+    given value, or a range of values, can be found without visiting every
+    cell. Values are compared by base_types.sort_key, so strings match
+    case-insensitively. Empty cells (value None) aren't indexed.
+
+        Attributes:
+            rows    - the rows with a value, in order
+            equal   - maps the key of each value to the rows holding it, in
+                      order
+            ordered - (key, row) pairs for every indexed row, in order
+            keys    - maps each indexed row to its key
+    '''
+
+    def __init__(self):
+        self.rows = []
+        self.equal = {}
+        self.ordered = []
+        self.keys = {}
+
+    def add(self, row, value):
+        key = base_types.sort_key(value)
+        bisect.insort(self.rows, row)
+        bisect.insort(self.equal.setdefault(key, []), row)
+        bisect.insort(self.ordered, (key, row))
+        self.keys[row] = key
+
+    def remove(self, row, value):
+        key = base_types.sort_key(value)
+        self.rows.pop(bisect.bisect_left(self.rows, row))
+
+        rows = self.equal[key]
+        rows.pop(bisect.bisect_left(rows, row))
+        if len(rows) == 0:
+            self.equal.pop(key)
+
+        self.ordered.pop(bisect.bisect_left(self.ordered, (key, row)))
+        del self.keys[row]
+
+    def update(self, row, old_value, new_value):
+        if old_value is not None and new_value is not None \
+                and base_types.sort_key(old_value) == base_types.sort_key(new_value):
+            return
+
+        if old_value is not None:
+            self.remove(row, old_value)
+        if new_value is not None:
+            self.add(row, new_value)
+
+    @staticmethod
+    def rows_in(rows, first, last):
+        # the part of a sorted list of rows between first and last inclusive
+        return rows[bisect.bisect_left(rows, first):bisect.bisect_right(rows, last)]
+
+    def rows_with_value(self, first, last):
+        return ColumnIndex.rows_in(self.rows, first, last)
+
+    def rows_with_key(self, key, first, last):
+        return ColumnIndex.rows_in(self.equal.get(key, []), first, last)
+
+    def rows_between(self, low, high, first, last):
+        '''
+        Returns the rows between first and last whose keys are between low
+        and high, in order. low and high are (key, inclusive) pairs and must
+        have the same type rank. Takes time in proportion to the number of
+        rows with such keys in the whole column or the number of indexed
+        rows between first and last, whichever is smaller.
+        '''
+        (low_key, low_inclusive), (high_key, high_inclusive) = low, high
+
+        # rows are at least 1 and at most Reference.MAX_ROW, so these sort
+        # just before or just after every pair with the same key
+        start = bisect.bisect_left(self.ordered, (low_key, 0 if low_inclusive else Reference.MAX_ROW + 1))
+        end = bisect.bisect_left(self.ordered, (high_key, Reference.MAX_ROW + 1 if high_inclusive else 0))
+
+        first_row = bisect.bisect_left(self.rows, first)
+        last_row = bisect.bisect_right(self.rows, last)
+
+        if last_row - first_row < end - start:
+            # fewer rows in the range than keys to look through
+            def between(key):
+                return (low_key < key or (low_inclusive and key == low_key)) \
+                    and (key < high_key or (high_inclusive and key == high_key))
+            return [row for row in self.rows[first_row:last_row] if between(self.keys[row])]
+
+        return sorted(row for _key, row in self.ordered[start:end] if first <= row <= last)
+
+    def closest_key(self, key, first, last, below: bool):
+        '''
+        Returns the largest key less than the given one (or with below False,
+        the smallest key greater than it) that has the same type rank and is
+        held by a row between first and last, or None if there isn't one.
+        '''
+        if below:
+            i = bisect.bisect_left(self.ordered, (key, 0)) - 1
+            step = -1
+        else:
+            i = bisect.bisect_left(self.ordered, (key, Reference.MAX_ROW + 1))
+            step = 1
+
+        while 0 <= i < len(self.ordered) and self.ordered[i][0][0] == key[0]:
+            other, row = self.ordered[i]
+            if first <= row <= last:
+                return other
+            i += step
+
+        return None
@@ -0,0 +1,290 @@
+import decimal
+import os
+import re
+
+from typing import Any, Dict, Sequence, Tuple
+
+import lark
+
+from . import batch
+from . import functions
+from . import operators
+
+from .error import CellError, CellErrorType
+from .range import CellRange
+from .reference import Reference
+
+# Compiling a workbook turns the formulas that lead from some input cells to
+# some output cells into a standalone Python module, with one function that
+# takes the inputs' contents and returns the outputs' values. The module
+# only needs the standard library: it starts with the source of the parts
+# of this package that give values their meaning (error.py, base_types.py,
+# operators.py and value_functions.py), and then computes each formula
+# cell in dependency order, one statement per cell. Cells that don't
+# depend on the inputs, and parts of formulas that don't, are replaced by
+# their values.
+
+RUNTIME_MODULES = ["error.py", "base_types.py", "operators.py", "value_functions.py"]
+
+# functions that compiled modules can call; VERSION is replaced by its
+# value
+COMPILED_FUNCTIONS = {"and", "or", "not", "xor", "exact", "if", "iferror", "choose",
+                      "isblank", "iserror", "min", "max", "sum", "average", "version"}
+
+# functions whose range arguments are given as lists of values
+RANGE_FUNCTIONS = {"min", "max", "sum", "average"}
+
+def runtime_source() -> str:
+    # the package's own imports are left out, since everything ends up in
+    # the one module
+    directory = os.path.dirname(__file__)
+    parts = []
+    for name in RUNTIME_MODULES:
+        with open(os.path.join(directory, name)) as f:
+            lines = [line for line in f.read().splitlines() if not line.startswith("from .")]
+        parts.append(f"# ---- {name}\n\n" + "\n".join(lines).strip() + "\n")
+    return "\n\n".join(parts)
+
+def literal(value) -> str:
+    '''
+    Returns Python source for a cell value, for modules that have the
+    runtime's names in scope.
+    '''
+    if isinstance(value, decimal.Decimal):
+        return f"decimal.Decimal({str(value)!r})"
+    elif isinstance(value, CellError) or hasattr(value, "get_type"):
+        # details can be str subclasses, like the parser's tokens
+        return f"CellError(CellErrorType.{value.get_type().name}, {str(value.get_detail())!r})"
+    return repr(value)
+
+def identifier(name: str, taken) -> str:
+    name = re.sub(r"\W", "_", name.lower())
+    if name[0].isdigit():
+        name = "_" + name
+
+    unique = name
+    i = 1
+    while unique in taken:
+        i += 1
+        unique = f"{name}_{i}"
+    taken.add(unique)
+    return unique
+
+class ExpressionCompiler(lark.visitors.Interpreter):
+    '''
+    Compiles a formula from the given cell into a Python expression. Each
+    visit returns the expression's source and whether it is constant;
+    constant expressions are evaluated in runtime (the namespace the
+    runtime's source was run in) and replaced by their values.
+
+    names maps the input cells and the compiled formula cells to the names
+    of the variables holding their values. Raises ValueError for formulas
+    that can't be compiled.
+    '''
+
+    def __init__(self, workbook, cell, names: Dict[Any, str], stand_ins, runtime):
+        self.workbook = workbook
+        self.c = cell
+        self.names = names
+        self.stand_ins = stand_ins
+        self.runtime = runtime
+
+    def fold(self, source: str, constant: bool):
+        if constant:
+            return literal(eval(source, self.runtime)), True
+        return source, False
+
+    def call(self, f: str, children):
+        # f applied to a list of the children's values
+        compiled = [self.visit(child) if isinstance(child, lark.Tree) else (repr(str(child)), True)
+                    for child in children]
+        source = f"{f}([{', '.join(code for code, _ in compiled)}])"
+        return self.fold(source, all(constant for _, constant in compiled))
+
+    def cell_value(self, c):
+        if c in self.names:
+            return self.names[c], False
+        return literal(c.value), True
+
+    def cell(self, tree):
+        location = str(tree.children[0])
+        try:
+            ref = Reference.from_string(self.c.sheet.sheet_name, location).check_bounds()
+            return self.cell_value(batch.find_cell(self.workbook, self.c.sheet.sheet_name, ref, self.stand_ins))
+        except (ValueError, KeyError):
+            return literal(CellError(CellErrorType.BAD_REFERENCE, location)), True
+
+    def cell_range(self, tree):
+        raise ValueError("ranges can only be compiled as arguments of MIN, MAX, SUM and AVERAGE")
+
+    def range_values(self, tree):
+        # a list of the values of the range's non-empty cells, with the input
+        # cells in it counted as non-empty
+        try:
+            start = str(tree.children[0].children[0])
+            end = str(tree.children[1].children[0])
+            r = CellRange(self.c.sheet.sheet_name, start, end).check_sheet(self.workbook)
+        except (ValueError, KeyError):
+            return literal(CellError(CellErrorType.BAD_REFERENCE, f"{tree.children[0]}:{tree.children[1]}")), True
+
+        sheet = self.workbook.sheet_map[r.sheet_name.lower()]
+        cells = dict(sheet.get_cells_in_region(r.start_ref.tuple(), r.end_ref.tuple()))
+        for c in self.names:
+            if batch.in_range(c, sheet.sheet_name.lower(), r):
+                cells[c.location.tuple()] = c
+
+        compiled = [self.cell_value(cells[location]) for location in sorted(cells, key=lambda location: (location[1], location[0]))]
+        source = f"[{', '.join(code for code, _ in compiled)}]"
+        return source, all(constant for _, constant in compiled)
+
+    def cmp_expr(self, tree):
+        return self.call("cmp_values", tree.children)
+
+    def add_expr(self, tree):
+        return self.call("add_values", tree.children)
+
+    def mul_expr(self, tree):
+        return self.call("mul_values", tree.children)
+
+    def unary_op(self, tree):
+        return self.call("unary_values", tree.children)
+
+    def concat_expr(self, tree):
+        return self.call("concat_values", tree.children)
+
+    def parens(self, tree):
+        return self.visit(tree.children[0])
+
+    def number(self, tree):
+        return literal(operators.remove_trailing_zeros(decimal.Decimal(str(tree.children[0])))), True
+
+    def string(self, tree):
+        return repr(str(tree.children[0])[1:-1]), True
+
+    def boolean(self, tree):
+        return repr(str(tree.children[0]).lower() == "true"), True
+
+    def error(self, tree):
+        return literal(CellError(CellError.from_string(str(tree.children[0])), "")), True
+
+    def folded(self, tree):
+        return literal(tree.children[1]), True
+
+    def pruned(self, tree):
+        return self.visit(tree.children[0].children[tree.children[1]])
+
+    def func_expr(self, tree):
+        name = str(tree.children[0]).lower()
+
+        if name not in functions.functions:
+            return literal(CellError(CellErrorType.BAD_NAME, f"unrecognized function {tree.children[0]}")), True
+
+        if name not in COMPILED_FUNCTIONS:
+            raise ValueError(f"{name.upper()} can't be compiled")
+
+        if name == "version":
+            return literal(functions.func_version(None, tree.children[1:])), True
+
+        compiled = []
+        for child in tree.children[1:]:
+            if name in RANGE_FUNCTIONS and isinstance(child, lark.Tree) and child.data == "cell_range":
+                compiled.append(self.range_values(child))
+            else:
+                compiled.append(self.visit(child))
+
+        source = f"func_{name}([{', '.join(code for code, _ in compiled)}])"
+        return self.fold(source, all(constant for _, constant in compiled))
+
+def compile_workbook(workbook,
+                     inputs: Sequence[Tuple[str, str]],
+                     outputs: Sequence[Tuple[str, str]],
+                     function_name: str = "evaluate") -> str:
+    '''
+    Returns the source of a standalone Python module with a function that
+    takes the contents of the input cells, as strings (or None for empty
+    cells), and returns a list of the values the output cells would have in
+    the workbook with those contents. inputs and outputs are (sheet name,
+    location) pairs; the function's parameters are named after the inputs.
+
+    Raises KeyError for a missing sheet and ValueError for a bad location,
+    and for formulas between the inputs and outputs that use INDIRECT,
+    lookups, criteria functions, ranges other than as arguments of MIN, MAX,
+    SUM and AVERAGE, that are on a cycle, or that read cells an array
+    spilled into.
+    '''
+    stand_ins = {}
+
+    def find(sheet_name, location):
+        ref = Reference.from_string(sheet_name, location).check_bounds()
+        return batch.find_cell(workbook, sheet_name, ref, stand_ins)
+
+    input_cells = [find(sheet_name, location) for sheet_name, location in inputs]
+    output_cells = [find(sheet_name, location) for sheet_name, location in outputs]
+
+    nodes, reads = batch.batch_nodes(workbook, input_cells, stand_ins)
+    order = batch.order_nodes(nodes, reads)
+    if len(order) < len(nodes):
+        raise ValueError("can't compile cells on a cycle")
+
+    # only the cells that some output depends on
+    needed = set()
+    queue = [c for c in output_cells if c in nodes]
+    while len(queue) > 0:
+        c = queue.pop()
+        if c not in needed:
+            needed.add(c)
+            queue.extend(reads[c])
+
+    taken = set()
+    names = {}
+    params = []
+    for c, (sheet_name, location) in zip(input_cells, inputs):
+        if c not in names:
+            names[c] = identifier(f"{c.sheet.sheet_name}_{location}", taken)
+        params.append(names[c])
+
+    source = runtime_source()
+    runtime = {}
+    exec(source, runtime)
+
+    body = []
+    for name in params:
+        body.append(f"    {name} = input_value({name})")
+
+    for c in order:
+        if c not in needed or c in names:
+            continue
+
+        if c.formula_tree is None:
+            raise ValueError("can't compile cells that hold part of an array")
+
+        compiler = ExpressionCompiler(workbook, c, names, stand_ins, runtime)
+        expression, _ = compiler.visit(c.formula_tree)
+        names[c] = identifier(f"{c.sheet.sheet_name}_{c.location.location_string()}", taken)
+        contents = " ".join(c.contents.split())
+        body.append(f"    # {c.sheet.sheet_name}!{c.location.location_string().upper()}: {contents}")
+        body.append(f"    {names[c]} = result_value({expression})")
+
+    results = [names[c] if c in names else literal(c.value) for c in output_cells]
+    body.append(f"    return [{', '.join(results)}]")
+
+    return "\n".join([
+        f"# Generated from workbook {workbook.workbook_name!r} by sheets.compiler.",
+        "",
+        source,
+        "",
+        "# ---- compiled formulas",
+        "",
+        "def input_value(contents):",
+        "    # an input cell's value, from its contents as set_cell_contents takes them",
+        "    if contents is None or contents.strip() == '':",
+        "        return None",
+        "    contents = contents.strip()",
+        "    if contents[0] == '=':",
+        "        raise ValueError('input cells can\\'t hold formulas')",
+        "    return contents_value(contents)",
+        "",
+        f"def {function_name}({', '.join(params)}) -> List[Any]:",
+        *body,
+        "",
+    ])
@@ -0,0 +1,122 @@
+import decimal
+import re
+
+from . import base_types
+
+from .error import CellError
+
+# longest first, so "<=" isn't read as "<"
+OPERATORS = ["<=", ">=", "<>", "<", ">", "="]
+
+def parse_operand(text: str):
+    # the part of a criterion string after its operator, read the way cell
+    # contents are
+    if text == "":
+        return None
+    elif text.lower() == "true":
+        return True
+    elif text.lower() == "false":
+        return False
+    elif CellError.from_string(text) is not None:
+        return CellError(CellError.from_string(text), "")
+
+    try:
+        number = decimal.Decimal(text)
+        if number.is_finite():
+            return number
+    except decimal.InvalidOperation:
+        pass
+
+    return text
+
+def wildcard_pattern(text: str):
+    # * matches any run of characters and ? any one character; ~ makes the
+    # character after it literal
+    pattern = ""
+    escaped = False
+    for ch in text:
+        if escaped:
+            pattern += re.escape(ch)
+            escaped = False
+        elif ch == "~":
+            escaped = True
+        elif ch == "*":
+            pattern += ".*"
+        elif ch == "?":
+            pattern += "."
+        else:
+            pattern += re.escape(ch)
+    return re.compile(pattern, re.DOTALL)
+
+class Criterion:
+    '''
+    A condition from a criteria argument of SUMIF, COUNTIFS and the like.
+
+    A string may start with one of the operators =, <>, <, <=, > or >=, and
+    the rest of it is read as a number, boolean or error if it parses as
+    one and as a string otherwise. Without an operator the criterion tests
+    for equality. Strings are compared case-insensitively, and only against
+    strings; when testing for (in)equality they may use the wildcards * and
+    ?. An empty operand tests for empty cells, and an empty criteria cell
+    is treated as 0.
+
+        Attributes:
+            negated - True if find_rows returns the rows that don't match,
+                      which is the case for <> and for tests for empty cells
+    '''
+
+    def __init__(self, value):
+        self.op = "="
+        self.operand = value
+        self.pattern = None
+
+        if value is None:
+            self.operand = decimal.Decimal(0)
+        elif isinstance(value, str):
+            for op in OPERATORS:
+                if value.startswith(op):
+                    self.op = op
+                    value = value[len(op):]
+                    break
+
+            self.operand = parse_operand(value)
+
+            if isinstance(self.operand, str) and self.op in ("=", "<>") \
+                    and any(ch in self.operand for ch in "*?~"):
+                self.pattern = wildcard_pattern(self.operand.lower())
+
+        if self.operand is None:
+            # "=" matches the rows without a value and "<>" the rows with one
+            self.negated = self.op == "="
+        else:
+            self.negated = self.op == "<>"
+
+    def find_rows(self, index, first: int, last: int):
+        '''
+        Returns the rows between first and last that match (or with negated,
+        that don't match) the criterion, using the given ColumnIndex.
+        '''
+        if self.operand is None:
+            if self.op in ("=", "<>"):
+                return index.rows_with_value(first, last)
+            return []
+
+        if self.pattern is not None:
+            rows = []
+            for key in index.equal:
+                if key[0] == base_types.TYPE_RANKS[str] and self.pattern.fullmatch(key[1]):
+                    rows += index.rows_with_key(key, first, last)
+            return sorted(rows)
+
+        key = base_types.sort_key(self.operand)
+
+        if self.op in ("=", "<>"):
+            return index.rows_with_key(key, first, last)
+
+        # tuples sort before every longer tuple they start, so (rank,) and
+        # (rank + 1,) bound all of the keys of the operand's type
+        rank = key[0]
+        if self.op[0] == "<":
+            return index.rows_between(((rank,), True), (key, self.op == "<="), first, last)
+        else:
+            return index.rows_between((key, self.op == ">="), ((rank + 1,), False), first, last)
@@ -7,18 +7,25 @@ from . import error
 from . import interp
 from . import reference
 from . import base_types
+from . import value_functions
 
+from .array import Array
+from .column_index import ColumnIndex
+from .criteria import Criterion, wildcard_pattern
 from .range import CellRange
 
 def link_subtree(evaluator, subtree):
-    finder = interp.CellRefFinder(evaluator.sheet.sheet_name)
-    finder.visit(subtree)
-
-    for ref in finder.refs:
-        cell = evaluator.workbook.get_cell(ref)
-
-        evaluator.workbook.dependency_graph.link_runtime(evaluator.c, cell)
-        evaluator.workbook.sheet_references.link_runtime(evaluator.c, ref.sheet_name or evaluator.sheet.sheet_name)
+    # the references of lazy arguments are found when the formula is parsed
+    refs = getattr(subtree, "refs", None)
+    if refs is None:
+        _static_refs, refs, _ranges = interp.find_refs(subtree)
+
+    for ref in refs:
+        try:
+            evaluator.link_runtime(ref.check_bounds())
+        except (KeyError, ValueError):
+            # evaluating the branch will report the bad reference
+            pass
 
     evaluator.c.check_cycles(evaluator.workbook)
 
@@ -32,201 +39,62 @@ def func_version(_evaluator, args):
 
     return sheets.version
 
-def func_and(_evaluator, args):
-    if len(args) < 1:
-        return sheets.CellError(sheets.CellErrorType.TYPE_ERROR, "AND requires at least 1 argument")
-
-    result = True
-
-    errors = []
-    for a in args:
-        if type(a) == CellRange:
-            return error.CellError(error.CellErrorType.TYPE_ERROR, "Unhandled argument cell range")
-
-        b = base_types.to_bool(a)
-
-        if isinstance(b, sheets.CellError) and b not in errors:
-            errors.append(b)
+def range_error(args):
+    # the functions that only take values give this for ranges
+    if any(type(a) == CellRange for a in args):
+        return error.CellError(error.CellErrorType.TYPE_ERROR, "Unhandled argument cell range")
+    return None
 
-        if not b:
-            result = False
-            
-    if len(errors) > 0:
-        return error.propagate_errors(errors)
-    else:
-        return result
+def func_and(_evaluator, args):
+    return range_error(args) or value_functions.func_and(args)
 
 def func_or(_evaluator, args):
-    if len(args) < 1:
-        return sheets.CellError(sheets.CellErrorType.TYPE_ERROR, "OR requires at least 1 argument")
-
-    result = False
-
-    errors = []
-    for a in args:
-        if type(a) == CellRange:
-            return error.CellError(error.CellErrorType.TYPE_ERROR, "Unhandled argument cell range")
-
-        b = base_types.to_bool(a)
-
-        if isinstance(b, sheets.CellError) and b not in errors:
-            errors.append(b)
+    return range_error(args) or value_functions.func_or(args)
 
-        if b:
-            result = True
-            
-    if len(errors) > 0:
-        return error.propagate_errors(errors)
-    else:
-        return result
-    
 def func_not(_evaluator, args):
     if len(args) != 1:
-        return sheets.CellError(sheets.CellErrorType.TYPE_ERROR, "NOT requires exactly 1 argument")
-    
-    if type(args[0]) == CellRange:
-            return error.CellError(error.CellErrorType.TYPE_ERROR, "Unhandled argument cell range")
-    
-    b = base_types.to_bool(args[0])
-
-    if isinstance(b, sheets.CellError):
-        return b
-    else:
-        return not b
+        return value_functions.func_not(args)
+    return range_error(args) or value_functions.func_not(args)
 
 def func_xor(_evaluator, args):
-    if len(args) < 1:
-        return sheets.CellError(sheets.CellErrorType.TYPE_ERROR, "XOR requires at least 1 argument")
-     
-    count_true = 0
-    errors = []
-    for a in args:
-        if type(a) == CellRange:
-            return error.CellError(error.CellErrorType.TYPE_ERROR, "Unhandled argument cell range")
-
-        b = base_types.to_bool(a)
-        
-        if isinstance(b, sheets.CellError) and b not in errors:
-            errors.append(b)
-        
-        if b:
-            count_true += 1
-    
-    if len(errors) > 0:
-        return error.propagate_errors(errors) 
-    else:
-        return (not count_true % 2 == 0)
+    return range_error(args) or value_functions.func_xor(args)
 
 def func_exact(_evaluator, args):
-    if len(args) != 2:
-        return sheets.CellError(sheets.CellErrorType.TYPE_ERROR, "EXACT requires exactly 2 argument")
-    
-    if isinstance(args[0], sheets.CellError) or isinstance(args[1], sheets.CellError):
-        errors = [args[0], args[1]]
-        return error.propagate_errors(errors) 
-    
-    if type(args[0]) == CellRange or type(args[1]) == CellRange:
-            return error.CellError(error.CellErrorType.TYPE_ERROR, "Unhandled argument cell range")
-    
-    return (base_types.to_string(args[0]) == base_types.to_string(args[1]))
+    if len(args) != 2 or any(isinstance(a, sheets.CellError) for a in args):
+        return value_functions.func_exact(args)
+    return range_error(args) or value_functions.func_exact(args)
+
+def lazy_arguments(evaluator, args):
+    # A function giving the values of the arguments of IF, IFERROR and
+    # CHOOSE by index. The first is always evaluated, so it's linked like any
+    # other argument; the others are linked at runtime.
+    def get(i):
+        if i > 0:
+            link_subtree(evaluator, args[i])
+        return evaluator.visit(args[i])
+    return get
 
 def func_if(evaluator, args):
     # lazy!!!
-    if len(args) < 2 or len(args) > 3:
-        return sheets.CellError(sheets.CellErrorType.TYPE_ERROR, "IF requires exactly 2 or 3 arguments")
-    
-    b = base_types.to_bool(evaluator.visit(args[0]))
-
-    if isinstance(b, sheets.CellError):
-        return b
-        
-    if b:
-        branch = args[1]
-    elif len(args) == 3:
-        branch = args[2]
-    elif len(args) == 2:
-        return False
-
-    link_subtree(evaluator, branch)
-
-    return evaluator.visit(branch)
+    return value_functions.pick_if(len(args), lazy_arguments(evaluator, args))
 
 def func_iferror(evaluator, args):
     # lazy!!!
-    if len(args) < 1 or len(args) > 2:
-        return sheets.CellError(sheets.CellErrorType.TYPE_ERROR, "IFERROR requires exactly 1 or 2 arguments")
-
-    first = evaluator.visit(args[0])
-
-    if not isinstance(first, sheets.CellError):
-        return first
-    elif len(args) == 2:
-        link_subtree(evaluator, args[1])
-        return evaluator.visit(args[1])
-    else:
-        return ""
+    return value_functions.pick_iferror(len(args), lazy_arguments(evaluator, args))
 
 def func_choose(evaluator, args):
     # lazy!!!
-    if len(args) < 2:
-        return sheets.CellError(sheets.CellErrorType.TYPE_ERROR, "CHOOSE requires at least 2 arguments")
-    
-    try:
-
-        index_org = evaluator.visit(args[0])
-
-        # Check if error
-        if isinstance(index_org, sheets.CellError):
-            return index_org
-
-        # Check if bool in string format
-        if isinstance(index_org, str):
-            if index_org.lower() == "true":
-                index_org = 1
-            elif index_org.lower() == "false":
-                index_org = 0
+    return value_functions.pick_choose(len(args), lazy_arguments(evaluator, args))
 
-        # Check if number is integer
-        index = int(index_org)          
-        index_aux = float(index_org)             
-        if abs(index_aux - index) > 0:
-            raise TypeError
-        
-        if index <= 0 or index >= len(args):
-            return sheets.CellError(sheets.CellErrorType.TYPE_ERROR, "index is out of bounds")
-
-        link_subtree(evaluator, args[index])
-
-        return evaluator.visit(args[index])
-    
-    except (TypeError, ValueError):
-        return sheets.CellError(sheets.CellErrorType.TYPE_ERROR, "index is not an integer")
-        
 def func_isblank(_evaluator, args):
-    if len(args) != 1:
-        return sheets.CellError(sheets.CellErrorType.TYPE_ERROR, "ISBLANK requires exactly 1 argument")
-    
-    # Follow Piazza post regarding how to deal with errors
-    # https://piazza.com/class/lqvau3tih6k26o/post/43
-    if isinstance(args[0], sheets.CellError):
-        if args[0].get_type() in [sheets.CellErrorType.PARSE_ERROR, sheets.CellErrorType.CIRCULAR_REFERENCE]:
-            return args[0]
-        else:
-            return False
-        
-    if type(args[0]) == CellRange:
-            return error.CellError(error.CellErrorType.TYPE_ERROR, "Unhandled argument cell range")
-    
-    return (args[0] is None)
+    if len(args) != 1 or isinstance(args[0], sheets.CellError):
+        return value_functions.func_isblank(args)
+    return range_error(args) or value_functions.func_isblank(args)
 
 def func_iserror(_evaluator, args):
     if len(args) != 1:
-        return sheets.CellError(sheets.CellErrorType.TYPE_ERROR, "ISERROR requires exactly 1 argument")
-    
-    if type(args[0]) == CellRange:
-            return error.CellError(error.CellErrorType.TYPE_ERROR, "Unhandled argument cell range")
-    
-    return (isinstance(args[0], sheets.CellError))
+        return value_functions.func_iserror(args)
+    return range_error(args) or value_functions.func_iserror(args)
 
 def func_indirect(evaluator, args):
     if len(args) != 1:
@@ -235,25 +103,22 @@ def func_indirect(evaluator, args):
     try:
         r = CellRange.from_string(evaluator.sheet.sheet_name, str(args[0]).lower())
 
-        for ref in r.generate():
-            evaluator.workbook.sheet_references.link_runtime(evaluator.c, ref.sheet_name or evaluator.sheet.sheet_name)
-            cell = evaluator.workbook.get_cell(ref)
-            evaluator.workbook.dependency_graph.link_runtime(evaluator.c, cell)
+        if r.is_whole():
+            evaluator.link_runtime_range(r)
+        else:
+            for ref in r.generate():
+                evaluator.link_runtime(ref)
 
         evaluator.c.check_cycles(evaluator.workbook)
 
-        return r
+        return r.clip(evaluator.workbook)
     except (KeyError, ValueError):
         pass
 
     try:
         ref = reference.Reference.from_string(evaluator.sheet.sheet_name, str(args[0]).lower())
 
-        evaluator.workbook.sheet_references.link_runtime(evaluator.c, ref.sheet_name or evaluator.sheet.sheet_name)
-
-        cell = evaluator.workbook.get_cell(ref)
-
-        evaluator.workbook.dependency_graph.link_runtime(evaluator.c, cell)
+        cell = evaluator.link_runtime(ref)
         evaluator.c.check_cycles(evaluator.workbook)
 
         # If the argument can be parsed as a cell reference, but is invalid due to an error
@@ -266,50 +131,30 @@ def func_indirect(evaluator, args):
     except (KeyError, ValueError):
         return sheets.CellError(sheets.CellErrorType.BAD_REFERENCE, args[0])
 
-def numeric_function(evaluator, args, f):
-    if len(args) < 1:
-        return sheets.CellError(sheets.CellErrorType.TYPE_ERROR, f"{f.__name__} requires at least 1 argument")
-
-    numbers = []
-
+def value_lists(evaluator, args):
+    # ranges and arrays as lists of values, as value_functions takes them
+    values = []
     for arg in args:
         if type(arg) == CellRange:
-            numbers += list(arg.generate_values(evaluator.workbook))
+            # empty cells are skipped anyway
+            values.append([c.value for c in arg.generate_populated(evaluator.workbook)])
+        elif isinstance(arg, Array):
+            values.append(list(arg.values))
         else:
-            numbers.append(base_types.to_number(arg))
-    
-    numbers = list(map(lambda i: base_types.to_number(i), filter(lambda i: i is not None, numbers)))
-
-    e = error.propagate_errors(numbers)
-
-    if e is not None:
-        return e
-
-    return f(numbers)
+            values.append(arg)
+    return values
 
 def func_min(evaluator, args):
-    def custom_min(nums):
-        if len(nums) == 0:
-            return decimal.Decimal(0)
-        return min(nums)
-    return numeric_function(evaluator, args, custom_min)
+    return value_functions.func_min(value_lists(evaluator, args))
 
 def func_max(evaluator, args):
-    def custom_max(nums):
-        if len(nums) == 0:
-            return decimal.Decimal(0)
-        return max(nums)
-    return numeric_function(evaluator, args, custom_max)
+    return value_functions.func_max(value_lists(evaluator, args))
 
 def func_sum(evaluator, args):
-    return numeric_function(evaluator, args, sum)
+    return value_functions.func_sum(value_lists(evaluator, args))
 
 def func_average(evaluator, args):
-    def average(nums):
-        if len(nums) == 0:
-            return error.CellError(error.CellErrorType.DIVIDE_BY_ZERO, "")
-        return sum(nums)/len(nums)
-    return numeric_function(evaluator, args, average)
+    return value_functions.func_average(value_lists(evaluator, args))
 
 def func_vlookup(evaluator, args):
     if len(args) != 3:
@@ -337,15 +182,11 @@ def func_vlookup(evaluator, args):
     target_values = []
 
     for ref in region.generate_column(0):
-        cell = evaluator.workbook.get_cell(ref)
-        evaluator.workbook.dependency_graph.link_runtime(evaluator.c, cell)
-        evaluator.workbook.sheet_references.link_runtime(evaluator.c, ref.sheet_name or evaluator.sheet.sheet_name)
+        cell = evaluator.link_runtime(ref)
         search_values.append(cell.value)
 
     for ref in region.generate_column(index-1):
-        cell = evaluator.workbook.get_cell(ref)
-        evaluator.workbook.dependency_graph.link_runtime(evaluator.c, cell)
-        evaluator.workbook.sheet_references.link_runtime(evaluator.c, ref.sheet_name or evaluator.sheet.sheet_name)
+        cell = evaluator.link_runtime(ref)
         target_values.append(cell.value)
 
     evaluator.c.check_cycles(evaluator.workbook)
@@ -382,15 +223,11 @@ def func_hlookup(evaluator, args):
     target_values = []
 
     for ref in region.generate_row(0):
-        cell = evaluator.workbook.get_cell(ref)
-        evaluator.workbook.dependency_graph.link_runtime(evaluator.c, cell)
-        evaluator.workbook.sheet_references.link_runtime(evaluator.c, ref.sheet_name or evaluator.sheet.sheet_name)
+        cell = evaluator.link_runtime(ref)
         search_values.append(cell.value)
 
     for ref in region.generate_row(index-1):
-        cell = evaluator.workbook.get_cell(ref)
-        evaluator.workbook.dependency_graph.link_runtime(evaluator.c, cell)
-        evaluator.workbook.sheet_references.link_runtime(evaluator.c, ref.sheet_name or evaluator.sheet.sheet_name)
+        cell = evaluator.link_runtime(ref)
         target_values.append(cell.value)
 
     evaluator.c.check_cycles(evaluator.workbook)
@@ -401,23 +238,443 @@ def func_hlookup(evaluator, args):
 
     return error.CellError(error.CellErrorType.TYPE_ERROR, "")
 
+def match_criteria(evaluator, pairs):
+    '''
+    Finds the cells matching every (range, criteria value) pair, with each
+    criterion looked up in the searched columns' indexes. Returns (offsets,
+    negated): the (col, row) offsets from the ranges' top left corners of
+    the matching cells or, if negated is True, of the cells that don't
+    match.
+    '''
+    matched = []
+    excluded = set()
+
+    for cell_range, value in pairs:
+        criterion = Criterion(value)
+        sheet = evaluator.workbook.sheet_map[cell_range.sheet_name.lower()]
+        start, end = cell_range.start_ref, cell_range.end_ref
+
+        offsets = set()
+        for col in range(start.col, end.col + 1):
+            for row in criterion.find_rows(sheet.get_column_index(col), start.row, end.row):
+                offsets.add((col - start.col, row - start.row))
+
+        if criterion.negated:
+            excluded |= offsets
+        else:
+            matched.append(offsets)
+
+    if len(matched) == 0:
+        return excluded, True
+
+    # intersect starting from the fewest matches
+    matched.sort(key=len)
+    return matched[0].intersection(*matched[1:]) - excluded, False
+
+def range_shape(cell_range):
+    return (cell_range.end_ref.col - cell_range.start_ref.col + 1,
+            cell_range.end_ref.row - cell_range.start_ref.row + 1)
+
+def matching_values(evaluator, value_range, shape, offsets, negated):
+    # the values of the non-empty cells of value_range at the offsets from
+    # match_criteria, looking only at the first shape columns and rows
+    sheet = evaluator.workbook.sheet_map[value_range.sheet_name.lower()]
+    start = value_range.start_ref
+    value_cols, value_rows = range_shape(value_range)
+    cols, rows = min(shape[0], value_cols), min(shape[1], value_rows)
+
+    if not negated:
+        for col, row in offsets:
+            c = sheet.cells.get((start.col + col, start.row + row))
+            if col < cols and row < rows and c is not None and c.value is not None:
+                yield c.value
+        return
+
+    for (col, row), c in sheet.get_cells_in_region(start.tuple(), (start.col + cols - 1, start.row + rows - 1)):
+        if (col - start.col, row - start.row) not in offsets:
+            yield c.value
+
+def criteria_function(name, args, has_value_range, multiple):
+    '''
+    Checks the arguments of a criteria function. SUMIF and AVERAGEIF take
+    (range, criteria, [value range]), SUMIFS and AVERAGEIFS take
+    (value range, range, criteria, ...) and COUNTIF(S) take
+    (range, criteria, ...). Returns (value range, [(range, criteria)]), or
+    the error to return.
+    '''
+    value_range = None
+
+    if multiple:
+        if has_value_range:
+            if len(args) < 3:
+                return error.CellError(error.CellErrorType.TYPE_ERROR, f"{name} requires at least 3 arguments")
+            value_range, args = args[0], args[1:]
+
+        if len(args) < 2 or len(args) % 2 != 0:
+            return error.CellError(error.CellErrorType.TYPE_ERROR, f"{name} requires ranges and criteria in pairs")
+    else:
+        if len(args) < 2 or len(args) > (3 if has_value_range else 2):
+            return error.CellError(error.CellErrorType.TYPE_ERROR, f"{name} has the wrong number of arguments")
+
+        if len(args) == 3:
+            value_range, args = args[2], args[:2]
+        elif has_value_range:
+            value_range = args[0]
+
+    pairs = list(zip(args[0::2], args[1::2]))
+
+    for arg in [value_range] + [r for r, _ in pairs]:
+        if isinstance(arg, sheets.CellError):
+            return arg
+        if arg is not None and not isinstance(arg, CellRange):
+            return error.CellError(error.CellErrorType.TYPE_ERROR, f"{name} requires a cell range")
+
+    for _, value in pairs:
+        if isinstance(value, sheets.CellError):
+            return value
+        if isinstance(value, CellRange):
+            return error.CellError(error.CellErrorType.TYPE_ERROR, f"{name} requires a single value as criteria")
+
+    shape = range_shape(pairs[0][0])
+    if multiple and any(range_shape(r) != shape for r in [value_range] + [r for r, _ in pairs] if r is not None):
+        return error.CellError(error.CellErrorType.TYPE_ERROR, f"{name} requires ranges of the same size")
+
+    return value_range, pairs
+
+def conditional_numbers(evaluator, args, name, multiple):
+    checked = criteria_function(name, args, True, multiple)
+    if isinstance(checked, sheets.CellError):
+        return checked
+    value_range, pairs = checked
+
+    offsets, negated = match_criteria(evaluator, pairs)
+    shape = range_shape(pairs[0][0])
+
+    values = list(matching_values(evaluator, value_range, shape, offsets, negated))
+
+    # only numbers are added up; errors are passed on
+    e = error.propagate_errors(values)
+    if e is not None:
+        return e
+
+    return [v for v in values if isinstance(v, decimal.Decimal)]
+
+def func_sumif(evaluator, args):
+    numbers = conditional_numbers(evaluator, args, "SUMIF", False)
+    if isinstance(numbers, sheets.CellError):
+        return numbers
+    return sum(numbers, decimal.Decimal(0))
+
+def func_sumifs(evaluator, args):
+    numbers = conditional_numbers(evaluator, args, "SUMIFS", True)
+    if isinstance(numbers, sheets.CellError):
+        return numbers
+    return sum(numbers, decimal.Decimal(0))
+
+def average_numbers(numbers):
+    if isinstance(numbers, sheets.CellError):
+        return numbers
+    if len(numbers) == 0:
+        return error.CellError(error.CellErrorType.DIVIDE_BY_ZERO, "")
+    return sum(numbers) / len(numbers)
+
+def func_averageif(evaluator, args):
+    return average_numbers(conditional_numbers(evaluator, args, "AVERAGEIF", False))
+
+def func_averageifs(evaluator, args):
+    return average_numbers(conditional_numbers(evaluator, args, "AVERAGEIFS", True))
+
+def count_matches(evaluator, args, name, multiple):
+    checked = criteria_function(name, args, False, multiple)
+    if isinstance(checked, sheets.CellError):
+        return checked
+    _, pairs = checked
+
+    offsets, negated = match_criteria(evaluator, pairs)
+    if not negated:
+        return decimal.Decimal(len(offsets))
+
+    cols, rows = range_shape(pairs[0][0])
+    return decimal.Decimal(cols * rows - len(offsets))
+
+def func_countif(evaluator, args):
+    return count_matches(evaluator, args, "COUNTIF", False)
+
+def func_countifs(evaluator, args):
+    return count_matches(evaluator, args, "COUNTIFS", True)
+
+class MatchMode(enum.Enum):
+    EXACT = 0
+    EXACT_OR_SMALLER = -1
+    EXACT_OR_LARGER = 1
+    WILDCARD = 2
+
+def vector_index(evaluator, name, vector):
+    '''
+    Returns (index, first, last) for looking values up in a range that is a
+    single column or row: the column's ColumnIndex and the range's first and
+    last rows, or for a row, an index of the row's values by column that's
+    built on the spot. Returns an error if vector isn't such a range.
+    '''
+    if isinstance(vector, sheets.CellError):
+        return vector
+    if not isinstance(vector, CellRange):
+        return error.CellError(error.CellErrorType.TYPE_ERROR, f"{name} requires a cell range")
+
+    start, end = vector.start_ref, vector.end_ref
+    sheet = evaluator.workbook.sheet_map[vector.sheet_name.lower()]
+
+    if start.col == end.col:
+        return sheet.get_column_index(start.col), start.row, end.row
+
+    if start.row == end.row:
+        index = ColumnIndex()
+        for (col, _row), c in sheet.get_cells_in_region(start.tuple(), end.tuple()):
+            if c.value is not None:
+                index.add(col, c.value)
+        return index, start.col, end.col
+
+    return error.CellError(error.CellErrorType.TYPE_ERROR, f"{name} requires a single row or column")
+
+def find_in_vector(index, first, last, value, mode, from_end):
+    '''
+    Returns the position (row or column) between first and last of the
+    first, or with from_end the last, cell in index matching value, or None
+    if there isn't one. Exact matches are found through the index's hash
+    and the closest smaller or larger value through bisection.
+    '''
+    if value is None:
+        return None
+
+    if mode == MatchMode.WILDCARD and isinstance(value, str):
+        pattern = wildcard_pattern(value.lower())
+        positions = []
+        for key in index.equal:
+            if key[0] == base_types.TYPE_RANKS[str] and pattern.fullmatch(key[1]):
+                positions += index.rows_with_key(key, first, last)
+        positions.sort()
+    else:
+        key = base_types.sort_key(value)
+        positions = index.rows_with_key(key, first, last)
+
+        if len(positions) == 0 and mode in (MatchMode.EXACT_OR_SMALLER, MatchMode.EXACT_OR_LARGER):
+            closest = index.closest_key(key, first, last, mode == MatchMode.EXACT_OR_SMALLER)
+            if closest is not None:
+                positions = index.rows_with_key(closest, first, last)
+
+    if len(positions) == 0:
+        return None
+    return positions[-1] if from_end else positions[0]
+
+def to_integer(value):
+    number = base_types.to_number(value)
+    if isinstance(number, sheets.CellError):
+        return number
+    if number != int(number):
+        return error.CellError(error.CellErrorType.TYPE_ERROR, f"{value} is not an integer")
+    return int(number)
+
+def func_match(evaluator, args):
+    if len(args) < 2 or len(args) > 3:
+        return sheets.CellError(sheets.CellErrorType.TYPE_ERROR, "MATCH requires 2 or 3 arguments")
+
+    value = args[0]
+    if isinstance(value, sheets.CellError):
+        return value
+
+    match_type = to_integer(args[2]) if len(args) == 3 else 1
+    if isinstance(match_type, sheets.CellError):
+        return match_type
+
+    found = vector_index(evaluator, "MATCH", args[1])
+    if isinstance(found, sheets.CellError):
+        return found
+    index, first, last = found
+
+    # 1 and -1 expect the values to be sorted, and find the last of the
+    # values that are closest
+    if match_type == 0:
+        wildcards = isinstance(value, str) and any(ch in value for ch in "*?~")
+        position = find_in_vector(index, first, last, value, MatchMode.WILDCARD if wildcards else MatchMode.EXACT, False)
+    elif match_type > 0:
+        position = find_in_vector(index, first, last, value, MatchMode.EXACT_OR_SMALLER, True)
+    else:
+        position = find_in_vector(index, first, last, value, MatchMode.EXACT_OR_LARGER, True)
+
+    if position is None:
+        return error.CellError(error.CellErrorType.TYPE_ERROR, "MATCH found no match")
+
+    return decimal.Decimal(position - first + 1)
+
+def func_index(evaluator, args):
+    if len(args) < 2 or len(args) > 3:
+        return sheets.CellError(sheets.CellErrorType.TYPE_ERROR, "INDEX requires 2 or 3 arguments")
+
+    region = args[0]
+    if isinstance(region, sheets.CellError):
+        return region
+    if not isinstance(region, CellRange):
+        return error.CellError(error.CellErrorType.TYPE_ERROR, "INDEX requires a cell range")
+
+    positions = [to_integer(a) for a in args[1:]]
+    e = error.propagate_errors(positions)
+    if e is not None:
+        return e
+
+    start, end = region.start_ref, region.end_ref
+
+    if len(positions) == 2:
+        row, col = positions
+    elif start.row == end.row:
+        # a single row is indexed by column
+        row, col = 1, positions[0]
+    else:
+        row, col = positions[0], 1
+
+    if row < 1 or col < 1 or row > end.row - start.row + 1 or col > end.col - start.col + 1:
+        return error.CellError(error.CellErrorType.BAD_REFERENCE, "INDEX is outside of the range")
+
+    sheet = evaluator.workbook.sheet_map[region.sheet_name.lower()]
+    c = sheet.cells.get((start.col + col - 1, start.row + row - 1))
+    return None if c is None else c.value
+
+def func_xlookup(evaluator, args):
+    if len(args) < 3 or len(args) > 6:
+        return sheets.CellError(sheets.CellErrorType.TYPE_ERROR, "XLOOKUP requires 3 to 6 arguments")
+
+    value = args[0]
+    if isinstance(value, sheets.CellError):
+        return value
+
+    modes = [to_integer(a) for a in args[4:]] + [0, 1][len(args[4:]):]
+    e = error.propagate_errors(modes)
+    if e is not None:
+        return e
+    match_mode, search_mode = modes
+
+    try:
+        match_mode = MatchMode(match_mode)
+    except ValueError:
+        return error.CellError(error.CellErrorType.TYPE_ERROR, f"invalid XLOOKUP match mode {match_mode}")
+
+    if search_mode not in (1, -1, 2, -2):
+        return error.CellError(error.CellErrorType.TYPE_ERROR, f"invalid XLOOKUP search mode {search_mode}")
+
+    found = vector_index(evaluator, "XLOOKUP", args[1])
+    if isinstance(found, sheets.CellError):
+        return found
+    index, first, last = found
+
+    results = args[2]
+    if isinstance(results, sheets.CellError):
+        return results
+    if not isinstance(results, CellRange) or range_shape(results) != range_shape(args[1]):
+        return error.CellError(error.CellErrorType.TYPE_ERROR, "XLOOKUP requires ranges of the same size")
+
+    # the binary search modes (2 and -2) give the same answer as searching
+    # forwards and backwards when the values are sorted, so they share the
+    # index lookups
+    position = find_in_vector(index, first, last, value, match_mode, search_mode < 0)
+
+    if position is None:
+        if len(args) >= 4:
+            return args[3]
+        return error.CellError(error.CellErrorType.TYPE_ERROR, "XLOOKUP found no match")
+
+    offset = position - first
+    if results.start_ref.col == results.end_ref.col:
+        location = (results.start_ref.col, results.start_ref.row + offset)
+    else:
+        location = (results.start_ref.col + offset, results.start_ref.row)
+
+    c = evaluator.workbook.sheet_map[results.sheet_name.lower()].cells.get(location)
+    return None if c is None else c.value
+
+# functions whose range arguments are only linked to the cells in them that
+# are populated, instead of to every cell
+sparse_range_functions = {"sumif", "sumifs", "countif", "countifs", "averageif", "averageifs",
+                          "match", "index", "xlookup"}
+
+# Rough relative costs of calls, for FunctionInfo.cost: functions that only
+# look at their arguments' values, ones that go through ranges, and ones
+# that search or filter ranges. Calls to pure functions that cost at least
+# CACHE_MIN_COST go through the workbook's function cache.
+COST_CHEAP = 1
+COST_RANGE = 2
+COST_SEARCH = 3
+
+CACHE_MIN_COST = COST_RANGE
+
+class FunctionInfo:
+    '''
+    A function of the formula language and what the evaluator needs to know
+    about it.
+
+        Attributes:
+            arg_evaluation - whether f is given its arguments' values (EAGER)
+                             or their subtrees, to evaluate as needed (LAZY)
+            f              - called as f(evaluator, args)
+            pure           - whether the value only depends on the values of
+                             the arguments and the contents of ranges given
+                             as arguments; calls to pure functions are shared
+                             between formulas, and calls to pure eager ones
+                             are cached, so those must not link cells at
+                             runtime themselves
+            vectorizable   - whether f can be applied to each element of
+                             arrays given as its arguments, which batch
+                             evaluation does instead of evaluating it per row
+            cost           - COST_CHEAP, COST_RANGE or COST_SEARCH
+            batch          - for functions that take the arguments of many
+                             calls at once (see user_functions.py), called as
+                             batch(workbook, calls) with a list of the
+                             argument values of each call, returning a list
+                             of their values; None for the others
+    '''
+
+    def __init__(self, arg_evaluation: ArgEvaluation, f, pure: bool = True,
+                 vectorizable: bool = False, cost: int = COST_CHEAP, batch=None):
+        self.arg_evaluation = arg_evaluation
+        self.f = f
+        self.pure = pure
+        self.vectorizable = vectorizable
+        self.cost = cost
+        self.batch = batch
+
+    def cacheable(self) -> bool:
+        # lazy functions are given subtrees rather than values, so their
+        # calls can't be looked up by their arguments
+        return self.pure and self.arg_evaluation == ArgEvaluation.EAGER and self.cost >= CACHE_MIN_COST
+
 functions = {
-    "version":  (ArgEvaluation.EAGER, func_version  ),
-    "and":      (ArgEvaluation.EAGER, func_and      ),
-    "or":       (ArgEvaluation.EAGER, func_or       ),
-    "not":      (ArgEvaluation.EAGER, func_not      ),
-    "xor":      (ArgEvaluation.EAGER, func_xor      ),
-    "exact":    (ArgEvaluation.EAGER, func_exact    ),
-    "if":       (ArgEvaluation.LAZY,  func_if       ),
-    "iferror":  (ArgEvaluation.LAZY,  func_iferror  ),
-    "choose":   (ArgEvaluation.LAZY,  func_choose   ),
-    "isblank":  (ArgEvaluation.EAGER, func_isblank  ),
-    "iserror":  (ArgEvaluation.EAGER, func_iserror  ),
-    "indirect": (ArgEvaluation.EAGER, func_indirect ),
-    "min":      (ArgEvaluation.EAGER, func_min),
-    "max":      (ArgEvaluation.EAGER, func_max),
-    "sum":      (ArgEvaluation.EAGER, func_sum),
-    "average":  (ArgEvaluation.EAGER, func_average),
-    "vlookup":  (ArgEvaluation.LAZY,  func_vlookup),
-    "hlookup":  (ArgEvaluation.LAZY,  func_hlookup)
+    "version":    FunctionInfo(ArgEvaluation.EAGER, func_version,    vectorizable=True),
+    "and":        FunctionInfo(ArgEvaluation.EAGER, func_and,        vectorizable=True),
+    "or":         FunctionInfo(ArgEvaluation.EAGER, func_or,         vectorizable=True),
+    "not":        FunctionInfo(ArgEvaluation.EAGER, func_not,        vectorizable=True),
+    "xor":        FunctionInfo(ArgEvaluation.EAGER, func_xor,        vectorizable=True),
+    "exact":      FunctionInfo(ArgEvaluation.EAGER, func_exact,      vectorizable=True),
+    "if":         FunctionInfo(ArgEvaluation.LAZY,  func_if),
+    "iferror":    FunctionInfo(ArgEvaluation.LAZY,  func_iferror),
+    "choose":     FunctionInfo(ArgEvaluation.LAZY,  func_choose),
+    "isblank":    FunctionInfo(ArgEvaluation.EAGER, func_isblank,    vectorizable=True),
+    "iserror":    FunctionInfo(ArgEvaluation.EAGER, func_iserror,    vectorizable=True),
+    "indirect":   FunctionInfo(ArgEvaluation.EAGER, func_indirect,   pure=False),
+    "min":        FunctionInfo(ArgEvaluation.EAGER, func_min,        vectorizable=True, cost=COST_RANGE),
+    "max":        FunctionInfo(ArgEvaluation.EAGER, func_max,        vectorizable=True, cost=COST_RANGE),
+    "sum":        FunctionInfo(ArgEvaluation.EAGER, func_sum,        vectorizable=True, cost=COST_RANGE),
+    "average":    FunctionInfo(ArgEvaluation.EAGER, func_average,    vectorizable=True, cost=COST_RANGE),
+    "vlookup":    FunctionInfo(ArgEvaluation.LAZY,  func_vlookup,    cost=COST_SEARCH),
+    "hlookup":    FunctionInfo(ArgEvaluation.LAZY,  func_hlookup,    cost=COST_SEARCH),
+    "sumif":      FunctionInfo(ArgEvaluation.EAGER, func_sumif,      cost=COST_SEARCH),
+    "sumifs":     FunctionInfo(ArgEvaluation.EAGER, func_sumifs,     cost=COST_SEARCH),
+    "countif":    FunctionInfo(ArgEvaluation.EAGER, func_countif,    cost=COST_SEARCH),
+    "countifs":   FunctionInfo(ArgEvaluation.EAGER, func_countifs,   cost=COST_SEARCH),
+    "averageif":  FunctionInfo(ArgEvaluation.EAGER, func_averageif,  cost=COST_SEARCH),
+    "averageifs": FunctionInfo(ArgEvaluation.EAGER, func_averageifs, cost=COST_SEARCH),
+    "match":      FunctionInfo(ArgEvaluation.EAGER, func_match,      cost=COST_SEARCH),
+    "index":      FunctionInfo(ArgEvaluation.EAGER, func_index,      cost=COST_SEARCH),
+    "xlookup":    FunctionInfo(ArgEvaluation.EAGER, func_xlookup,    cost=COST_SEARCH)
 }
+
+# functions that can be applied to each element of arrays given as their
+# arguments
+elementwise_functions = {name for name, info in functions.items() if info.vectorizable}
@@ -77,6 +77,26 @@ class Graph(Generic[T]):
 
         self.cycles_dirty = True
 
+    def link_many(self, from_node: T, to_nodes):
+        '''
+        Link from_node to every node in to_nodes.
+        '''
+        if len(to_nodes) == 0:
+            return
+
+        forward = self.forward.setdefault(from_node, (set(), set()))[0]
+        new_nodes = [n for n in to_nodes if n not in forward]
+
+        if len(new_nodes) == 0:
+            return
+
+        forward.update(new_nodes)
+
+        for to_node in new_nodes:
+            self.backward.setdefault(to_node, (set(), set()))[0].add(from_node)
+
+        self.cycles_dirty = True
+
     def clear_forward_links(self, node: T):
         '''
         Remove all forward links coming from the given node.
@@ -93,13 +113,10 @@ class Graph(Generic[T]):
         for to in links:
             static, runtime = self.backward[to]
 
-            if node in static:
-                static.remove(node)
+            static.discard(node)
+            runtime.discard(node)
 
-            if node in runtime:
-                runtime.remove(node)
-
-            if len(self.get_backward_links(to)) == 0:
+            if len(static) == 0 and len(runtime) == 0:
                 self.backward.pop(to)
         self.cycles_dirty = True
 
@@ -145,6 +162,45 @@ class Graph(Generic[T]):
 
         self.cycles_dirty = True
         
+    def unlink_runtime(self, from_node: T, to_node: T):
+        '''
+        Remove the runtime link between the from_node and to_node, if there
+        is one.
+        '''
+        if from_node not in self.forward or to_node not in self.forward[from_node][1]:
+            return
+
+        self.forward[from_node][1].remove(to_node)
+        self.backward[to_node][1].remove(from_node)
+
+        if len(self.get_backward_links(to_node)) == 0:
+            self.backward.pop(to_node)
+
+        self.cycles_dirty = True
+
+    def rename_node(self, old_node: T, new_node: T):
+        '''
+        Move every link to and from old_node over to new_node, merging them
+        with any links new_node already has.
+        '''
+        if old_node in self.backward:
+            for i, links in enumerate(self.backward.pop(old_node)):
+                for from_node in links:
+                    self.forward[from_node][i].remove(old_node)
+                    self.forward[from_node][i].add(new_node)
+                if len(links) > 0:
+                    self.backward.setdefault(new_node, (set(), set()))[i].update(links)
+
+        if old_node in self.forward:
+            for i, links in enumerate(self.forward.pop(old_node)):
+                for to_node in links:
+                    self.backward[to_node][i].remove(old_node)
+                    self.backward[to_node][i].add(new_node)
+                if len(links) > 0:
+                    self.forward.setdefault(new_node, (set(), set()))[i].update(links)
+
+        self.cycles_dirty = True
+
     def clear_forward_runtime_links(self, node: T):
         '''
         Remove all forward links coming from the given node.
@@ -274,3 +330,63 @@ class Graph(Generic[T]):
                 if w not in ancestors and w not in nodes:
                     queue.append(w)
         return ancestors
+
+    def get_components(self, nodes):
+        '''
+        Splits the given set of nodes into weakly connected components,
+        following links in either direction but only between nodes in the set.
+        '''
+        components = []
+        seen = set()
+        for n in nodes:
+            if n in seen:
+                continue
+            seen.add(n)
+            component = [n]
+            queue = [n]
+            while len(queue) > 0:
+                v = queue.pop()
+                for links in (self.get_forward_links(v), self.get_backward_links(v)):
+                    for w in links:
+                        if w in nodes and w not in seen:
+                            seen.add(w)
+                            component.append(w)
+                            queue.append(w)
+            components.append(component)
+        return components
+
+    def get_levels(self, nodes):
+        '''
+        Groups the given set of nodes into levels so that every forward link
+        between two nodes in the set points to an earlier level. Only links
+        between nodes in the set are considered.
+
+        Nodes on a cycle, or that depend on one, can't be placed in a level.
+        They are returned separately, in no particular order.
+        '''
+        waiting = {}
+        level = []
+        for n in nodes:
+            count = 0
+            for w in self.get_forward_links(n):
+                if w in nodes:
+                    count += 1
+            if count == 0:
+                level.append(n)
+            else:
+                waiting[n] = count
+
+        levels = []
+        while len(level) > 0:
+            levels.append(level)
+            next_level = []
+            for v in level:
+                for w in self.get_backward_links(v):
+                    if w in waiting:
+                        waiting[w] -= 1
+                        if waiting[w] == 0:
+                            waiting.pop(w)
+                            next_level.append(w)
+            level = next_level
+
+        return levels, list(waiting.keys())
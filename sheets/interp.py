@@ -7,24 +7,18 @@ from lark.visitors import v_args
 from typing import Tuple
 
 from . import base_types
-from . import error
 from . import functions
+from . import operators
+from . import value_functions
 
+from .array     import Array
 from .error     import CellError, CellErrorType
+from .memo      import RuntimeLinks
 from .reference import Reference
 from .range     import CellRange
 
 parser = lark.Lark.open('formulas.lark', rel_to=__file__, start='formula')
 
-def remove_trailing_zeros(d: decimal.Decimal):
-    num = str(d)
-    e = num.rfind("E") if "E" in num else len(num)
-    if "." in num:
-        num = num[:e].rstrip("0") + num[e:]
-    if num[-1] == ".":
-        num = num[:-1]
-    return decimal.Decimal(num)
-
 def strip_quotes(s: str):
     if s[0] != "'":
         return s
@@ -34,8 +28,15 @@ class CellRefFinder(lark.visitors.Interpreter):
     def __init__(self, sheet_name):
         self.refs = []
         self.static_refs = []
+        # whole-row and whole-column ranges, ranges given directly to
+        # criteria functions and ranges used with operators, which are kept
+        # as ranges rather than expanded into a reference for every cell
+        self.ranges = []
         self.sheet_name = sheet_name
         self.static_context = True
+        # ranges outside of any function are used element-wise, so they're
+        # kept whole too
+        self.sparse_ranges = True
 
     def func_expr(self, tree):
         name = str(tree.children[0]).lower()
@@ -43,9 +44,12 @@ class CellRefFinder(lark.visitors.Interpreter):
         if name not in functions.functions:
             return CellError(CellErrorType.BAD_NAME, f"unrecognized function {name}")
 
+        old_sparse = self.sparse_ranges
+        self.sparse_ranges = name in functions.sparse_range_functions
+
         try:
 
-            if functions.functions[name][0] == functions.ArgEvaluation.LAZY:
+            if functions.functions[name].arg_evaluation == functions.ArgEvaluation.LAZY:
                 # first child could be a static reference (meaning it must be
                 # evaluated every time)
                 self.visit(tree.children[1])
@@ -55,13 +59,19 @@ class CellRefFinder(lark.visitors.Interpreter):
                 old = self.static_context
                 self.static_context = False
                 for child in tree.children[2:]:
+                    start = len(self.refs)
                     self.visit(child)
+                    # remember the branch's references so they can be linked
+                    # without walking it again every time it's chosen
+                    child.refs = self.refs[start:]
                 self.static_context = old
             else:
                 self.visit_children(tree)
 
         except IndexError:
             return CellError(CellErrorType.TYPE_ERROR, "function requires at least one argument")
+        finally:
+            self.sparse_ranges = old_sparse
 
     def cell(self, tree):
         try:
@@ -84,6 +94,11 @@ class CellRefFinder(lark.visitors.Interpreter):
             # don't include bad ranges
             return
 
+        if r.is_whole() or self.sparse_ranges:
+            # always treated as static, even in lazily evaluated arguments
+            self.ranges.append(r)
+            return
+
         for ref in r.generate():
             self.refs.append(ref)
 
@@ -102,7 +117,7 @@ class SheetRenamer(lark.visitors.Transformer_InPlace):
         try:
             # don't need to pass sheet name here cause we're just doing a
             # cosmetic change
-            ref = Reference.from_string(None, str(tree.children[0]))
+            ref = Reference.from_endpoint_string(None, str(tree.children[0]))
 
             if ref.sheet_name is not None and ref.sheet_name.lower() == self.old_name.lower():
                 ref.sheet_name = self.new_name
@@ -112,6 +127,10 @@ class SheetRenamer(lark.visitors.Transformer_InPlace):
             pass
 
         return tree
+
+    # endpoints of whole-column and whole-row ranges
+    column = cell
+    row = cell
     
 class FormulaPrinter(lark.visitors.Interpreter):
     
@@ -139,6 +158,14 @@ class FormulaPrinter(lark.visitors.Interpreter):
     def cell(self, values):
         return values[0]
     
+    @visit_children_decor
+    def column(self, values):
+        return values[0]
+
+    @visit_children_decor
+    def row(self, values):
+        return values[0]
+
     @visit_children_decor
     def cell_range(self, values):
         return ":".join(values)
@@ -166,118 +193,171 @@ class FormulaPrinter(lark.visitors.Interpreter):
     @visit_children_decor
     def func_expr(self, values):
         return values[0] + "(" + ", ".join(values[1:]) + ")"
-        
-class FormulaEvaluator(lark.visitors.Interpreter):
 
-    CMP_OPS = {
-                "=":  lambda a, b: a == b,
-                "==": lambda a, b: a == b,
-                "<>": lambda a, b: a != b,
-                "!=": lambda a, b: a != b,
-                ">":  lambda a, b: a > b,
-                "<":  lambda a, b: a < b,
-                ">=": lambda a, b: a >= b,
-                "<=": lambda a, b: a <= b
-            }
-
-    CMP_DEFAULTS = {
-                bool: False,
-                str: "",
-                decimal.Decimal: decimal.Decimal("0"),
-                type(None): None
-            }
+    # folded and pruned subtrees are printed as they were written
+    def folded(self, tree):
+        return self.visit(tree.children[0])
 
-    def __init__(self, workbook, sheet, cell):
-        self.workbook = workbook
-        self.sheet = sheet
-        self.c = cell
+    pruned = folded
 
-    @visit_children_decor
-    def cmp_expr(self, values):
-        e = error.propagate_errors([values[0], values[2]])
+class CanonicalPrinter(FormulaPrinter):
+    '''
+    Prints a formula from the given sheet with every reference written out
+    in full: with its (lowercase, quoted) sheet name and without $ signs.
+    Two subexpressions print the same exactly when they refer to the same
+    cells and are written the same way otherwise.
+    '''
 
-        if e is not None:
-            return e
+    def __init__(self, sheet_name):
+        self.sheet_name = sheet_name
 
-        if values[0] is None:
-            values[0] = FormulaEvaluator.CMP_DEFAULTS[type(values[2])]
+    def cell(self, tree):
+        text = str(tree.children[0])
+        try:
+            ref = Reference.from_endpoint_string(self.sheet_name, text)
+        except ValueError:
+            return text
+        return f"'{ref.sheet_name.lower()}'!{Reference(None, ref.col, ref.row).location_string()}"
 
-        if values[2] is None:
-            values[2] = FormulaEvaluator.CMP_DEFAULTS[type(values[0])]
+    def cell_range(self, tree):
+        # both endpoints are on the range's sheet, which is usually only
+        # named by the first
+        start = str(tree.children[0].children[0])
+        end = str(tree.children[1].children[0])
+        try:
+            sheet_name = CellRange(self.sheet_name, start, end).sheet_name
+            start_ref = Reference.from_endpoint_string(None, start)
+            end_ref = Reference.from_endpoint_string(None, end)
+        except ValueError:
+            return f"{start}:{end}"
 
-        if values[0] is None and values[2] is None:
-            values[0] = "None"
-            values[2] = "None"
+        start = Reference(None, start_ref.col, start_ref.row).location_string()
+        end = Reference(None, end_ref.col, end_ref.row).location_string()
+        return f"'{sheet_name.lower()}'!{start}:{end}"
 
-        if isinstance(values[0], type(values[2])):
-            if isinstance(values[0], str):
-                values[0] = values[0].lower()
+    @visit_children_decor
+    def func_expr(self, values):
+        return values[0].lower() + "(" + ", ".join(values[1:]) + ")"
 
-            if isinstance(values[2], str):
-                values[2] = values[2].lower()
+class FormulaEvaluator(lark.visitors.Interpreter):
 
-            if values[1] not in FormulaEvaluator.CMP_OPS:
-                assert f"Unexpected cmp_expr operator: {values[1]}"
+    def __init__(self, workbook, sheet, cell):
+        self.workbook = workbook
+        self.sheet = sheet
+        self.c = cell
 
-            return FormulaEvaluator.CMP_OPS[values[1]](values[0], values[2])
-        else:
-            types = {decimal.Decimal: 0, str: 1, bool: 2}
-            return FormulaEvaluator.CMP_OPS[values[1]](types[type(values[0])], types[type(values[2])])
+        # everything linked at runtime during this evaluation
+        self.runtime_cells = set()
+        self.runtime_sheets = set()
+
+        # where the links made while evaluating memoized function calls are
+        # recorded, innermost last (see func_expr)
+        self.recorders = []
+
+        # results of earlier calls to pure functions, or None to always call
+        # them
+        self.function_cache = workbook.function_cache
+
+    def link_sheet(self, sheet_name):
+        for links in self.recorders:
+            links.sheets.add(sheet_name)
+
+        if sheet_name not in self.runtime_sheets:
+            self.runtime_sheets.add(sheet_name)
+            self.workbook.sheet_references.link_runtime(self.c, sheet_name)
+
+    def link_cell(self, cell):
+        for links in self.recorders:
+            links.cells.add(cell)
+
+        if cell not in self.runtime_cells:
+            self.runtime_cells.add(cell)
+            self.workbook.dependency_graph.link_runtime(self.c, cell)
+
+    def watch_range(self, sheet, cell_range):
+        for links in self.recorders:
+            links.watched.append((sheet, cell_range))
+
+        sheet.watch_range(self.c, cell_range)
+        self.c.watched_sheets.add(sheet)
+
+    def link_all(self, links: RuntimeLinks):
+        '''
+        Makes the given links again, for a memoized value. Cells the formula
+        already linked to in its last evaluation are still linked in the
+        graph, so only the others are linked there.
+        '''
+        for sheet_name in links.sheets:
+            self.link_sheet(sheet_name)
+
+        for sheet, cell_range in links.watched:
+            self.watch_range(sheet, cell_range)
+
+        for outer in self.recorders:
+            outer.cells |= links.cells
+
+        new_cells = links.cells - self.runtime_cells
+        self.runtime_cells |= new_cells
+        for cell in new_cells - self.c.runtime_cells:
+            self.workbook.dependency_graph.link_runtime(self.c, cell)
+
+    def link_runtime(self, ref):
+        '''
+        Record that the formula being evaluated used the given reference at
+        runtime, and return the referenced cell. Raises KeyError if the
+        reference's sheet doesn't exist (the sheet name is still recorded so
+        the cell is updated if the sheet is created).
+        '''
+        sheet_name = (ref.sheet_name or self.sheet.sheet_name).lower()
+        self.link_sheet(sheet_name)
+
+        cell = self.workbook.sheet_map[sheet_name].get_cell(ref)
+        self.link_cell(cell)
+
+        return cell
+
+    def link_runtime_range(self, cell_range):
+        '''
+        link_runtime for a whole-row or whole-column range: links the cells
+        in it that are populated now, and has the sheet link the ones that
+        are populated later until the formula changes.
+        '''
+        sheet_name = cell_range.sheet_name.lower()
+        sheet = self.workbook.sheet_map[sheet_name]
+
+        self.link_sheet(sheet_name)
+        self.watch_range(sheet, cell_range)
+
+        for _location, cell in sheet.get_cells_in_region(cell_range.start_ref.tuple(), cell_range.end_ref.tuple()):
+            self.link_cell(cell)
+
+    def apply(self, f, values):
+        '''
+        Applies the operator f to the values of an expression's children.
+        Operators on cell ranges are applied to each cell, giving an Array.
+        '''
+        if not any(isinstance(v, (CellRange, Array)) for v in values):
+            return f(values)
+
+        operands = [Array.from_range(self.workbook, v) if isinstance(v, CellRange) else v for v in values]
+        return Array.elementwise(f, operands)
 
     @visit_children_decor
-    def add_expr(self, values):
-        left = base_types.to_number(values[0])
-        op = values[1]
-        right = base_types.to_number(values[2])
-
-        e = error.propagate_errors([left, right])
+    def cmp_expr(self, values):
+        return self.apply(operators.cmp_values, values)
 
-        if e is not None:
-            return e
+    @visit_children_decor
+    def add_expr(self, values):
+        return self.apply(operators.add_values, values)
 
-        if op == "+":
-            return left + right
-        elif op == "-":
-            return left - right
-        else:
-            assert f"Unexpected add_expr operator: {values[1]}"
-            
     @visit_children_decor
     def mul_expr(self, values):
-        left = base_types.to_number(values[0])
-        op = values[1]
-        right = base_types.to_number(values[2])
-
-        e = error.propagate_errors([left, right])
-
-        if e is not None:
-            return e
-
-        if op == "*":
-            return left * right
-        elif op == '/':
-            if right == decimal.Decimal(0):
-                return CellError(CellErrorType.DIVIDE_BY_ZERO, "")
-            else:
-                return left / right
-        else:
-            assert f"Unexpected mul_expr operator: {values[1]}"
+        return self.apply(operators.mul_values, values)
 
     @visit_children_decor
     def unary_op(self, values):
-        op = values[0]
-        value = base_types.to_number(values[1])
-
-        if isinstance(value, CellError):
-            return value
+        return self.apply(operators.unary_values, values)
 
-        if op == '+':
-            return value
-        elif op == '-':
-            return -1 * value
-        else:
-            assert f"Unexpected unary operator: {op}"
-        
     @visit_children_decor
     def cell(self, values):
         try:
@@ -293,24 +373,19 @@ class FormulaEvaluator(lark.visitors.Interpreter):
         try:
             start = str(tree.children[0].children[0])
             end = str(tree.children[1].children[0])
-            return CellRange(self.sheet.sheet_name, start, end).check_sheet(self.workbook)
+            return CellRange(self.sheet.sheet_name, start, end).check_sheet(self.workbook).clip(self.workbook)
         except (ValueError, KeyError):
             return CellError(CellErrorType.BAD_REFERENCE, f"{tree.children[0]}:{tree.children[1]}")
 
     @visit_children_decor
     def concat_expr(self, values):
-        e = error.propagate_errors(values)
-
-        if e is not None:
-            return e
-
-        return "".join(map(base_types.to_string, values))
+        return self.apply(operators.concat_values, values)
 
     @visit_children_decor
     def number(self, values):
         # if values[0] is a location
         # if values[0] is a CellError string representation
-        return remove_trailing_zeros(decimal.Decimal(values[0]))
+        return operators.remove_trailing_zeros(decimal.Decimal(values[0]))
     
     @visit_children_decor
     def string(self, values):
@@ -329,22 +404,94 @@ class FormulaEvaluator(lark.visitors.Interpreter):
     def boolean(self, values):
         return values[0].lower() == "true"
     
+    def folded(self, tree):
+        return tree.children[1]
+
+    def pruned(self, tree):
+        # the argument the IF or CHOOSE call always picks, which is linked
+        # at runtime like any other lazily evaluated argument
+        branch = tree.children[0].children[tree.children[1]]
+        functions.link_subtree(self, branch)
+        return self.visit(branch)
+
     def func_expr(self, tree):
+        # During a recalculation, pure calls that read ranges are shared
+        # between the formulas that make them (see memo.py). The links made
+        # while computing a call are kept with its value and made again for
+        # each formula that uses it.
+        memo = self.workbook.scheduler.memo
+        if memo is None or not is_memoizable(tree):
+            return self.call_function(tree)
+
+        key = canonical_text(self.sheet.sheet_name, tree)
+        entry = memo.get(key)
+        if entry is not None:
+            value, links = entry
+            self.link_all(links)
+            self.c.check_cycles(self.workbook)
+            return value
+
+        links = RuntimeLinks()
+        self.recorders.append(links)
+        try:
+            value = self.call_function(tree)
+        finally:
+            self.recorders.pop()
+
+        # ranges are references rather than values, and cheap to get again
+        if not isinstance(value, CellRange):
+            memo.put(key, value, links)
+        return value
+
+    def call_function(self, tree):
         name = str(tree.children[0])
 
         if name.lower() not in functions.functions:
             return CellError(CellErrorType.BAD_NAME, f"unrecognized function {name}")
         
-        arg_evaluation, f = functions.functions[name.lower()]
+        info = functions.functions[name.lower()]
 
-        if arg_evaluation == functions.ArgEvaluation.LAZY:
+        if info.arg_evaluation == functions.ArgEvaluation.LAZY:
             args = tree.children[1:]
-            return f(self, args)
-        elif arg_evaluation == functions.ArgEvaluation.EAGER:
+            return info.f(self, args)
+        elif info.arg_evaluation == functions.ArgEvaluation.EAGER:
             args = self.visit_children(tree)[1:]
-            return f(self, args)
         else:
-            assert f"Invalid ArgEvaluation: {arg_evaluation}!"
+            assert f"Invalid ArgEvaluation: {info.arg_evaluation}!"
+
+        if info.batch is not None:
+            return self.call_batch(name.lower(), info, args)
+
+        if self.function_cache is None or not info.cacheable():
+            return info.f(self, args)
+
+        key = call_key(self.workbook, name.lower(), info, args)
+        if key is None:
+            return info.f(self, args)
+
+        entry = self.function_cache.get(key)
+        if entry is not None:
+            return entry[0]
+
+        value = info.f(self, args)
+        self.function_cache.put(key, value)
+        return value
+
+    def call_batch(self, name, info, args):
+        '''
+        Calls a function that takes the arguments of many calls at once.
+        While the scheduler recomputes a level, the calls its formulas make
+        have already been made together, and their values are looked up in
+        its batch_results (see user_functions.batch_calls); other calls are
+        made on their own.
+        '''
+        results = self.workbook.scheduler.batch_results
+        if results is not None:
+            key = call_key(self.workbook, name, info, args, versions=False)
+            if key in results:
+                return results[key]
+
+        return info.batch(self.workbook, [args])[0]
 
 class FormulaMover(lark.visitors.Transformer_InPlace):
     
@@ -356,7 +503,7 @@ class FormulaMover(lark.visitors.Transformer_InPlace):
         try:
             # We can safely pass None here because we don't use this reference
             # to get a cell value.
-            ref = Reference.from_string(None, str(tree.children[0]))
+            ref = Reference.from_endpoint_string(None, str(tree.children[0]))
         except ValueError:
             # https://piazza.com/class/lqvau3tih6k26o/post/33
             # :>
@@ -364,40 +511,289 @@ class FormulaMover(lark.visitors.Transformer_InPlace):
 
         # check if new loc is valid
         try:
-            new_value = str(ref.moved(self.offset).check_bounds())
+            tree.children[0] = str(ref.moved(self.offset).check_bounds())
         except ValueError:
-            new_value = "#REF!"
-        
-        tree.children[0] = new_value
+            # same tree we'd get from parsing the #REF! literal
+            return lark.Tree("error", [lark.Token("ERROR_VALUE", "#REF!")])
 
         return tree
-        
+
+    # endpoints of whole-column and whole-row ranges
+    column = cell
+    row = cell
+
+    @v_args(tree=True)
+    def cell_range(self, tree):
+        # a range with an endpoint moved off the sheet is #REF! as a whole,
+        # since "#REF!:C3" wouldn't parse
+        if any(c.data == "error" for c in tree.children):
+            return lark.Tree("error", [lark.Token("ERROR_VALUE", "#REF!")])
+        return tree
+
+class ConstantFolder(lark.visitors.Transformer_InPlace):
+    '''
+    Replaces each part of a formula that doesn't depend on any cell with a
+    "folded" tree holding the original subtree (which is what gets printed,
+    moved and renamed) and its value, computed the same way the evaluator
+    would. Literals are folded too, so they're only converted once. IF and
+    CHOOSE calls that always pick the same argument become "pruned" trees
+    holding the call and the index of that argument among its children.
+    '''
+
+    def fold(self, tree, value):
+        # the folded children are put back, as there's no need to keep both
+        tree.children = [c.children[0] if is_folded(c) else c for c in tree.children]
+        return lark.Tree("folded", [tree, value])
+
+    def fold_operator(self, tree, f):
+        if not all(is_folded(c) for c in tree.children if isinstance(c, lark.Tree)):
+            return tree
+
+        values = [c.children[1] if isinstance(c, lark.Tree) else c for c in tree.children]
+        return self.fold(tree, f(values))
+
+    def fold_chain(self, tree, f, step):
+        '''
+        fold_operator for a flattened chain of operators, where step is the
+        number of children per operand. A constant start of the chain, which
+        would have been its own subtree before flattening, is folded even
+        when the rest of the chain isn't.
+        '''
+        constant = 0
+        while constant < len(tree.children) and is_folded(tree.children[constant]):
+            constant += step
+
+        if constant >= len(tree.children):
+            return self.fold_operator(tree, f)
+
+        # the start is constant up to the operand before the first that isn't
+        constant -= step
+        if constant > 0:
+            start = self.fold_operator(lark.Tree(tree.data, tree.children[:constant + 1]), f)
+            tree.children = [start] + tree.children[constant + 1:]
+        return tree
+
+    @v_args(tree=True)
+    def cmp_expr(self, tree):
+        return self.fold_operator(tree, operators.cmp_values)
+
+    @v_args(tree=True)
+    def add_expr(self, tree):
+        return self.fold_chain(tree, operators.add_values, 2)
+
+    @v_args(tree=True)
+    def mul_expr(self, tree):
+        return self.fold_chain(tree, operators.mul_values, 2)
+
+    @v_args(tree=True)
+    def unary_op(self, tree):
+        return self.fold_operator(tree, operators.unary_values)
+
+    @v_args(tree=True)
+    def concat_expr(self, tree):
+        return self.fold_chain(tree, operators.concat_values, 1)
+
+    @v_args(tree=True)
+    def parens(self, tree):
+        return self.fold_operator(tree, lambda values: values[0])
+
+    @v_args(tree=True)
+    def number(self, tree):
+        return self.fold(tree, operators.remove_trailing_zeros(decimal.Decimal(tree.children[0])))
+
+    @v_args(tree=True)
+    def string(self, tree):
+        return self.fold(tree, tree.children[0].value[1:-1])
+
+    @v_args(tree=True)
+    def boolean(self, tree):
+        return self.fold(tree, tree.children[0].lower() == "true")
+
+    @v_args(tree=True)
+    def error(self, tree):
+        return self.fold(tree, CellError(CellError.from_string(tree.children[0]), ""))
+
+    @v_args(tree=True)
+    def func_expr(self, tree):
+        name = str(tree.children[0]).lower()
+        args = tree.children[1:]
+
+        if name == "if":
+            return self.fold_if(tree, args)
+        elif name == "choose":
+            return self.fold_choose(tree, args)
+        elif name in functions.elementwise_functions and functions.functions[name].pure:
+            # functions that only look at their arguments' values
+            f = functions.functions[name].f
+            return self.fold_operator(tree, lambda values: f(None, values[1:]))
+        return tree
+
+    def pick(self, tree, index):
+        branch = tree.children[index]
+        if is_folded(branch):
+            return self.fold(tree, branch.children[1])
+        return lark.Tree("pruned", [tree, index])
+
+    def fold_if(self, tree, args):
+        if len(args) < 2 or len(args) > 3:
+            return self.fold(tree, functions.func_if(None, args))
+
+        if not is_folded(args[0]):
+            return tree
+
+        b = base_types.to_bool(args[0].children[1])
+
+        if isinstance(b, CellError):
+            return self.fold(tree, b)
+
+        if b:
+            return self.pick(tree, 2)
+        elif len(args) == 3:
+            return self.pick(tree, 3)
+        return self.fold(tree, False)
+
+    def fold_choose(self, tree, args):
+        if len(args) < 2:
+            return self.fold(tree, functions.func_choose(None, args))
+
+        if not is_folded(args[0]):
+            return tree
+
+        index = value_functions.choose_index(args[0].children[1], len(args))
+        if isinstance(index, CellError):
+            return self.fold(tree, index)
+        return self.pick(tree, index + 1)
+
+# operators that can be chained: A1+A2-A3, A1*A2/A3, A1&A2&A3
+CHAINS = {"add_expr", "mul_expr", "concat_expr"}
+
+def is_folded(tree) -> bool:
+    return isinstance(tree, lark.Tree) and tree.data == "folded"
+
+def is_memoizable(tree) -> bool:
+    '''
+    Whether the value of a function call is worth sharing between formulas
+    and only depends on the cells it refers to: it reads a range and only
+    calls pure functions. Cached on the tree as its memoizable attribute.
+    '''
+    memoizable = getattr(tree, "memoizable", None)
+    if memoizable is None:
+        reads_range = False
+        memoizable = True
+        for t in tree.iter_subtrees():
+            if t.data == "cell_range":
+                reads_range = True
+            elif t.data == "func_expr":
+                info = functions.functions.get(str(t.children[0]).lower())
+                if info is not None and not info.pure:
+                    memoizable = False
+        memoizable = memoizable and reads_range
+        tree.memoizable = memoizable
+    return memoizable
+
+def call_key(workbook, name, info, args, versions: bool = True):
+    '''
+    The function cache's key for a call to the named function with the
+    given argument values: the name, the function's FunctionInfo, so calls
+    to a function registered again under the same name don't find the old
+    function's results, and a key for each value, in which
+    ranges are identified by their sheet's version stamp and their corners,
+    and numbers by how they're written. Without versions, ranges are
+    identified by their sheet and corners, for when their contents can't
+    have changed. Returns None if an argument is an array, or a range on a
+    missing sheet.
+    '''
+    key = [name, info]
+    for arg in args:
+        if isinstance(arg, CellRange):
+            sheet = workbook.sheet_map.get(arg.sheet_name.lower())
+            if sheet is None:
+                return None
+            stamp = sheet.version if versions else sheet
+            key.append((CellRange, stamp, arg.start_ref.tuple(), arg.end_ref.tuple()))
+        elif isinstance(arg, CellError):
+            key.append((CellError, arg.get_type(), arg.get_detail()))
+        elif isinstance(arg, Array):
+            return None
+        else:
+            key.append((type(arg), str(arg)))
+    return tuple(key)
+
+def canonical_text(sheet_name, tree) -> str:
+    printer = CanonicalPrinter(sheet_name)
+    return printer.visit(tree)
+
+def flatten_chains(tree):
+    '''
+    The grammar gives left-deep trees for chains of operators at the same
+    precedence, like A1+A2+A3, which are as deep as the chain is long.
+    This rewrites each chain in place as one tree with all of the chain's
+    operands and operators as its children, so ((A1 + A2) + A3) becomes
+    (A1 + A2 + A3); parenthesized parts of a chain are left alone. Chains
+    are evaluated from left to right (see operators.chain_values), so their
+    values are the same. Walks the tree without recursion, so long formulas
+    don't hit the recursion limit, and returns the root.
+    '''
+    stack = [tree]
+    while len(stack) > 0:
+        t = stack.pop()
+
+        if t.data in CHAINS:
+            # the rest of each tree down the left side of the chain, from
+            # the top
+            rests = []
+            node = t
+            while isinstance(node, lark.Tree) and node.data == t.data:
+                rests.append(node.children[1:])
+                node = node.children[0]
+
+            if len(rests) > 1:
+                children = [node]
+                for rest in reversed(rests):
+                    children.extend(rest)
+                t.children = children
+
+        stack.extend(c for c in t.children if isinstance(c, lark.Tree))
+
+    return tree
+
 def parse_formula(formula):
     try:
-        return parser.parse(formula)
+        return flatten_chains(parser.parse(formula))
     except lark.exceptions.ParseError:
         return None
     except lark.exceptions.UnexpectedCharacters:
         return None
 
-def evaluate_formula(workbook, sheet, cell, tree):
-    evaluator = FormulaEvaluator(workbook, sheet, cell)
-    return evaluator.visit(tree)
-
-def find_refs(workbook, sheet, tree):
-    finder = CellRefFinder(sheet.sheet_name.lower())
+def find_refs(tree):
+    '''
+    Returns the static references, all references and the ranges that are
+    only linked to their populated cells (whole-row and whole-column ranges,
+    and ranges given to criteria functions). A reference or range without a sheet
+    name has sheet_name None and refers to the formula's own sheet.
+
+    Also stores the references of each lazily evaluated argument on that
+    argument's subtree, as its refs attribute.
+    '''
+    finder = CellRefFinder(None)
     finder.visit(tree)
-    return (finder.static_refs, finder.refs)
+    return (finder.static_refs, finder.refs, finder.ranges)
+
+def print_formula(tree):
+    printer = FormulaPrinter()
+    return "=" + printer.visit(tree)
+
+# These rewrite the tree in place and return its (possibly new) root.
 
 def rename_sheet(old, new, tree):
     renamer = SheetRenamer(old, new)
-    renamer.transform(tree)
-    printer = FormulaPrinter()
-    return "=" + printer.visit(tree) 
+    return renamer.transform(tree)
+
+def fold_constants(tree):
+    folder = ConstantFolder()
+    return folder.transform(tree)
 
 def move_formula(offset: Tuple[int, int], tree):
     mover = FormulaMover(offset)
-    mover.transform(tree)
-    printer = FormulaPrinter()
-    return "=" + printer.visit(tree)
+    return mover.transform(tree)
     
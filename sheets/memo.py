@@ -0,0 +1,101 @@
+import collections
+import itertools
+
+from typing import Any, Dict, Hashable, List, Optional, Set, Tuple
+
+# Sheets are stamped with a new number from here whenever one of their
+# cells' values changes (see Cell.set_value). Stamps are never reused, even
+# by other sheets or workbooks, so a range's sheet and stamp identify the
+# range's contents.
+version_stamps = itertools.count(1)
+
+class RuntimeLinks:
+    '''
+    The runtime links made while evaluating part of a formula: the names of
+    the sheets and the cells it used, and the (sheet, range) pairs of the
+    ranges it watches.
+    '''
+
+    def __init__(self):
+        self.sheets: Set[str] = set()
+        self.cells: Set[Any] = set()
+        self.watched: List[Tuple[Any, Any]] = []
+
+class SubexpressionMemo:
+    '''
+    Values of pure subexpressions computed during one recalculation, keyed
+    by their canonical text (see interp.canonical_text), so that a function
+    call repeated in many formulas, like SUM(Data!B1:B10000), is evaluated
+    once per recalculation rather than once per cell.
+
+    Each entry also keeps the runtime links made while computing it, which
+    are made again for every formula that uses the entry, so cells still
+    depend on everything their formulas read.
+
+    Entries never go stale while the scheduler walks its levels in order:
+    every cell a subexpression reads is recomputed before any formula that
+    uses it. Cells that change outside that order (spilled cells) clear the
+    memo, and each recalculation starts with an empty one.
+
+        Attributes:
+            hits   - number of lookups that found a value
+            misses - number of lookups that didn't
+    '''
+
+    def __init__(self):
+        self.entries: Dict[str, Tuple[Any, RuntimeLinks]] = {}
+        self.hits: int = 0
+        self.misses: int = 0
+
+    def get(self, key: str) -> Optional[Tuple[Any, RuntimeLinks]]:
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return entry
+
+    def put(self, key: str, value: Any, links: RuntimeLinks) -> None:
+        self.entries[key] = (value, links)
+
+    def clear(self) -> None:
+        self.entries = {}
+
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups > 0 else 0.0
+
+class FunctionCache:
+    '''
+    The results of the most recent calls to pure functions (see
+    functions.FunctionInfo), keyed by the function's name and its arguments
+    (see interp.call_key), keeping at most size of them. Unlike the
+    SubexpressionMemo it lasts between recalculations, so a call whose
+    arguments haven't changed isn't evaluated again.
+
+        Attributes:
+            hits   - number of lookups that found a result
+            misses - number of lookups that didn't
+    '''
+
+    def __init__(self, size: int):
+        self.size = size
+        self.entries: collections.OrderedDict = collections.OrderedDict()
+        self.hits: int = 0
+        self.misses: int = 0
+
+    def get(self, key: Hashable) -> Optional[Tuple[Any]]:
+        # returns the result in a 1-tuple, since it may be None
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self.entries.move_to_end(key)
+        return entry
+
+    def put(self, key: Hashable, value: Any) -> None:
+        self.entries[key] = (value,)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.size:
+            self.entries.popitem(last=False)
@@ -0,0 +1,165 @@
+import decimal
+
+from .base_types import to_number, to_string
+from .error import CellError, CellErrorType, propagate_errors
+
+# The operators of the formula language applied to single values. Besides
+# the interpreter, these are used by the modules sheets.compiler generates,
+# which include this file's source after those of error.py and
+# base_types.py, so it only imports names from those (see compiler.py).
+
+CMP_OPS = {
+            "=":  lambda a, b: a == b,
+            "==": lambda a, b: a == b,
+            "<>": lambda a, b: a != b,
+            "!=": lambda a, b: a != b,
+            ">":  lambda a, b: a > b,
+            "<":  lambda a, b: a < b,
+            ">=": lambda a, b: a >= b,
+            "<=": lambda a, b: a <= b
+        }
+
+CMP_DEFAULTS = {
+            bool: False,
+            str: "",
+            decimal.Decimal: decimal.Decimal("0"),
+            type(None): None
+        }
+
+def cmp_values(values):
+    e = propagate_errors([values[0], values[2]])
+
+    if e is not None:
+        return e
+
+    if values[0] is None:
+        values[0] = CMP_DEFAULTS[type(values[2])]
+
+    if values[2] is None:
+        values[2] = CMP_DEFAULTS[type(values[0])]
+
+    if values[0] is None and values[2] is None:
+        values[0] = "None"
+        values[2] = "None"
+
+    if isinstance(values[0], type(values[2])):
+        if isinstance(values[0], str):
+            values[0] = values[0].lower()
+
+        if isinstance(values[2], str):
+            values[2] = values[2].lower()
+
+        if values[1] not in CMP_OPS:
+            assert f"Unexpected cmp_expr operator: {values[1]}"
+
+        return CMP_OPS[values[1]](values[0], values[2])
+    else:
+        types = {decimal.Decimal: 0, str: 1, bool: 2}
+        return CMP_OPS[values[1]](types[type(values[0])], types[type(values[2])])
+
+def chain_values(values, apply):
+    '''
+    Evaluates a chain of operators at the same precedence, given as
+    [operand, op, operand, op, operand, ...], from left to right, the same
+    way nested binary operators would be: an error on the left is
+    propagated along with any error to its right.
+    '''
+    left = to_number(values[0])
+
+    for i in range(1, len(values), 2):
+        right = to_number(values[i + 1])
+
+        e = propagate_errors([left, right])
+
+        if e is not None:
+            left = e
+        else:
+            left = apply(left, values[i], right)
+
+    return left
+
+def add_op(left, op, right):
+    if op == "+":
+        return left + right
+    elif op == "-":
+        return left - right
+    else:
+        assert f"Unexpected add_expr operator: {op}"
+
+def mul_op(left, op, right):
+    if op == "*":
+        return left * right
+    elif op == '/':
+        if right == decimal.Decimal(0):
+            return CellError(CellErrorType.DIVIDE_BY_ZERO, "")
+        else:
+            return left / right
+    else:
+        assert f"Unexpected mul_expr operator: {op}"
+
+def add_values(values):
+    return chain_values(values, add_op)
+
+def mul_values(values):
+    return chain_values(values, mul_op)
+
+def unary_values(values):
+    op = values[0]
+    value = to_number(values[1])
+
+    if isinstance(value, CellError):
+        return value
+
+    if op == '+':
+        return value
+    elif op == '-':
+        return -1 * value
+    else:
+        assert f"Unexpected unary operator: {op}"
+
+def concat_values(values):
+    e = propagate_errors(values)
+
+    if e is not None:
+        return e
+
+    return "".join(map(to_string, values))
+
+def remove_trailing_zeros(d: decimal.Decimal):
+    num = str(d)
+    e = num.rfind("E") if "E" in num else len(num)
+    if "." in num:
+        num = num[:e].rstrip("0") + num[e:]
+    if num[-1] == ".":
+        num = num[:-1]
+    return decimal.Decimal(num)
+
+def result_value(value):
+    # how a value computed by a formula is stored
+    if value is None:
+        return decimal.Decimal(0)
+
+    if type(value) == decimal.Decimal:
+        return remove_trailing_zeros(value)
+
+    return value
+
+def contents_value(contents: str):
+    # the value of a cell whose (stripped, non-empty) contents aren't a
+    # formula
+    if contents[0] == "'":
+        return contents[1:]
+    elif contents.lower() == "true":
+        return True
+    elif contents.lower() == "false":
+        return False
+    elif CellError.from_string(contents) is not None:
+        return CellError(CellError.from_string(contents), "")
+
+    try:
+        value = remove_trailing_zeros(decimal.Decimal(contents))
+        if not value.is_finite():
+            return contents
+        return value
+    except decimal.InvalidOperation:
+        return contents
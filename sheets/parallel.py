@@ -0,0 +1,311 @@
+import heapq
+
+from typing import List, Tuple, Any, Optional
+
+from . import scheduler
+from . import user_functions
+from . import workbook
+
+from .reference import Reference
+
+# Cells are sent to worker processes as plain tuples so that only the data
+# needed for evaluation is pickled:
+#
+#   cells:  (sheet name, col, row, contents)
+#   inputs: (sheet name, col, row, value)
+#
+# and each evaluated cell comes back as
+#
+#   (value, runtime cell links, runtime sheet links)
+#
+# where the runtime cell links are (sheet name, col, row) tuples.
+
+def uses_indirect(tree) -> bool:
+    # INDIRECT can reference any cell at runtime, so we can't know ahead of
+    # time which input values a worker would need.
+    for t in tree.iter_subtrees():
+        if t.data == "func_expr" and str(t.children[0]).lower() == "indirect":
+            return True
+    return False
+
+def can_run_remotely(component) -> bool:
+    for c in component:
+        if c.formula_tree is not None and uses_indirect(c.formula_tree):
+            return False
+
+        # functions added with register_function aren't defined in the
+        # workers
+        if c.formula_tree is not None and user_functions.uses_user_functions(c.formula_tree):
+            return False
+
+        # whole-row and whole-column ranges depend on which cells are
+        # populated, which pack_component doesn't send
+        if len(c.ranges) > 0:
+            return False
+    return True
+
+def pack_component(wb, component):
+    members = set(component)
+
+    cells = []
+    inputs = {}
+    for c in component:
+        cells.append((c.sheet.sheet_name, c.location.col, c.location.row, c.contents))
+
+        if c.formula_tree is None:
+            continue
+
+        for ref in c.all_refs:
+            try:
+                ref.check_bounds()
+                other = c.resolve(wb, ref)
+            except (KeyError, ValueError):
+                continue
+
+            if other in members or other.value is None:
+                continue
+
+            inputs[other] = (other.sheet.sheet_name, other.location.col, other.location.row, other.value)
+
+    return cells, list(inputs.values())
+
+def recalculate_component(sheet_names: List[str],
+                          cells: List[Tuple[str, int, int, Optional[str]]],
+                          inputs: List[Tuple[str, int, int, Any]]):
+    # Runs in a worker process: rebuild just enough of a workbook to evaluate
+    # the component, then send back the new values and runtime links.
+    wb = workbook.Workbook()
+    for name in sheet_names:
+        wb.new_sheet(name)
+
+    for sheet_name, col, row, value in inputs:
+        wb.get_cell(Reference(sheet_name, col, row)).set_value(value)
+
+    component = []
+    for sheet_name, col, row, contents in cells:
+        c = wb.get_cell(Reference(sheet_name, col, row))
+        c.set_contents(wb, contents, evaluate_formulas=False)
+        component.append(c)
+
+    wb.recompute_cells_serial(set(component))
+
+    results = []
+    for c in component:
+        runtime_cells = [(other.sheet.sheet_name, other.location.col, other.location.row) for other in c.runtime_cells]
+        results.append((c.value, runtime_cells, list(c.runtime_sheets)))
+    return results
+
+def merge_component(wb, component, results):
+    for c, (value, runtime_cells, runtime_sheets) in zip(component, results):
+        cells = set(wb.get_cell(Reference(sheet_name, col, row)) for sheet_name, col, row in runtime_cells)
+        c.set_runtime_links(wb, cells, set(runtime_sheets))
+        c.set_value(value)
+
+def recompute_parallel(wb, nodes):
+    '''
+    Recomputes the given cells by splitting them into groups with no links
+    between them. Groups of at least wb.parallel_min_cells cells are evaluated
+    in wb's process pool; the rest are evaluated in this process.
+    '''
+    # pick up references to sheets that have been created since these cells
+    # were last evaluated
+    for c in nodes:
+        c.check_references(wb)
+
+    sheet_names = [s.sheet_name for s in wb.sheets]
+
+    local = set()
+    futures = []
+    component_of = {}
+    for i, component in enumerate(wb.dependency_graph.get_components(nodes)):
+        for c in component:
+            component_of[c] = i
+
+        if len(component) < wb.parallel_min_cells or not can_run_remotely(component):
+            local.update(component)
+            continue
+
+        cells, inputs = pack_component(wb, component)
+        future = wb.get_process_pool().submit(recalculate_component, sheet_names, cells, inputs)
+        futures.append((component, future))
+
+    # evaluate the small groups while the workers are busy
+    wb.recompute_cells_serial(local)
+
+    for component, future in futures:
+        merge_component(wb, component, future.result())
+
+    # a lazy branch, lookup or INDIRECT may now read a cell in another group,
+    # which may not have had its new value yet; those cells are evaluated
+    # again, with the cells that depend on them
+    late = set(c for c in component_of
+               if any(component_of.get(other, component_of[c]) != component_of[c] for other in c.runtime_cells))
+    if len(late) > 0:
+        ancestors = wb.dependency_graph.get_ancestors_of_set(late)
+        wb.recompute_cells_serial(late | set(c for c in ancestors if c in component_of))
+
+def dispatch_level_to_pool(wb, level):
+    '''
+    A RecalcScheduler.dispatch_level hook that splits a level into one chunk
+    per worker of wb's process pool. Levels smaller than wb.parallel_min_cells
+    are evaluated in this process. Cells whose new runtime links reach cells
+    that are still pending are evaluated again by the scheduler.
+    '''
+    if wb.parallel_workers == 0 or len(level) < wb.parallel_min_cells:
+        scheduler.serial_dispatch(wb, level)
+        return
+
+    local = []
+    remote = []
+    for c in level:
+        if can_run_remotely([c]):
+            c.check_references(wb)
+            remote.append(c)
+        else:
+            local.append(c)
+
+    sheet_names = [s.sheet_name for s in wb.sheets]
+    chunk_size = max(1, -(-len(remote) // wb.parallel_workers))
+
+    futures = []
+    for i in range(0, len(remote), chunk_size):
+        # cells in a level don't depend on each other, so any chunk of one
+        # can be evaluated on its own
+        chunk = remote[i:i + chunk_size]
+        cells, inputs = pack_component(wb, chunk)
+        future = wb.get_process_pool().submit(recalculate_component, sheet_names, cells, inputs)
+        futures.append((chunk, future))
+
+    scheduler.serial_dispatch(wb, local)
+
+    for chunk, future in futures:
+        merge_component(wb, chunk, future.result())
+
+def sort_chunk(keys, reverse: bool) -> List[int]:
+    # Runs in a worker process: returns the indices of keys in stable
+    # sorted order.
+    return sorted(range(len(keys)), key=keys.__getitem__, reverse=reverse)
+
+def sort_positions(wb, positions: List[int], keys, reverse: bool) -> List[int]:
+    '''
+    Stable sorts positions by keys[position], with one chunk per worker of
+    wb's process pool. The sorted chunks are merged here; heapq.merge takes
+    equal keys from earlier chunks first, so the result is still stable.
+    '''
+    chunk_size = max(1, -(-len(positions) // wb.parallel_workers))
+
+    futures = []
+    for i in range(0, len(positions), chunk_size):
+        chunk = positions[i:i + chunk_size]
+        future = wb.get_process_pool().submit(sort_chunk, [keys[p] for p in chunk], reverse)
+        futures.append((chunk, future))
+
+    chunks = [[chunk[i] for i in future.result()] for chunk, future in futures]
+    return list(heapq.merge(*chunks, key=keys.__getitem__, reverse=reverse))
+
+def run_scenario(wb, overrides, outputs) -> List[Any]:
+    '''
+    Sets the cells in overrides on a fork of wb, recomputes the cells they
+    affect in one pass, and returns the values of the output cells.
+    '''
+    fork = wb.fork()
+    fork.manual_calculation = True
+
+    for (sheet_name, location), contents in overrides.items():
+        fork.set_cell_contents(sheet_name, location, contents)
+
+    fork.recalculate()
+    return [fork.get_cell_value(sheet_name, location) for sheet_name, location in outputs]
+
+def pack_workbook(wb):
+    '''
+    The state of wb that a worker needs to try scenarios on it, the same
+    state Workbook.fork copies: its sheet names, and for each cell that has
+    contents or holds part of an array a tuple
+
+        (sheet name, col, row, contents, value, runtime cell links,
+         runtime sheet links, spill shape, spilled from)
+
+    where cells are given as (sheet name, col, row) tuples.
+    '''
+    def key(c):
+        return (c.sheet.sheet_name, c.location.col, c.location.row)
+
+    cells = []
+    for s in wb.sheets:
+        for c in s.cells.values():
+            if c.is_empty() and c.spilled_from is None:
+                continue
+
+            spilled_from = None if c.spilled_from is None else key(c.spilled_from)
+            cells.append((s.sheet_name, c.location.col, c.location.row, c.contents, c.value,
+                          [key(other) for other in c.runtime_cells], list(c.runtime_sheets),
+                          c.spill_shape, spilled_from))
+
+    return [s.sheet_name for s in wb.sheets], cells
+
+def unpack_workbook(sheet_names, cells):
+    '''
+    Rebuilds a workbook from the state pack_workbook gives, with the same
+    values and links as the original, the way Workbook.fork does. Formulas
+    are parsed but not evaluated: evaluating them again could make other
+    runtime links, through lazy functions and INDIRECT, than the original's.
+    '''
+    wb = workbook.Workbook()
+    for name in sheet_names:
+        wb.add_sheet(name)
+
+    def cell_at(sheet_name, col, row):
+        return wb.get_cell(Reference(sheet_name, col, row))
+
+    found = []
+    for sheet_name, col, row, contents, *_ in cells:
+        sheet = wb.sheet_map[sheet_name.lower()]
+        found.append(sheet.set_cell_contents(wb, Reference(sheet_name, col, row), contents, evaluate_formulas=False))
+
+    for c, (_, _, _, _, value, runtime_cells, runtime_sheets, spill_shape, spilled_from) in zip(found, cells):
+        c.set_value(value)
+
+        if len(runtime_cells) > 0 or len(runtime_sheets) > 0:
+            c.set_runtime_links(wb, set(cell_at(*other) for other in runtime_cells), set(runtime_sheets))
+
+        if spill_shape is not None:
+            c.spill_shape = spill_shape
+            c.sheet.spill_anchors.add(c)
+
+        if spilled_from is not None:
+            anchor = cell_at(*spilled_from)
+            c.spilled_from = anchor
+            c.sheet.set_occupied(c, True)
+            wb.dependency_graph.link(c, anchor)
+            anchor.spill_cells.append(c)
+
+    return wb
+
+def run_scenario_chunk(state, scenarios, outputs):
+    # Runs in a worker process: rebuilds the workbook once, then tries each
+    # of the scenarios on its own fork of it.
+    wb = unpack_workbook(*state)
+    return [run_scenario(wb, overrides, outputs) for overrides in scenarios]
+
+def run_scenarios(wb, scenarios, outputs) -> List[List[Any]]:
+    '''
+    Workbook.run_scenarios with one chunk of the scenarios per worker of wb's
+    process pool. The workers are sent wb's cells with their values and
+    links (see pack_workbook), so each scenario only recomputes the cells it
+    affects, as it does in this process. Functions added with
+    register_function aren't in the workers (see Workbook.run_scenarios).
+    '''
+    state = pack_workbook(wb)
+
+    chunk_size = max(1, -(-len(scenarios) // wb.parallel_workers))
+
+    futures = []
+    for i in range(0, len(scenarios), chunk_size):
+        chunk = scenarios[i:i + chunk_size]
+        futures.append(wb.get_process_pool().submit(run_scenario_chunk, state, chunk, outputs))
+
+    results = []
+    for future in futures:
+        results += future.result()
+    return results
@@ -1,17 +1,19 @@
+import copy
 import re
 
 from .reference import Reference
 
 class CellRange:
 
-    range_regex = re.compile("((([A-Za-z_][A-Za-z0-9_]*|'[^']*')!)?\$?[A-Za-z]+\$?[0-9]+):((([A-Za-z_][A-Za-z0-9_]*|'[^']*')!)?\$?[A-Za-z]+\$?[0-9]+)")
+    endpoint_pattern = "(([A-Za-z_][A-Za-z0-9_]*|'[^']*')!)?(\$?[A-Za-z]+\$?[0-9]+|\$?[A-Za-z]+|\$?[0-9]+)"
+    range_regex = re.compile(f"(?P<start>{endpoint_pattern}):(?P<end>{endpoint_pattern})")
 
     def __init__(self, default_sheet_name: str, start_location: str, end_location: str):
         # The semantics around providing sheet names for each of the endpoints
         # of a range are a bit special. We pass None here to compute the sheet
         # name later...
-        start_location_initial = Reference.from_string(None, start_location)
-        end_location_initial = Reference.from_string(None, end_location)
+        start_location_initial = Reference.from_endpoint_string(None, start_location)
+        end_location_initial = Reference.from_endpoint_string(None, end_location)
 
         # We take the sheet name from the start ref, falling back on the end
         # ref's sheet if the start ref's was None, and finally falling back on
@@ -32,11 +34,32 @@ class CellRange:
         if start_location_initial.sheet_name != end_location_initial.sheet_name:
             raise ValueError
 
+        # Whole-column ranges (A:C) have no rows and whole-row ranges (3:5)
+        # have no columns. Both endpoints have to be the same kind.
+        self.whole_columns = start_location_initial.row is None
+        self.whole_rows = start_location_initial.col is None
+
+        if self.whole_columns != (end_location_initial.row is None) \
+                or self.whole_rows != (end_location_initial.col is None):
+            raise ValueError
+
+        # ...and they cover every row or column of the sheet
+        if self.whole_columns:
+            start_location_initial.row = 1
+            end_location_initial.row = Reference.MAX_ROW
+
+        if self.whole_rows:
+            start_location_initial.col = 1
+            end_location_initial.col = Reference.MAX_COL
+
         # Reorder the refs so start_ref is the upper left and end_ref is the
         # lower right
         self.start_ref = Reference.min(start_location_initial, end_location_initial)
         self.end_ref = Reference.max(start_location_initial, end_location_initial)
 
+    def is_whole(self) -> bool:
+        return self.whole_columns or self.whole_rows
+
     def check_bounds(self):
         self.start_ref.check_bounds()
         self.end_ref.check_bounds()
@@ -58,12 +81,27 @@ class CellRange:
         if m is None:
             raise ValueError
 
-        groups = m.groups()
+        return CellRange(default_sheet_name, m.group("start"), m.group("end"))
+
+    def clip(self, workbook):
+        '''
+        Returns a whole-row or whole-column range cut down to the sheet's
+        extent; nothing outside of it is populated. Other ranges are returned
+        as they are.
+        '''
+        if not self.is_whole():
+            return self
 
-        start = groups[0]
-        end = groups[3]
+        cols, rows = workbook.sheet_map[self.sheet_name.lower()].get_extent()
 
-        return CellRange(default_sheet_name, start, end)
+        clipped = copy.copy(self)
+        clipped.whole_columns = False
+        clipped.whole_rows = False
+
+        end_col = max(self.start_ref.col, min(self.end_ref.col, cols))
+        end_row = max(self.start_ref.row, min(self.end_ref.row, rows))
+        clipped.end_ref = Reference(self.sheet_name, end_col, end_row)
+        return clipped
     
     def generate_column(self, col: int):
         for row in range(self.start_ref.row, self.end_ref.row + 1):
@@ -86,6 +124,14 @@ class CellRange:
         for ref in self.generate_row(row):
             yield workbook.get_cell(ref).value
 
+    def generate_populated(self, workbook):
+        # Only the non-empty cells in the range, in the same order as
+        # generate(), found with the sheet's index instead of visiting every
+        # location.
+        sheet = workbook.sheet_map[self.sheet_name.lower()]
+        for _location, c in sheet.get_cells_in_region(self.start_ref.tuple(), self.end_ref.tuple()):
+            yield c
+
     def generate_values(self, workbook):
         for ref in self.generate():
             yield workbook.get_cell(ref).value
@@ -5,6 +5,10 @@ from . import base_types
 
 location_regex = re.compile("(([A-Za-z_][A-Za-z0-9_]*|'[^']*')!)?(\$?)([A-Za-z]+)(\$?)([0-9]+)")
 
+# endpoints of whole-column and whole-row ranges
+column_regex = re.compile("(([A-Za-z_][A-Za-z0-9_]*|'[^']*')!)?(\$?)([A-Za-z]+)")
+row_regex = re.compile("(([A-Za-z_][A-Za-z0-9_]*|'[^']*')!)?(\$?)([0-9]+)")
+
 def from_base_26(s: str):
     result = 0
     for c in s:
@@ -32,6 +36,7 @@ def unquote(s: Optional[str]) -> Optional[str]:
 class Reference:
 
     MAX_COL = from_base_26("zzzz")
+    MAX_ROW = 9999
 
     def __init__(self,
                  sheet_name: Optional[str],
@@ -54,7 +59,11 @@ class Reference:
         return Reference(a.sheet_name, min(a.col, b.col), min(a.row, b.row))
 
     def check_bounds(self):
-        if self.col <= 0 or self.col > Reference.MAX_COL or self.row <= 0 or self.row > 9999:
+        # col or row is None for the endpoints of whole-row and whole-column
+        # ranges
+        if self.col is not None and (self.col <= 0 or self.col > Reference.MAX_COL):
+            raise ValueError
+        if self.row is not None and (self.row <= 0 or self.row > Reference.MAX_ROW):
             raise ValueError
         return self
 
@@ -86,13 +95,36 @@ class Reference:
 
         return Reference(sheet_name, col, row, abs_col, abs_row)
 
+    def from_endpoint_string(default_sheet_name: Optional[str], endpoint_string: str):
+        '''
+        Parses either a cell location or the endpoint of a whole-column ("A")
+        or whole-row ("3") range. The missing row or column is None.
+        '''
+        try:
+            return Reference.from_string(default_sheet_name, endpoint_string)
+        except ValueError:
+            pass
+
+        m = column_regex.fullmatch(endpoint_string)
+        if m is not None:
+            groups = m.groups()
+            col = from_base_26(groups[3].lower())
+            return Reference(unquote(groups[1]) or default_sheet_name, col, None, groups[2] == "$")
+
+        m = row_regex.fullmatch(endpoint_string)
+        if m is not None:
+            groups = m.groups()
+            return Reference(unquote(groups[1]) or default_sheet_name, None, int(groups[3]), False, groups[2] == "$")
+
+        raise ValueError
+
     def moved(self, offset: Tuple[int, int]):
         sheet_name = self.sheet_name
         col = self.col
         row = self.row
-        if not self.abs_col:
+        if not self.abs_col and col is not None:
             col += offset[0]
-        if not self.abs_row:
+        if not self.abs_row and row is not None:
             row += offset[1]
         return Reference(sheet_name, col, row, self.abs_col, self.abs_row)
 
@@ -102,7 +134,9 @@ class Reference:
     def location_string(self) -> str:
         def ds(b: bool) -> str:
             return "$" if b else ""
-        return "{}{}{}{}".format(ds(self.abs_col), to_base_26(self.col), ds(self.abs_row), self.row)
+        col = "" if self.col is None else ds(self.abs_col) + to_base_26(self.col)
+        row = "" if self.row is None else ds(self.abs_row) + str(self.row)
+        return col + row
         
     def __str__(self) -> str:
         def f(s: Optional[str]) -> str:
@@ -0,0 +1,121 @@
+import time
+
+from typing import Callable, Dict, List, Optional, Tuple, Any
+
+from . import user_functions
+
+from .memo import SubexpressionMemo
+
+def serial_dispatch(workbook, cells):
+    for c in cells:
+        c.recompute_value(workbook)
+
+class RecalcScheduler:
+    '''
+    Recomputes a set of cells one topological level at a time. Only the
+    links between the cells being recomputed are looked at, so the cost is
+    proportional to the size of the cascade rather than the workbook.
+
+        Attributes:
+            dispatch_level - called as dispatch_level(workbook, cells) to
+                             recompute one level. Cells in the same level
+                             never depend on each other, so the hook is free
+                             to evaluate them in any order or on an executor,
+                             as long as every cell has its new value when it
+                             returns.
+            level_stats    - (number of cells, seconds) for each level of the
+                             last recalculation. Cells that are on or depend
+                             on a cycle are recomputed last, as one extra
+                             entry.
+            memo           - the SubexpressionMemo that formulas share
+                             values through while a recalculation is
+                             running, or None between recalculations and
+                             while cells on cycles are recomputed
+            memo_stats     - (hits, misses) of the memo in the last
+                             recalculation
+            batch_results  - the values of the calls to batch functions
+                             that the level being recomputed makes, made
+                             before dispatch_level is called (see
+                             user_functions.batch_calls), or None
+    '''
+
+    def __init__(self):
+        self.dispatch_level: Callable[[Any, List[Any]], None] = serial_dispatch
+        self.level_stats: List[Tuple[int, float]] = []
+        self.memo: Optional[SubexpressionMemo] = None
+        self.memo_stats: Tuple[int, int] = (0, 0)
+        self.batch_results: Optional[Dict[Any, Any]] = None
+
+    def invalidate_memo(self):
+        # called when a cell's value changes out of order during a
+        # recalculation
+        if self.memo is not None:
+            self.memo.clear()
+
+    def recompute(self, workbook, nodes):
+        # a recalculation started during another one changes cells out of
+        # the outer one's order, so the outer memo is cleared afterwards
+        outer = self.memo
+        memo = SubexpressionMemo()
+        self.memo = memo
+        try:
+            self.recompute_levels(workbook, nodes)
+        finally:
+            self.memo_stats = (memo.hits, memo.misses)
+            self.memo = outer
+            self.invalidate_memo()
+
+    def recompute_levels(self, workbook, nodes):
+        nodes = set(nodes)
+        graph = workbook.dependency_graph
+
+        levels, cyclic = graph.get_levels(nodes)
+
+        # cells that haven't been recomputed yet in this pass, including the
+        # level being recomputed
+        pending = set(nodes)
+
+        self.level_stats = []
+        i = 0
+        while i < len(levels):
+            level = levels[i]
+            i += 1
+
+            start = time.perf_counter()
+            self.batch_results = user_functions.batch_calls(workbook, level)
+            try:
+                self.dispatch_level(workbook, level)
+            finally:
+                self.batch_results = None
+            self.level_stats.append((len(level), time.perf_counter() - start))
+
+            # The levels come from the links the cells had before the pass. A
+            # lazy branch, lookup or INDIRECT that now reads a cell that is
+            # still pending read a stale value, so the cell is evaluated
+            # again after it, with the rest of the pass placed again.
+            late = set(c for c in level if not c.runtime_cells.isdisjoint(pending))
+            pending.difference_update(c for c in level if c not in late)
+            if len(late) > 0:
+                self.invalidate_memo()
+                levels, cyclic = graph.get_levels(pending)
+                i = 0
+
+        if len(cyclic) == 0:
+            return
+
+        # Cells on cycles have to go through the whole-graph order since
+        # that's where the cycles are found. They're evaluated out of order,
+        # so they don't use the memo.
+        start = time.perf_counter()
+        memo, self.memo = self.memo, None
+
+        cyclic = set(cyclic)
+        order = [c for c in graph.get_topological_order() if c in cyclic]
+        ordered = set(order)
+        order += [c for c in cyclic if c not in ordered]
+
+        try:
+            serial_dispatch(workbook, order)
+        finally:
+            self.memo = memo
+        self.level_stats.append((len(order), time.perf_counter() - start))
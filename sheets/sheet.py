@@ -1,46 +1,91 @@
-import functools
+import bisect
+import heapq
 
 from . import base_types
+from . import memo
 
 from .cell import Cell
+from .column_index import ColumnIndex
 from .reference import Reference
 
 from typing import List
 
-@functools.total_ordering
-class SortRow:
+class Occupancy:
+    '''
+    Counts the non-empty cells in each row (or column) and keeps track of
+    the last row that has any.
 
-    def __init__(self, sheet, sort_cols, order, row_index):
-        self.sheet = sheet
-        self.sort_cols = sort_cols
-        self.order = order
-        self.row_index = row_index
-    
-    def __lt__(self, other):
-        for col_order, col_index in zip(self.order, self.sort_cols):
-            my_ref = Reference(self.sheet.sheet_name, col_index, self.row_index)
-            my_value = self.sheet.get_cell_value(my_ref)
-
-            other_ref = Reference(self.sheet.sheet_name, col_index, other.row_index)
-            other_value = self.sheet.get_cell_value(other_ref)
-
-            if base_types.lt(my_value, other_value):
-                return True ^ col_order
-            elif base_types.lt(other_value, my_value):
-                return False ^ col_order
-        return False
-    
-    def __str__(self):
-        return str(self.row_index)
+        Attributes:
+            counts - maps an index to the number of non-empty cells in it;
+                     indices with no cells aren't in the map
+            heap   - max-heap (of negated indices) of every index in counts.
+                     Indices that have since become empty are only removed
+                     when they reach the top, so it may hold stale entries
+                     and duplicates.
+    '''
+
+    def __init__(self):
+        self.counts = {}
+        self.heap = []
+
+    def add(self, index):
+        count = self.counts.get(index, 0)
+        self.counts[index] = count + 1
+
+        if count == 0:
+            heapq.heappush(self.heap, -index)
+
+            if len(self.heap) > 2 * len(self.counts) + 32:
+                self.heap = [-i for i in self.counts]
+                heapq.heapify(self.heap)
+
+    def remove(self, index):
+        count = self.counts[index] - 1
+        if count == 0:
+            self.counts.pop(index)
+        else:
+            self.counts[index] = count
+
+    def max(self):
+        while len(self.heap) > 0 and -self.heap[0] not in self.counts:
+            heapq.heappop(self.heap)
+
+        return -self.heap[0] if len(self.heap) > 0 else 0
 
 class Sheet:
     def __init__(self, workbook, sheet_name):
         self.workbook = workbook
-        self.extent = (0, 0)
         self.sheet_name = sheet_name
         self.cells = {}
-        self.cols_hist = []
-        self.rows_hist = []
+        self.cols_hist = Occupancy()
+        self.rows_hist = Occupancy()
+
+        # Spatial index of the non-empty cells: the rows that have any, in
+        # order, and for each of those rows its non-empty columns in order.
+        self.populated_rows = []
+        self.populated_cols = {}
+
+        # Cells whose formulas use ranges on this sheet that are only linked
+        # to their populated cells (whole-row and whole-column ranges, and
+        # the ranges given to criteria functions like SUMIF), mapped to those
+        # ranges. (cell, range) pairs are indexed by the rows of whole-row
+        # ranges and the columns of the others, and the cells are linked to
+        # the cells in their ranges as those become non-empty.
+        self.range_watchers = {}
+        self.col_watchers = {}
+        self.row_watchers = {}
+
+        # cells whose formulas evaluated to arrays, which spill into the
+        # regions given by their spill_shape
+        self.spill_anchors = set()
+
+        # ColumnIndex for each column that a criteria function has searched,
+        # kept up to date by Cell.set_value from then on
+        self.column_indexes = {}
+
+        # changed by Cell.set_value whenever a value on the sheet changes
+        # (see memo.version_stamps)
+        self.version = next(memo.version_stamps)
         
     def to_json(self):
         json_obj = {
@@ -67,22 +112,135 @@ class Sheet:
     def update_sheet_name(self, new_name):
         self.sheet_name = new_name
 
+    def watch_range(self, c, cell_range) -> bool:
+        '''
+        Has c linked to the cells in cell_range as they become non-empty.
+        Returns False if c was already watching the range.
+        '''
+        ranges = self.range_watchers.setdefault(c, [])
+        if cell_range in ranges:
+            return False
+        ranges.append(cell_range)
+
+        indices, watchers = self.watcher_indices(cell_range)
+        for i in indices:
+            watchers.setdefault(i, set()).add((c, cell_range))
+
+        return True
+
+    def unwatch_ranges(self, c):
+        for cell_range in self.range_watchers.pop(c, []):
+            indices, watchers = self.watcher_indices(cell_range)
+            for i in indices:
+                if i in watchers:
+                    watchers[i].discard((c, cell_range))
+                    if len(watchers[i]) == 0:
+                        watchers.pop(i)
+
+    def watcher_indices(self, cell_range):
+        if cell_range.whole_rows:
+            return range(cell_range.start_ref.row, cell_range.end_ref.row + 1), self.row_watchers
+        return range(cell_range.start_ref.col, cell_range.end_ref.col + 1), self.col_watchers
+
+    def set_occupied(self, c, occupied: bool):
+        ref = c.location
+
+        if occupied:
+            for watchers in (self.col_watchers.get(ref.col, ()), self.row_watchers.get(ref.row, ())):
+                for w, r in watchers:
+                    if r.start_ref.row <= ref.row <= r.end_ref.row and r.start_ref.col <= ref.col <= r.end_ref.col:
+                        self.workbook.dependency_graph.link(w, c)
+
+            self.add_populated(ref)
+        else:
+            self.remove_populated(ref)
+
+    def is_populated(self, ref) -> bool:
+        cols = self.populated_cols.get(ref.row, [])
+        i = bisect.bisect_left(cols, ref.col)
+        return i < len(cols) and cols[i] == ref.col
+
+    def add_populated(self, ref):
+        # adds a location to the spatial index and the sheet's extent
+        self.cols_hist.add(ref.col)
+        self.rows_hist.add(ref.row)
+
+        if ref.row not in self.populated_cols:
+            bisect.insort(self.populated_rows, ref.row)
+            self.populated_cols[ref.row] = []
+        bisect.insort(self.populated_cols[ref.row], ref.col)
+
+    def remove_populated(self, ref):
+        self.cols_hist.remove(ref.col)
+        self.rows_hist.remove(ref.row)
+
+        cols = self.populated_cols[ref.row]
+        cols.pop(bisect.bisect_left(cols, ref.col))
+        if len(cols) == 0:
+            self.populated_cols.pop(ref.row)
+            self.populated_rows.pop(bisect.bisect_left(self.populated_rows, ref.row))
+
+    def get_spills_covering(self, cells):
+        '''
+        Returns the cells with array values whose regions contain any of the
+        given cells, other than the cells themselves. Their arrays have to be
+        spilled again when something is put into or taken out of the way.
+        '''
+        anchors = set()
+        for anchor in self.spill_anchors:
+            cols, rows = anchor.spill_shape
+            start = anchor.location
+            for c in cells:
+                if c is not anchor and c.sheet is self \
+                        and start.col <= c.location.col < start.col + cols \
+                        and start.row <= c.location.row < start.row + rows:
+                    anchors.add(anchor)
+                    break
+        return anchors
+
+    def get_column_index(self, col):
+        '''
+        Returns the ColumnIndex of the given column, building it from the
+        column's current values the first time it's asked for.
+        '''
+        index = self.column_indexes.get(col)
+        if index is None:
+            index = ColumnIndex()
+            for row in self.populated_rows:
+                c = self.cells.get((col, row))
+                if c is not None and c.value is not None:
+                    index.add(row, c.value)
+            self.column_indexes[col] = index
+        return index
+
     def get_extent(self):
-        extent = (0, 0)
-        for location, cell in self.cells.items():
-            if cell.contents is None:
-                continue
-            extent = (max(extent[0], location[0]),
-                        max(extent[1], location[1]))
-        return extent
+        return (self.cols_hist.max(), self.rows_hist.max())
+
+    def get_cells_in_region(self, start, end):
+        '''
+        Returns the non-empty cells between the (col, row) corners start and
+        end inclusive, as a list of ((col, row), cell) pairs in row-major
+        order. Only rows that have non-empty cells are looked at.
+        '''
+        result = []
+
+        first = bisect.bisect_left(self.populated_rows, start[1])
+        last = bisect.bisect_right(self.populated_rows, end[1])
+
+        for row in self.populated_rows[first:last]:
+            cols = self.populated_cols[row]
+            for col in cols[bisect.bisect_left(cols, start[0]):bisect.bisect_right(cols, end[0])]:
+                result.append(((col, row), self.cells[(col, row)]))
+
+        return result
 
-    def set_cell_contents(self, workbook, ref: Reference, content: str):
+    def set_cell_contents(self, workbook, ref: Reference, content: str, evaluate_formulas = True):
         location = ref.tuple()
 
         if location not in self.cells:
-            self.cells[location] = Cell(self, ref)
+            self.cells[location] = Cell(self, Reference(self.sheet_name, ref.col, ref.row))
 
-        self.cells[location].set_contents(workbook, content)
+        self.cells[location].set_contents(workbook, content, evaluate_formulas)
 
         return self.cells[location]
 
@@ -105,32 +263,45 @@ class Sheet:
         location = ref.tuple()
 
         if location not in self.cells:
-            self.cells[location] = Cell(self, ref)
+            self.cells[location] = Cell(self, Reference(self.sheet_name, ref.col, ref.row))
         
         return self.cells[location]
 
-    def sort_region(self, workbook, start_ref, end_ref, sort_cols: List[int]):
-        order = [False if col > 0 else True for col in sort_cols]
-        sort_cols = [start_ref.col + abs(col) - 1 for col in sort_cols]
+    def sort_rows(self, start, end, sort_cols: List[int], sort_positions = None) -> List[int]:
+        '''
+        Returns the row indices of the region between the (col, row) corners
+        start and end, in the order given by sort_cols (see
+        Workbook.sort_region).
 
-        sort_rows = [SortRow(self, sort_cols, order, row) for row in range(start_ref.row, end_ref.row + 1)]
-        sort_rows.sort()
+        If given, sort_positions(positions, keys, reverse) is used to stable
+        sort a list of positions by keys[position] instead of list.sort.
+        '''
+        rows = list(range(start[1], end[1] + 1))
 
-        copy = []
+        def key_column(col):
+            col = start[0] + abs(col) - 1
+            keys = []
+            for row in rows:
+                c = self.cells.get((col, row))
+                keys.append(base_types.sort_key(None if c is None else c.value))
+            return keys
 
-        for col in range(start_ref.col, end_ref.col + 1):
-            row_list = []
-            for row in range(start_ref.row, end_ref.row + 1):
-                ref = Reference(self.sheet_name, col, row)
-                row_list.append(self.get_cell(ref))
-            copy.append(row_list)
+        # Python's sort is stable even when reversed, so the columns are
+        # sorted on from last to first, with each run of columns going the
+        # same direction sorted on together.
+        runs = []
+        for col in sort_cols:
+            if len(runs) > 0 and (runs[-1][0] > 0) == (col > 0):
+                runs[-1].append(col)
+            else:
+                runs.append([col])
 
-        for to_row_relative, sort_row in enumerate(sort_rows):
-            to_row = to_row_relative + start_ref.row
-            from_row = sort_row.row_index
-            for col in range(start_ref.col, end_ref.col + 1):
-                c = copy[col - start_ref.col][from_row - start_ref.row]
-                c.location = Reference(self.sheet_name, col, to_row)
-                c.move_formula(workbook, (0, to_row - from_row))
-                self.cells[(col, to_row)] = copy[col - start_ref.col][from_row - start_ref.row]
+        positions = list(range(len(rows)))
+        for cols in reversed(runs):
+            keys = list(zip(*[key_column(col) for col in cols]))
+            if sort_positions is None:
+                positions.sort(key=keys.__getitem__, reverse=cols[0] < 0)
+            else:
+                positions = sort_positions(positions, keys, cols[0] < 0)
 
+        return [rows[i] for i in positions]
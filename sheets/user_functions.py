@@ -0,0 +1,295 @@
+import re
+import weakref
+
+from typing import Any, Callable, Dict, List, Optional
+
+from . import functions
+from . import interp
+
+from .array import Array
+from .base_types import to_cell_value
+from .error import CellError, CellErrorType, FormulaError
+from .range import CellRange
+
+# Functions added to the formula language by users of the package. A
+# function is called in one of two ways:
+#
+#   - scalar: f(args) for each call, with a list of the call's argument
+#     values, returning the call's value. Lazy functions are given a list
+#     of functions instead, each of which evaluates one argument when
+#     called, so arguments that aren't needed aren't evaluated.
+#
+#   - batch: f(calls) with a list of the argument values of many calls, one
+#     tuple per call, returning a list of their values in the same order.
+#     While the scheduler recomputes a level of cells, all the calls that
+#     the level's formulas make are gathered first and given to f together
+#     (see batch_calls), so the work can be done in one go, with NumPy or a
+#     single request to a service. Calls made anywhere else (cells on
+#     cycles, formulas evaluated outside a recalculation) are passed to f
+#     one at a time.
+#
+# Registered functions only exist in the process they were registered in,
+# so cells that use them are never sent to the worker processes of parallel
+# recalculation, and scenarios aren't run in them while any are registered.
+#
+# Argument values are what cells hold: Decimals, strings, bools, None and
+# CellErrors. Ranges, and arrays computed from them, are given as lists of
+# rows of values. Functions can return those, other numbers (ints, floats,
+# NumPy scalars) and lists of rows, which spill like arrays. A function that
+# raises an exception, or returns something else, evaluates to #VALUE!.
+
+FUNCTION_NAME = re.compile(r"[A-Za-z][A-Za-z0-9_]*")
+
+# the functions the package comes with, which can't be replaced
+builtin_functions = set(functions.functions)
+
+# names of the registered functions with batch signatures
+batch_functions = set()
+
+# every workbook, so the formulas that use a function can be updated when it
+# is registered or unregistered
+workbooks = weakref.WeakSet()
+
+def register_function(name: str, f: Callable, lazy: bool = False, batch: bool = False,
+                      pure: bool = False, vectorizable: bool = False,
+                      cost: int = functions.COST_SEARCH) -> None:
+    '''
+    Adds the function f to formulas as name (case-insensitive), replacing
+    any function registered under that name before. Formulas that already
+    use the name are updated in every workbook, as if they were entered
+    again.
+
+    lazy functions are given functions that evaluate their arguments rather
+    than the values, and batch functions are given the arguments of many
+    calls at once (see above); a function can't be both. The other flags
+    are as in functions.FunctionInfo: pure functions' calls can be shared
+    and cached, and vectorizable scalar functions are applied element-wise
+    by batch evaluation.
+
+    Raises ValueError if the name isn't a valid function name or is the
+    name of a built-in function, or if lazy and batch are both set.
+    '''
+    if FUNCTION_NAME.fullmatch(name) is None:
+        raise ValueError(f"{name!r} is not a valid function name")
+
+    name = name.lower()
+    if name in builtin_functions:
+        raise ValueError(f"{name.upper()} is a built-in function")
+
+    if lazy and batch:
+        raise ValueError("batch functions can't be lazy")
+
+    if batch:
+        info = functions.FunctionInfo(functions.ArgEvaluation.EAGER, None, pure=pure, cost=cost,
+                                      batch=lambda workbook, calls: call_batch(f, workbook, calls))
+        info.f = lambda evaluator, args: info.batch(evaluator.workbook, [args])[0]
+        batch_functions.add(name)
+    elif lazy:
+        info = functions.FunctionInfo(functions.ArgEvaluation.LAZY, lambda evaluator, args: call_lazy(f, evaluator, args),
+                                      pure=pure, cost=cost)
+        batch_functions.discard(name)
+    else:
+        info = functions.FunctionInfo(functions.ArgEvaluation.EAGER, lambda evaluator, args: call_eager(f, evaluator, args),
+                                      pure=pure, vectorizable=vectorizable, cost=cost)
+        batch_functions.discard(name)
+
+    functions.functions[name] = info
+    if info.vectorizable:
+        functions.elementwise_functions.add(name)
+    else:
+        functions.elementwise_functions.discard(name)
+
+    update_workbooks(name)
+
+def unregister_function(name: str) -> None:
+    '''
+    Removes a function added by register_function, updating the formulas
+    that use it. Raises KeyError if there is none by that name.
+    '''
+    name = name.lower()
+    if name in builtin_functions or name not in functions.functions:
+        raise KeyError(name)
+
+    del functions.functions[name]
+    functions.elementwise_functions.discard(name)
+    batch_functions.discard(name)
+
+    update_workbooks(name)
+
+def update_workbooks(name: str) -> None:
+    for wb in list(workbooks):
+        wb.update_cells_using_function(name)
+
+def uses_function(tree, names) -> bool:
+    return any(t.data == "func_expr" and str(t.children[0]).lower() in names
+               for t in tree.iter_subtrees())
+
+def uses_user_functions(tree) -> bool:
+    # any function that isn't built in, including unknown ones, which may be
+    # registered later
+    return any(t.data == "func_expr" and str(t.children[0]).lower() not in builtin_functions
+               for t in tree.iter_subtrees())
+
+def any_registered() -> bool:
+    return len(functions.functions) > len(builtin_functions)
+
+def argument_value(workbook, value):
+    if isinstance(value, CellRange):
+        value = Array.from_range(workbook, value)
+
+    if isinstance(value, Array):
+        return [value.values[row * value.cols:(row + 1) * value.cols] for row in range(value.rows)]
+    return value
+
+def result_value(value):
+    # a function's result as a cell value, or an Array for lists of rows
+    if isinstance(value, list):
+        rows = [list(row) for row in value]
+        if len(rows) == 0 or len(rows[0]) == 0 or any(len(row) != len(rows[0]) for row in rows):
+            raise TypeError("arrays must be lists of rows of the same length")
+        return Array(len(rows[0]), len(rows), [to_cell_value(v) for row in rows for v in row])
+    return to_cell_value(value)
+
+def function_error(e: Exception) -> CellError:
+    return CellError(CellErrorType.TYPE_ERROR, f"{type(e).__name__}: {e}")
+
+def call_eager(f, evaluator, args):
+    # evaluator is None when constant arguments are folded at parse time,
+    # when there are no ranges among them
+    workbook = None if evaluator is None else evaluator.workbook
+    try:
+        return result_value(f([argument_value(workbook, a) for a in args]))
+    except Exception as e:
+        return function_error(e)
+
+def call_lazy(f, evaluator, args):
+    def evaluate(subtree):
+        # linked at runtime, like the arguments of IF
+        def evaluate_argument():
+            functions.link_subtree(evaluator, subtree)
+            return argument_value(evaluator.workbook, evaluator.visit(subtree))
+        return evaluate_argument
+
+    try:
+        return result_value(f([evaluate(a) for a in args]))
+    except FormulaError:
+        # cycles found while linking an argument
+        raise
+    except Exception as e:
+        return function_error(e)
+
+def call_batch(f, workbook, calls: List[List[Any]]) -> List[Any]:
+    try:
+        results = list(f([tuple(argument_value(workbook, a) for a in args) for args in calls]))
+        if len(results) != len(calls):
+            raise ValueError(f"returned {len(results)} results for {len(calls)} calls")
+        return [result_value(r) for r in results]
+    except Exception as e:
+        return [function_error(e)] * len(calls)
+
+# the value of a batch function call that hasn't been made yet, while the
+# calls are being gathered
+PENDING = CellError(CellErrorType.TYPE_ERROR, "batch function call pending")
+
+class CallCollector(interp.FormulaEvaluator):
+    '''
+    Evaluates a formula to find the calls to batch functions it makes,
+    without changing anything or calling other registered functions. Calls
+    whose values aren't in results yet are
+    added to pending, keyed by interp.call_key, and evaluate to PENDING, as
+    do calls with a PENDING argument; those are found in a later round,
+    once the calls they depend on have been made.
+    '''
+
+    def __init__(self, workbook, sheet, cell, results: Dict[Any, Any], pending: Dict[Any, Any]):
+        super().__init__(workbook, sheet, cell)
+        self.results = results
+        self.pending = pending
+
+        # values computed with PENDING in them mustn't be kept
+        self.function_cache = None
+
+    def link_sheet(self, sheet_name):
+        pass
+
+    def link_cell(self, cell):
+        pass
+
+    def watch_range(self, sheet, cell_range):
+        pass
+
+    def func_expr(self, tree):
+        name = str(tree.children[0]).lower()
+        if name in builtin_functions or name in batch_functions or name not in functions.functions:
+            return self.call_function(tree)
+
+        # other registered functions aren't called until the formula is
+        # evaluated, in case calls are expensive or have side effects, but
+        # batch calls among the arguments of eager ones are gathered
+        if functions.functions[name].arg_evaluation == functions.ArgEvaluation.EAGER:
+            self.visit_children(tree)
+        return PENDING
+
+    def call_batch(self, name, info, args):
+        if any(a is PENDING for a in args):
+            return PENDING
+
+        key = interp.call_key(self.workbook, name, info, args, versions=False)
+        if key is None:
+            # made on its own when the formula is evaluated
+            return PENDING
+        if key in self.results:
+            return self.results[key]
+
+        self.pending[key] = (info, args)
+        return PENDING
+
+def uses_batch_functions(tree) -> bool:
+    return uses_function(tree, batch_functions)
+
+def batch_calls(workbook, cells) -> Optional[Dict[Any, Any]]:
+    '''
+    Makes the calls to batch functions that the formulas of the given cells,
+    which don't depend on each other, will make when they're evaluated, one
+    call to each function with all of its calls' arguments. Returns the
+    calls' values keyed by interp.call_key without versions, since the
+    cells' ranges can't change while the cells are evaluated, or None if
+    none of the cells call a batch function.
+    '''
+    if len(batch_functions) == 0:
+        return None
+
+    remaining = [c for c in cells if c.formula_tree is not None and uses_batch_functions(c.formula_tree)]
+    if len(remaining) == 0:
+        return None
+
+    results = {}
+    while len(remaining) > 0:
+        pending = {}
+        waiting = []
+        for c in remaining:
+            before = len(pending)
+            collector = CallCollector(workbook, c.sheet, c, results, pending)
+            try:
+                value = collector.visit(c.formula_tree)
+            except FormulaError:
+                continue
+
+            if len(pending) > before or value is PENDING:
+                waiting.append(c)
+
+        if len(pending) == 0:
+            break
+
+        by_function = {}
+        for key, (info, args) in pending.items():
+            by_function.setdefault(info, []).append((key, args))
+
+        for info, calls in by_function.items():
+            values = info.batch(workbook, [args for _key, args in calls])
+            for (key, _args), value in zip(calls, values):
+                results[key] = value
+
+        remaining = waiting
+
+    return results
@@ -0,0 +1,188 @@
+import decimal
+
+from .base_types import to_bool, to_number, to_string
+from .error import CellError, CellErrorType, propagate_errors
+
+# The built-in functions whose results only depend on the values of their
+# arguments, shared by functions.py, which gives them the values its
+# evaluator computes, and by the modules generated by sheets.compiler. Like
+# operators.py, this file's source is included in the generated modules, so
+# it can't know about ranges or arrays: ranges given to MIN, MAX, SUM and
+# AVERAGE are lists of the values of their non-empty cells.
+#
+# IF, IFERROR and CHOOSE only evaluate the arguments they use, so they're
+# written as pick_* functions given the number of arguments and a function
+# that returns the value of the argument with a given index.
+
+def logical_function(args, name, combine):
+    if len(args) < 1:
+        return CellError(CellErrorType.TYPE_ERROR, f"{name} requires at least 1 argument")
+
+    errors = []
+    bools = []
+    for a in args:
+        b = to_bool(a)
+
+        if isinstance(b, CellError) and b not in errors:
+            errors.append(b)
+
+        bools.append(b)
+
+    if len(errors) > 0:
+        return propagate_errors(errors)
+    return combine(bools)
+
+def func_and(args):
+    return logical_function(args, "AND", lambda bools: all(bools))
+
+def func_or(args):
+    return logical_function(args, "OR", lambda bools: any(bools))
+
+def func_xor(args):
+    return logical_function(args, "XOR", lambda bools: not sum(1 for b in bools if b) % 2 == 0)
+
+def func_not(args):
+    if len(args) != 1:
+        return CellError(CellErrorType.TYPE_ERROR, "NOT requires exactly 1 argument")
+
+    b = to_bool(args[0])
+
+    if isinstance(b, CellError):
+        return b
+    else:
+        return not b
+
+def func_exact(args):
+    if len(args) != 2:
+        return CellError(CellErrorType.TYPE_ERROR, "EXACT requires exactly 2 argument")
+
+    if isinstance(args[0], CellError) or isinstance(args[1], CellError):
+        return propagate_errors([args[0], args[1]])
+
+    return to_string(args[0]) == to_string(args[1])
+
+def pick_if(count, get):
+    if count < 2 or count > 3:
+        return CellError(CellErrorType.TYPE_ERROR, "IF requires exactly 2 or 3 arguments")
+
+    b = to_bool(get(0))
+
+    if isinstance(b, CellError):
+        return b
+
+    if b:
+        return get(1)
+    elif count == 3:
+        return get(2)
+    return False
+
+def pick_iferror(count, get):
+    if count < 1 or count > 2:
+        return CellError(CellErrorType.TYPE_ERROR, "IFERROR requires exactly 1 or 2 arguments")
+
+    first = get(0)
+
+    if not isinstance(first, CellError):
+        return first
+    elif count == 2:
+        return get(1)
+    return ""
+
+def choose_index(index_org, count: int):
+    # the argument of a CHOOSE call with count arguments that its first
+    # argument's value picks, or the error it gives
+    try:
+        if isinstance(index_org, CellError):
+            return index_org
+
+        # bools in string format
+        if isinstance(index_org, str):
+            if index_org.lower() == "true":
+                index_org = 1
+            elif index_org.lower() == "false":
+                index_org = 0
+
+        index = int(index_org)
+        if abs(float(index_org) - index) > 0:
+            raise TypeError
+
+        if index <= 0 or index >= count:
+            return CellError(CellErrorType.TYPE_ERROR, "index is out of bounds")
+
+        return index
+    except (TypeError, ValueError):
+        return CellError(CellErrorType.TYPE_ERROR, "index is not an integer")
+
+def pick_choose(count, get):
+    if count < 2:
+        return CellError(CellErrorType.TYPE_ERROR, "CHOOSE requires at least 2 arguments")
+
+    index = choose_index(get(0), count)
+    if isinstance(index, CellError):
+        return index
+    return get(index)
+
+def func_if(args):
+    return pick_if(len(args), args.__getitem__)
+
+def func_iferror(args):
+    return pick_iferror(len(args), args.__getitem__)
+
+def func_choose(args):
+    return pick_choose(len(args), args.__getitem__)
+
+def func_isblank(args):
+    if len(args) != 1:
+        return CellError(CellErrorType.TYPE_ERROR, "ISBLANK requires exactly 1 argument")
+
+    # https://piazza.com/class/lqvau3tih6k26o/post/43
+    if isinstance(args[0], CellError):
+        if args[0].get_type() in [CellErrorType.PARSE_ERROR, CellErrorType.CIRCULAR_REFERENCE]:
+            return args[0]
+        else:
+            return False
+
+    return args[0] is None
+
+def func_iserror(args):
+    if len(args) != 1:
+        return CellError(CellErrorType.TYPE_ERROR, "ISERROR requires exactly 1 argument")
+
+    return isinstance(args[0], CellError)
+
+def numeric_function(args, name, f):
+    if len(args) < 1:
+        return CellError(CellErrorType.TYPE_ERROR, f"{name} requires at least 1 argument")
+
+    numbers = []
+    for arg in args:
+        if isinstance(arg, list):
+            # empty cells are skipped anyway
+            numbers += arg
+        else:
+            numbers.append(to_number(arg))
+
+    numbers = [to_number(n) for n in numbers if n is not None]
+
+    e = propagate_errors(numbers)
+
+    if e is not None:
+        return e
+
+    return f(numbers)
+
+def func_min(args):
+    return numeric_function(args, "custom_min", lambda nums: min(nums) if len(nums) > 0 else decimal.Decimal(0))
+
+def func_max(args):
+    return numeric_function(args, "custom_max", lambda nums: max(nums) if len(nums) > 0 else decimal.Decimal(0))
+
+def func_sum(args):
+    return numeric_function(args, "sum", sum)
+
+def func_average(args):
+    def average(nums):
+        if len(nums) == 0:
+            return CellError(CellErrorType.DIVIDE_BY_ZERO, "")
+        return sum(nums) / len(nums)
+    return numeric_function(args, "average", average)
@@ -1,9 +1,17 @@
+import concurrent.futures
+import copy
+import functools
 import json
 from typing import List, Dict, Any, Optional, Tuple, Callable, Iterable, TextIO, Set
 
 from . import base_types
+from . import batch
 from . import cell
+from . import memo
+from . import parallel
+from . import scheduler
 from . import sheet
+from . import user_functions
 
 from .error     import CellError, CellErrorType
 from .graph     import Graph
@@ -40,6 +48,40 @@ class Workbook:
         # function to call when cells update
         self.notify_functions = []
 
+        # In manual calculation mode edits only update contents and the
+        # dependency graph; values are brought up to date by recalculate().
+        self.manual_calculation: bool = False
+
+        # (sheet, location) of every cell edited in manual calculation mode,
+        # mapped to the value the cell had when it was last reported to the
+        # notify functions
+        self.dirty_cells: Dict[Tuple[sheet.Sheet, Tuple[int, int]], Any] = {}
+
+        # Process pool for recalculating large independent groups of cells.
+        # Disabled while parallel_workers is 0.
+        self.parallel_workers: int = 0
+        self.parallel_min_cells: int = 1000
+        self.process_pool: Optional[concurrent.futures.ProcessPoolExecutor] = None
+
+        # sort_region calls with at least this many rows sort in the process
+        # pool too, while it's enabled
+        self.parallel_sort_min_rows: int = 5000
+
+        # cells that started or stopped holding part of an array value, or
+        # whose part of it changed, mapped to their values before that, while
+        # they weren't being recomputed themselves (see Cell.spill)
+        self.spill_changes: Dict[cell.Cell, Any] = {}
+
+        # recomputes dirty cells level by level; its dispatch_level hook
+        # decides how each level is evaluated
+        self.scheduler = scheduler.RecalcScheduler()
+
+        # results of recent calls to pure functions whose arguments may not
+        # have changed since; None while caching is turned off
+        self.function_cache: Optional[memo.FunctionCache] = memo.FunctionCache(1024)
+
+        user_functions.workbooks.add(self)
+
     def copy_cell_values(self, cells: Set[cell.Cell]) -> Dict[cell.Cell, Any]:
         return {c.location: c.value for c in cells}
 
@@ -104,14 +146,19 @@ class Workbook:
         if sheet_name.lower() in self.sheet_map:
             raise ValueError
 
-        new_sheet = Sheet(self, sheet_name)
-        self.sheet_map[sheet_name.lower()] = new_sheet
-        self.sheets.append(new_sheet)
-
+        self.add_sheet(sheet_name)
         self.update_cells_referencing_sheet(sheet_name)
 
         return (len(self.sheets)-1, sheet_name)
 
+    def add_sheet(self, sheet_name: str) -> sheet.Sheet:
+        # Add an empty sheet with an already validated name, without updating
+        # the cells that reference it.
+        new_sheet = Sheet(self, sheet_name)
+        self.sheet_map[sheet_name.lower()] = new_sheet
+        self.sheets.append(new_sheet)
+        return new_sheet
+
     def del_sheet(self, sheet_name: str) -> None:
         # Delete the spreadsheet with the specified name.
         #
@@ -163,16 +210,28 @@ class Workbook:
         
         r = Reference.from_string(sheet_name, location).check_bounds().check_absolute()
 
+        if self.manual_calculation:
+            sheet = self.sheet_map[sheet_name.lower()]
+            cell = sheet.get_cell(r)
+            self.mark_dirty({cell} | sheet.get_spills_covering({cell}))
+            sheet.set_cell_contents(self, r, contents, evaluate_formulas=False)
+            return
+
         old_value = self.get_cell_value(sheet_name, location)
 
-        cell = self.sheet_map[sheet_name.lower()].set_cell_contents(self, r, contents)
+        sheet = self.sheet_map[sheet_name.lower()]
+        anchors = sheet.get_spills_covering({sheet.get_cell(r)})
+
+        cell = sheet.set_cell_contents(self, r, contents)
 
         new_value = self.get_cell_value(sheet_name, location)
 
         if self.check_changed_cells(old_value, new_value):
             self.notify({cell})
 
-        self.update_ancestors({cell})
+        # arrays that this cell is now in the way of, or no longer in the
+        # way of, are spilled again
+        self.update_cells(anchors | self.dependency_graph.get_ancestors_of_set({cell} | anchors) - {cell})
 
     def get_cell_contents(self, sheet_name: str, location: str) -> Optional[str]:
         # Return the contents of the specified cell on the specified sheet.
@@ -221,21 +280,81 @@ class Workbook:
     def get_cell(self, ref: Reference):
         return self.sheet_map[ref.sheet_name.lower()].get_cell(ref)
 
+    def set_parallel_recalculation(self, workers: int, min_cells: int = 1000) -> None:
+        # Recalculate groups of at least min_cells cells that don't depend on
+        # each other in a pool of the given number of worker processes.  A
+        # workers value of 0 turns parallel recalculation off.
+        if workers < 0 or min_cells < 1:
+            raise ValueError
+
+        if self.process_pool is not None and workers != self.parallel_workers:
+            self.process_pool.shutdown()
+            self.process_pool = None
+
+        self.parallel_workers = workers
+        self.parallel_min_cells = min_cells
+
+    def set_parallel_sort(self, min_rows: int) -> None:
+        # Sort regions of at least min_rows rows in chunks on the process pool
+        # set up by set_parallel_recalculation().  Regions are sorted in this
+        # process while parallel recalculation is off.
+        if min_rows < 1:
+            raise ValueError
+
+        self.parallel_sort_min_rows = min_rows
+
+    def set_function_cache_size(self, size: int) -> None:
+        # Keep the results of up to size calls to pure functions that go
+        # through ranges, like SUM or VLOOKUP, to reuse while their arguments
+        # and the contents of their ranges don't change.  A size of 0 turns
+        # the cache off.
+        if size < 0:
+            raise ValueError
+
+        self.function_cache = memo.FunctionCache(size) if size > 0 else None
+
+    def get_process_pool(self) -> concurrent.futures.ProcessPoolExecutor:
+        if self.process_pool is None:
+            self.process_pool = concurrent.futures.ProcessPoolExecutor(max_workers=self.parallel_workers)
+        return self.process_pool
+
+    def recompute_cells(self, nodes):
+        if self.parallel_workers > 0 and len(nodes) >= self.parallel_min_cells:
+            parallel.recompute_parallel(self, nodes)
+        else:
+            self.recompute_cells_serial(nodes)
+
+    def recompute_cells_serial(self, nodes):
+        self.scheduler.recompute(self, nodes)
+
     def update_cells(self, nodes):
         saved_values = self.copy_cell_values(nodes)
 
-        order = self.dependency_graph.get_topological_order()
+        # cells spilled into before this update keep their earlier values
+        for c in nodes:
+            if c in self.spill_changes:
+                saved_values[c.location] = self.spill_changes.pop(c)
 
-        for c in order:
-            if c in nodes:
-                c.recompute_value(self)
+        self.recompute_cells(nodes)
 
-        for node in nodes:
-            if node in order:
-                continue
-            node.recompute_value(self)
+        for c in nodes:
+            self.spill_changes.pop(c, None)
 
         self.notify(self.find_changed_cells(saved_values))
+        self.update_spilled_cells()
+
+    def update_spilled_cells(self):
+        # Notify about the cells that arrays spilled into or out of during the
+        # last update, which weren't part of it, and update the cells that
+        # depend on them. That may spill more arrays, which are handled by the
+        # nested update.
+        if len(self.spill_changes) == 0:
+            return
+
+        changes, self.spill_changes = self.spill_changes, {}
+
+        self.notify([c for c, value in changes.items() if self.check_changed_cells(value, c.value)])
+        self.update_cells(self.dependency_graph.get_ancestors_of_set(changes.keys()))
 
     def update_ancestors(self, nodes):
         self.update_cells(self.dependency_graph.get_ancestors_of_set(nodes))
@@ -246,6 +365,92 @@ class Workbook:
             self.update_cells(cells)
             self.update_ancestors(cells)
 
+    def update_cells_using_function(self, name: str) -> None:
+        # Enter the formulas that call the named function again after it has
+        # been registered or unregistered, since how they are parsed, folded
+        # and linked depends on the function, and recompute them (or mark
+        # them dirty in manual calculation mode).
+        for s in list(self.sheets):
+            cells = [c for c in s.cells.values()
+                     if c.formula_tree is not None and user_functions.uses_function(c.formula_tree, {name})]
+            for c in cells:
+                self.set_cell_contents(s.sheet_name, c.location.location_string(), c.contents)
+
+    def update_relinked_cells(self, cells):
+        # Update cells whose references may resolve to different cells than
+        # before, along with their ancestors. The cells are relinked first so
+        # that the recalculation order and cycles take the new links into
+        # account.
+        if len(cells) == 0:
+            return
+
+        for c in cells:
+            c.check_references(self)
+
+        self.update_cells(cells | self.dependency_graph.get_ancestors_of_set(cells))
+
+    def mark_dirty(self, cells):
+        # Remember cells that are about to be edited in manual calculation
+        # mode. Must be called before the edit so the value the notify
+        # functions last saw is kept.
+        for c in cells:
+            self.dirty_cells.setdefault((c.sheet, c.location.tuple()), c.value)
+
+    def set_manual_calculation(self, manual: bool) -> None:
+        # Switch between automatic and manual calculation.  In manual mode
+        # set_cell_contents(), move_cells(), copy_cells() and sort_region()
+        # update cell contents and the dependency graph, but cell values are
+        # not recomputed (and no notifications are sent) until recalculate()
+        # is called.  Operations on whole sheets still recalculate right away.
+        #
+        # Switching back to automatic calculation recalculates everything
+        # that was left dirty.
+        self.manual_calculation = manual
+
+        if not manual:
+            self.recalculate()
+
+    def recalculate(self, sheet_name: Optional[str] = None) -> None:
+        # Recompute every cell made dirty by edits in manual calculation mode,
+        # along with the cells that depend on them, in one topological pass.
+        # The notify functions are called once with all cells whose values
+        # changed since they were last reported.
+        #
+        # If sheet_name is given, only the dirty cells on that sheet are
+        # recomputed; dirty cells on other sheets stay dirty.
+        #
+        # If the specified sheet name is not found, a KeyError is raised.
+        only_sheet = None
+        if sheet_name is not None:
+            only_sheet = self.sheet_map[sheet_name.lower()]
+
+        saved_values = {}
+        for (s, location), value in self.dirty_cells.items():
+            # skip cells on sheets that have since been deleted
+            if self.sheet_map.get(s.sheet_name.lower()) is s:
+                saved_values[s.cells[location]] = value
+
+        for c in self.dependency_graph.get_ancestors_of_set(saved_values.keys()):
+            if c in self.spill_changes:
+                saved_values.setdefault(c, self.spill_changes.pop(c))
+            saved_values.setdefault(c, c.value)
+
+        if only_sheet is None:
+            nodes = set(saved_values.keys())
+        else:
+            nodes = set(filter(lambda c: c.sheet is only_sheet, saved_values.keys()))
+
+        self.dirty_cells = {}
+        self.mark_dirty(saved_values.keys() - nodes)
+
+        self.recompute_cells(nodes)
+
+        for c in nodes:
+            self.spill_changes.pop(c, None)
+
+        self.notify([c for c in nodes if self.check_changed_cells(saved_values[c], c.value)])
+        self.update_spilled_cells()
+
     def check_cycles(self):
         cycles = self.dependency_graph.get_cycles()
         circular = set()
@@ -390,11 +595,26 @@ class Workbook:
         for c in sheet.cells.values():
             c.location.sheet_name = new_sheet_name
 
+        # Formulas that referenced the sheet by its old name still reference
+        # the same cells, so only their text changes. The cells that have to
+        # be recomputed are the ones whose references resolve differently
+        # now: references to the new name that used to be bad, and INDIRECT
+        # calls that looked up the old name by text.
+        changed = set()
+
+        if new_sheet_name.lower() in self.sheet_references.backward:
+            changed.update(self.sheet_references.get_backward_links(new_sheet_name.lower()))
+
         if sheet_name.lower() in self.sheet_references.backward:
-            for c in self.sheet_references.get_backward_links(sheet_name.lower()):
-                c.rename_sheet(self, sheet_name, new_sheet_name)
+            referencing = self.sheet_references.get_backward_links(sheet_name.lower())
+            self.sheet_references.rename_node(sheet_name.lower(), new_sheet_name.lower())
+
+            for c in referencing:
+                if sheet_name.lower() in c.runtime_sheets and parallel.uses_indirect(c.formula_tree):
+                    changed.add(c)
+                c.rename_sheet(sheet_name, new_sheet_name)
 
-        self.update_cells_referencing_sheet(new_sheet_name)
+        self.update_relinked_cells(changed)
 
     def move_sheet(self, sheet_name: str, index: int) -> None:
         # Move the specified sheet to the specified index in the workbook's
@@ -447,17 +667,135 @@ class Workbook:
             i += 1
             new_name = sheet_name + "_" + str(i)
 
-        self.new_sheet(new_name)
-        new_sheet = self.sheet_map[new_name.lower()]
+        new_sheet = self.add_sheet(new_name)
 
-        for c in sheet_object.cells.values():
-            new_sheet.get_cell(c.location).copy_cell(c, self, (0, 0))
+        # The copies share each cell's parsed formula, references and value
+        # with the original (see Cell.share_cell), so nothing is reparsed or
+        # re-evaluated here. Since the values are the same, only the cells
+        # whose links can't be shared are recomputed: those that used cells
+        # at runtime, and those that reference the new sheet's name.
+        changed = set()
+
+        if new_name.lower() in self.sheet_references.backward:
+            changed.update(self.sheet_references.get_backward_links(new_name.lower()))
+
+        clones = []
+        for location, c in sheet_object.cells.items():
+            if c.is_empty():
+                continue
+
+            clone = cell.Cell(new_sheet, Reference(new_name, location[0], location[1]))
+            new_sheet.cells[location] = clone
+            clone.share_cell(c)
+
+            if clone.formula_tree is not None:
+                clones.append((c, clone))
+
+        # link once every copy exists, so references between them resolve to
+        # the copies rather than to new empty cells
+        for c, clone in clones:
+            clone.check_references(self)
+
+            if len(c.runtime_cells) > 0 or len(c.runtime_sheets) > 0:
+                changed.add(clone)
+            elif c.spill_shape is not None:
+                # the array has to be spilled on the new sheet
+                changed.add(clone)
+            elif any(ref.sheet_name is not None and ref.sheet_name.lower() == new_name.lower() for ref in clone.all_refs):
+                # names the new sheet, which didn't exist for the original
+                changed.add(clone)
+
+        # the copy of a cell that still needs recalculating is dirty too
+        for s, location in list(self.dirty_cells.keys()):
+            if s is sheet_object:
+                self.mark_dirty({new_sheet.get_cell(Reference(new_name, location[0], location[1]))})
+
+        self.update_relinked_cells(changed)
 
-        self.update_cells_referencing_sheet(new_name)
         self.notify(new_sheet.cells.values())
 
         return (len(self.sheets) - 1, new_name)
-    
+
+    def fork(self) -> Any:
+        # returns Workbook
+
+        # Make an independent copy of the workbook, with the same sheets,
+        # contents and values, for trying out changes without affecting this
+        # workbook.  Like copy_sheet(), the copies share each cell's parsed
+        # formula (see Cell.share_cell) and value, so nothing is reparsed or
+        # re-evaluated; whichever workbook changes a formula first takes its
+        # own copy of it.  Cells left dirty in manual calculation mode are
+        # dirty in the fork too.
+        #
+        # Notify functions and the process pool are not shared with the fork.
+        wb = Workbook(self.workbook_name)
+        wb.manual_calculation = self.manual_calculation
+        wb.parallel_workers = self.parallel_workers
+        wb.parallel_min_cells = self.parallel_min_cells
+        wb.parallel_sort_min_rows = self.parallel_sort_min_rows
+        wb.set_function_cache_size(0 if self.function_cache is None else self.function_cache.size)
+
+        sheet_copies = {s: wb.add_sheet(s.sheet_name) for s in self.sheets}
+
+        def copy_of(c):
+            new_sheet = sheet_copies[c.sheet]
+            return new_sheet.get_cell(Reference(new_sheet.sheet_name, c.location.col, c.location.row))
+
+        copies = []
+        for s in self.sheets:
+            for c in s.cells.values():
+                if c.is_empty() and c.spilled_from is None:
+                    continue
+
+                clone = copy_of(c)
+                clone.share_cell(c)
+                copies.append((c, clone))
+
+        # link once every copy exists, so references between them resolve to
+        # the copies rather than to new empty cells
+        for c, clone in copies:
+            clone.check_references(wb)
+
+            if len(c.runtime_cells) > 0 or len(c.runtime_sheets) > 0:
+                clone.set_runtime_links(wb, set(copy_of(other) for other in c.runtime_cells), set(c.runtime_sheets))
+
+            if c.spill_shape is not None:
+                clone.spill_shape = c.spill_shape
+                clone.sheet.spill_anchors.add(clone)
+
+            for other in c.spill_cells:
+                spilled = copy_of(other)
+                spilled.spilled_from = clone
+                spilled.sheet.set_occupied(spilled, True)
+                wb.dependency_graph.link(spilled, clone)
+                clone.spill_cells.append(spilled)
+
+        for (s, location), value in self.dirty_cells.items():
+            if s in sheet_copies:
+                wb.dirty_cells[(sheet_copies[s], location)] = value
+
+        return wb
+
+    def run_scenarios(self, scenarios: List[Dict[Tuple[str, str], Optional[str]]],
+                      outputs: List[Tuple[str, str]]) -> List[List[Any]]:
+        # Try out each of the given scenarios on its own fork of the workbook,
+        # and return the values of the output cells for each one.  A scenario
+        # maps (sheet name, location) pairs to the contents to set those cells
+        # to; only the cells affected by a scenario are recomputed for it.
+        # outputs is a list of (sheet name, location) pairs.
+        #
+        # This workbook isn't changed.  While parallel recalculation is on
+        # (see set_parallel_recalculation()), the scenarios are split between
+        # the workers of the process pool, unless functions have been added
+        # with sheets.register_function(), which the workers don't have.
+        #
+        # If a sheet name is not found, a KeyError is raised.
+        # If a location is invalid, a ValueError is raised.
+        if self.parallel_workers > 0 and len(scenarios) > 1 and not user_functions.any_registered():
+            return parallel.run_scenarios(self, scenarios, outputs)
+
+        return [parallel.run_scenario(self, overrides, outputs) for overrides in scenarios]
+
     def move_or_copy(self, sheet_name: str, start_location: str,
             end_location: str, to_location: str, to_sheet: Optional[str] = None, is_move: bool = False) -> None:
 
@@ -481,35 +819,75 @@ class Workbook:
         offset = (to_start_tuple[0] - start_tuple[0], to_start_tuple[1] - start_tuple[1])
         size = (end_tuple[0] - start_tuple[0], end_tuple[1] - start_tuple[1])
 
-        _to_end_ref = to_start_ref.moved(size)
+        to_end_ref = to_start_ref.moved(size).check_bounds()
 
-        if offset[0] < 0:
-            col_iter = range(0, size[0] + 1)
-        else:
-            col_iter = range(size[0], -1, -1)
+        sources = sheet.get_cells_in_region(start_tuple, end_tuple)
 
-        if offset[1] < 0:
-            row_iter = range(0, size[1] + 1)
-        else:
-            row_iter = range(size[1], -1, -1)
+        moves = []
+        for location, c in sources:
+            to_cell = to_sheet.get_cell(Reference(to_sheet_name, location[0] + offset[0], location[1] + offset[1]))
+            moves.append((c, to_cell, offset))
+
+        cleared = [c for _, c in to_sheet.get_cells_in_region(to_start_ref.tuple(), to_end_ref.tuple())]
+        if is_move:
+            cleared += [c for _, c in sources]
+
+        self.relocate_cells(moves, cleared, is_move)
+
+    def relocate_cells(self, moves, cleared, is_move):
+        # Move or copy cells as a unit. moves is a list of
+        # (from cell, to cell, offset) and cleared is every cell that is
+        # overwritten or left empty. The non-empty cells are snapshotted,
+        # everything in cleared is emptied, then each destination cell gets
+        # its snapshot with the formula's references moved in place. Cells
+        # stay where they are in the graph, since other formulas reference
+        # locations rather than contents.
+        # cells holding parts of arrays stay where they are; the arrays are
+        # spilled again from wherever their formulas end up
+        moves = [(f, t, offset) for f, t, offset in moves if f.spilled_from is None]
+        cleared = [c for c in cleared if c.spilled_from is None]
+
+        snapshots = []
+        for from_cell, to_cell, offset in moves:
+            snapshot = copy.copy(from_cell)
+            snapshots.append((snapshot, to_cell, offset))
+
+            if not is_move:
+                # the source keeps its formula, so the tree is shared until
+                # one of them is rewritten
+                from_cell.owns_tree = False
+                snapshot.owns_tree = False
+
+        touched = set(cleared) | set(to_cell for _, to_cell, _ in moves)
+        for s in set(c.sheet for c in touched):
+            touched |= s.get_spills_covering(touched)
+
+        if self.manual_calculation:
+            self.mark_dirty(touched)
+        saved_values = {c: c.value for c in touched}
 
-        updated = set()
-        for col in col_iter:
-            for row in row_iter:
-                from_ref = start_ref.moved((col, row))
-                from_cell = sheet.get_cell(from_ref)
+        for c in cleared:
+            c.set_contents(self, "")
 
-                to_ref = to_start_ref.moved((col, row))
-                to_cell = to_sheet.get_cell(to_ref)
-                to_cell.copy_cell(from_cell, self, offset)
+        for snapshot, to_cell, offset in snapshots:
+            to_cell.take_cell(snapshot, self, offset)
 
-                if is_move and to_cell is not from_cell:
-                    from_cell.set_contents(self, "")
+        if self.manual_calculation:
+            return
 
-                updated.add(to_cell)
-                updated.add(from_cell)
-        self.update_cells(updated)
-        self.update_ancestors(updated)
+        nodes = touched | self.dependency_graph.get_ancestors_of_set(touched)
+        for c in nodes:
+            if c in self.spill_changes:
+                saved_values.setdefault(c, self.spill_changes.pop(c))
+            saved_values.setdefault(c, c.value)
+
+        self.recompute_cells(nodes)
+
+        for c in nodes:
+            self.spill_changes.pop(c, None)
+
+        self.notify([c for c in nodes if self.check_changed_cells(saved_values[c], c.value)])
+        self.update_spilled_cells()
 
     def move_cells(self, sheet_name: str, start_location: str,
             end_location: str, to_location: str, to_sheet: Optional[str] = None) -> None:
@@ -647,7 +1025,6 @@ class Workbook:
         # If the sort_cols list is invalid in any way, a ValueError is raised.
 
         cell_range = CellRange(sheet_name, start_location, end_location).check_bounds().check_absolute()
-        cells = set(map(lambda ref: self.get_cell(ref), cell_range.generate()))
 
         if len(sort_cols) == 0:
             raise ValueError
@@ -665,12 +1042,40 @@ class Workbook:
 
             sort_cols_set.add(abs(col))
         
-        saved_values = self.copy_cell_values(cells)
-
         sheet_object = self.sheet_map[sheet_name.lower()]
-        sheet_object.sort_region(self, cell_range.start_ref, cell_range.end_ref, sort_cols)
 
-        self.notify(self.find_changed_cells(saved_values))
+        start = cell_range.start_ref.tuple()
+        end = cell_range.end_ref.tuple()
+
+        # every row moves by its own offset; the rest is the same as moving
+        # the region onto itself
+        sort_positions = None
+        if self.parallel_workers > 0 and end[1] - start[1] + 1 >= self.parallel_sort_min_rows:
+            sort_positions = functools.partial(parallel.sort_positions, self)
 
-        self.update_cells(cells)
-        self.update_ancestors(cells)
\ No newline at end of file
+        order = sheet_object.sort_rows(start, end, sort_cols, sort_positions)
+        to_rows = {from_row: to_row for to_row, from_row in zip(range(start[1], end[1] + 1), order)}
+
+        cleared = [c for _, c in sheet_object.get_cells_in_region(start, end)]
+
+        moves = []
+        for c in cleared:
+            to_row = to_rows[c.location.row]
+            to_cell = sheet_object.get_cell(Reference(sheet_object.sheet_name, c.location.col, to_row))
+            moves.append((c, to_cell, (0, to_row - c.location.row)))
+
+        self.relocate_cells(moves, cleared, True)
+
+    def evaluate_batch(self, inputs: List[Tuple[str, str]], outputs: List[Tuple[str, str]], rows) -> List[List[Any]]:
+        # Evaluate the workbook as a function of the input cells for each of
+        # the given rows of input values, and return the values of the output
+        # cells for each row. inputs and outputs are (sheet name, location)
+        # pairs; rows may be a list of lists or a 2-D NumPy array.
+        #
+        # The workbook isn't changed: the formulas depending on the inputs are
+        # evaluated over all of the rows at once, apart from the stored values.
+        #
+        # If a sheet name is not found, a KeyError is raised.
+        # If a location is invalid or a row doesn't have one value per input
+        # cell, a ValueError is raised.
+        return batch.evaluate_batch(self, inputs, outputs, rows)
@@ -0,0 +1,82 @@
+#! /usr/bin/env python3
+import unittest
+
+import sheets
+import decimal
+
+class TestClass(unittest.TestCase):
+
+    def test_spill(self):
+        wb = sheets.Workbook()
+        _, n = wb.new_sheet()
+
+        for row in range(1, 4):
+            wb.set_cell_contents(n, f"A{row}", str(row))
+            wb.set_cell_contents(n, f"B{row}", str(10 * row))
+
+        wb.set_cell_contents(n, "C1", "=A1:A3*B1:B3")
+        wb.set_cell_contents(n, "D1", "=C3+1")
+        wb.set_cell_contents(n, "D2", "=SUM(C:C)")
+
+        self.assertEqual([wb.get_cell_value(n, f"C{row}") for row in range(1, 4)],
+                         [decimal.Decimal(10), decimal.Decimal(40), decimal.Decimal(90)])
+        self.assertEqual(wb.get_cell_contents(n, "C2"), None)
+        self.assertEqual(wb.get_cell_value(n, "D1"), decimal.Decimal(91))
+        self.assertEqual(wb.get_cell_value(n, "D2"), decimal.Decimal(140))
+        self.assertEqual(wb.get_sheet_extent(n), (4, 3))
+
+        changed = []
+        wb.notify_cells_changed(lambda _wb, locations: changed.extend(locations))
+
+        wb.set_cell_contents(n, "A3", "5")
+
+        self.assertEqual(wb.get_cell_value(n, "C3"), decimal.Decimal(150))
+        self.assertEqual(wb.get_cell_value(n, "D1"), decimal.Decimal(151))
+        self.assertEqual(wb.get_cell_value(n, "D2"), decimal.Decimal(200))
+        self.assertEqual(sorted(changed), [(n, "a3"), (n, "c3"), (n, "d1"), (n, "d2")])
+
+        wb.set_cell_contents(n, "E1", "=SUM(A1:A3*B1:B3)")
+        self.assertEqual(wb.get_cell_value(n, "E1"), decimal.Decimal(200))
+
+        # a larger array spills into more cells
+        wb.set_cell_contents(n, "A4", "1")
+        wb.set_cell_contents(n, "C1", '=A1:A4&"!"')
+        self.assertEqual(wb.get_cell_value(n, "C4"), "1!")
+
+        wb.set_cell_contents(n, "C1", "=A1")
+        self.assertEqual(wb.get_cell_value(n, "C4"), None)
+        self.assertEqual(wb.get_cell_value(n, "D1"), decimal.Decimal(1))
+        self.assertEqual(wb.get_sheet_extent(n), (5, 4))
+
+    def test_blocked_spill(self):
+        wb = sheets.Workbook()
+        _, n = wb.new_sheet()
+
+        for row in range(1, 4):
+            wb.set_cell_contents(n, f"A{row}", str(row))
+
+        wb.set_cell_contents(n, "B1", "=A1:A3+1")
+        wb.set_cell_contents(n, "C1", "=B3")
+
+        wb.set_cell_contents(n, "B3", "x")
+        self.assertEqual(wb.get_cell_value(n, "B1").get_type(), sheets.CellErrorType.BAD_REFERENCE)
+        self.assertEqual(wb.get_cell_value(n, "B2"), None)
+        self.assertEqual(wb.get_cell_value(n, "C1"), "x")
+
+        wb.set_cell_contents(n, "B3", None)
+        self.assertEqual(wb.get_cell_value(n, "B1"), decimal.Decimal(2))
+        self.assertEqual(wb.get_cell_value(n, "C1"), decimal.Decimal(4))
+
+        # moving the formula moves the array, and the array's own cells are
+        # left where they are
+        wb.move_cells(n, "B1", "B3", "E1")
+        self.assertEqual(wb.get_cell_value(n, "B2"), None)
+        self.assertEqual(wb.get_cell_contents(n, "E1"), "=d1:d3 + 1")
+        self.assertEqual(wb.get_cell_value(n, "E3"), decimal.Decimal(1))
+
+        # an array that reads its own cells is circular
+        wb.set_cell_contents(n, "F1", "=F2:F3")
+        self.assertEqual(wb.get_cell_value(n, "F1").get_type(), sheets.CellErrorType.CIRCULAR_REFERENCE)
+
+if __name__ == "__main__":
+        unittest.main()
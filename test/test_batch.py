@@ -0,0 +1,118 @@
+#! /usr/bin/env python3
+import unittest
+
+import sheets
+import decimal
+
+class TestClass(unittest.TestCase):
+
+    def test_evaluate_batch(self):
+        wb = sheets.Workbook()
+        _, n = wb.new_sheet()
+
+        wb.set_cell_contents(n, "A1", "1")
+        wb.set_cell_contents(n, "A2", "2")
+        wb.set_cell_contents(n, "B1", "=A1*2+A2")
+        wb.set_cell_contents(n, "B2", '=IF(A1>2, SUM(A1:A2), "small")')
+        wb.set_cell_contents(n, "B3", '=B1&"!"')
+        wb.set_cell_contents(n, "B4", "=MAX(A1, B1)")
+
+        inputs = [(n, "A1"), (n, "a2")]
+        outputs = [(n, "B1"), (n, "B2"), (n, "B3"), (n, "B4")]
+        rows = [[1, 2], [3, decimal.Decimal(4)], [2.5, "x"]]
+
+        results = wb.evaluate_batch(inputs, outputs, rows)
+
+        # the same values as setting the inputs one row at a time
+        expected = []
+        other = sheets.Workbook()
+        other.new_sheet(n)
+        for location in ["B1", "B2", "B3", "B4"]:
+            other.set_cell_contents(n, location, wb.get_cell_contents(n, location))
+        for a1, a2 in rows:
+            other.set_cell_contents(n, "A1", str(a1))
+            other.set_cell_contents(n, "A2", str(a2))
+            expected.append([other.get_cell_value(n, location) for location in ["B1", "B2", "B3", "B4"]])
+
+        def comparable(values):
+            return [v.get_type() if isinstance(v, sheets.CellError) else v for v in values]
+
+        self.assertEqual([comparable(row) for row in results], [comparable(row) for row in expected])
+        self.assertEqual(results[1], [decimal.Decimal(10), decimal.Decimal(7), "10!", decimal.Decimal(10)])
+        self.assertEqual(results[2][0].get_type(), sheets.CellErrorType.TYPE_ERROR)
+
+        # the workbook itself is unchanged
+        self.assertEqual(wb.get_cell_value(n, "A1"), decimal.Decimal(1))
+        self.assertEqual(wb.get_cell_value(n, "B1"), decimal.Decimal(4))
+        self.assertEqual(wb.get_cell_value(n, "B2"), "small")
+        self.assertEqual(wb.get_cell_value(n, "B3"), "4!")
+
+        with self.assertRaises(ValueError):
+            wb.evaluate_batch(inputs, outputs, [[1]])
+
+    def test_spilled_cells(self):
+        wb = sheets.Workbook()
+        _, n = wb.new_sheet()
+
+        wb.set_cell_contents(n, "A1", "1")
+        wb.set_cell_contents(n, "A2", "2")
+        wb.set_cell_contents(n, "B1", "=A1:A2*10")
+        wb.set_cell_contents(n, "C2", "=B2+1")
+
+        outputs = [(n, "B1"), (n, "B2"), (n, "C2")]
+        results = wb.evaluate_batch([(n, "A2")], outputs, [["5"], ["7"]])
+
+        expected = []
+        for a2 in ["5", "7"]:
+            other = wb.fork()
+            other.set_cell_contents(n, "A2", a2)
+            expected.append([other.get_cell_value(n, location) for _, location in outputs])
+
+        self.assertEqual(results, expected)
+        self.assertEqual(results[1], [decimal.Decimal(10), decimal.Decimal(70), decimal.Decimal(71)])
+        self.assertEqual(wb.get_cell_value(n, "C2"), decimal.Decimal(21))
+
+    def test_empty_inputs_in_ranges(self):
+        wb = sheets.Workbook()
+        _, n = wb.new_sheet()
+
+        wb.set_cell_contents(n, "A2", "1")
+        wb.set_cell_contents(n, "B1", "=SUM(A1:A2)")
+        wb.set_cell_contents(n, "B2", "=COUNTIF(A:A, \">2\")")
+        wb.set_cell_contents(n, "B3", "=MAX(A:A)")
+
+        # A1 is empty, and A9 isn't in the workbook at all
+        inputs = [(n, "A1"), (n, "A9")]
+        outputs = [(n, "B1"), (n, "B2"), (n, "B3")]
+        rows = [[7, None], [3, 10], [None, None]]
+        results = wb.evaluate_batch(inputs, outputs, rows)
+
+        expected = []
+        for row in rows:
+            other = wb.fork()
+            for (_, location), value in zip(inputs, row):
+                other.set_cell_contents(n, location, None if value is None else str(value))
+            expected.append([other.get_cell_value(n, location) for _, location in outputs])
+
+        self.assertEqual(results, expected)
+        self.assertEqual(results[1], [decimal.Decimal(4), decimal.Decimal(2), decimal.Decimal(10)])
+        self.assertEqual(wb.get_cell_value(n, "B3"), decimal.Decimal(1))
+
+    def test_cycle_through_lazy_branch(self):
+        wb = sheets.Workbook()
+        _, n = wb.new_sheet()
+
+        wb.set_cell_contents(n, "A1", "1")
+        wb.set_cell_contents(n, "B1", "=IF(A1 > 0, A1 * 2, B2)")
+        wb.set_cell_contents(n, "B2", "=B1 + 1")
+        wb.set_cell_contents(n, "C1", "=A1 * 3")
+        self.assertEqual(wb.get_cell_value(n, "B2"), decimal.Decimal(3))
+
+        # B1 and B2 reach each other through the branch that isn't taken, so
+        # they keep their workbook values; C1 is evaluated as usual
+        results = wb.evaluate_batch([(n, "A1")], [(n, "B1"), (n, "B2"), (n, "C1")], [[5], [7]])
+        self.assertEqual(results, [[decimal.Decimal(2), decimal.Decimal(3), decimal.Decimal(15)],
+                                   [decimal.Decimal(2), decimal.Decimal(3), decimal.Decimal(21)]])
+
+if __name__ == "__main__":
+        unittest.main()
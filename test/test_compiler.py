@@ -0,0 +1,137 @@
+#! /usr/bin/env python3
+import unittest
+import random
+
+import sheets
+import decimal
+
+from sheets import compiler
+
+class TestClass(unittest.TestCase):
+
+    def test_compiled_module(self):
+        wb = sheets.Workbook()
+        _, n = wb.new_sheet()
+        _, m = wb.new_sheet("Other Sheet")
+
+        wb.set_cell_contents(n, "A3", "10")
+        wb.set_cell_contents(n, "B1", "=A1*2+A2/(1+2)")
+        wb.set_cell_contents(n, "B2", '=IF(A1>2, SUM(A1:A3), "small")')
+        wb.set_cell_contents(n, "B3", '=B1&"x"&VERSION()')
+        wb.set_cell_contents(n, "B4", f"=MAX(A1, B1)+'{m}'!A1")
+        wb.set_cell_contents(m, "A1", f"={n}!A1*3")
+        wb.set_cell_contents(n, "B5", "=AVERAGE(A:A)+C1")
+        wb.set_cell_contents(n, "B6", "=AND(A1, NOT(A2), OR(ISBLANK(A2), ISERROR(B1)))")
+        wb.set_cell_contents(n, "B7", "=CHOOSE(A1, A2, -A2, IFERROR(1/A1, \"none\"))&EXACT(A1, A2)")
+        wb.set_cell_contents(n, "B8", "=XOR(A1, A2) & MIN(A1:A2, Z1) & NOSUCHFUNCTION(A1)")
+        wb.set_cell_contents(n, "B9", "=A1 = A2")
+        wb.set_cell_contents(n, "C1", "=1+2*3")
+
+        inputs = [(n, "A1"), (n, "A2")]
+        outputs = [(n, f"B{row}") for row in range(1, 10)] + [(n, "C1"), (m, "A1")]
+
+        source = compiler.compile_workbook(wb, inputs, outputs)
+        self.assertNotIn("import sheets", source)
+        self.assertNotIn("from .", source)
+
+        module = {}
+        exec(source, module)
+
+        def comparable(value):
+            if hasattr(value, "get_type"):
+                return (value.get_type().name, value.get_detail())
+            return (type(value), value)
+
+        rng = random.Random(45)
+        contents = [None, "0", "1", "2", "3", "2.50", "-1", "x", "'3", "true", "FALSE", "#REF!", "#div/0!"]
+        for _ in range(60):
+            a1, a2 = rng.choice(contents), rng.choice(contents)
+            wb.set_cell_contents(n, "A1", a1)
+            wb.set_cell_contents(n, "A2", a2)
+
+            expected = [wb.get_cell_value(sheet_name, location) for sheet_name, location in outputs]
+            self.assertEqual([comparable(v) for v in module["evaluate"](a1, a2)],
+                             [comparable(v) for v in expected], (a1, a2))
+
+        self.assertEqual(module["evaluate"]("2", None)[0], decimal.Decimal(4))
+
+        # formulas that read cells chosen at runtime can't be compiled
+        wb.set_cell_contents(n, "B10", '=INDIRECT("A" & A1)')
+        with self.assertRaises(ValueError):
+            compiler.compile_workbook(wb, inputs, [(n, "B10")])
+
+    def test_bad_sheet_reference(self):
+        wb = sheets.Workbook()
+        _, n = wb.new_sheet()
+
+        wb.set_cell_contents(n, "B1", "='Nope'!A1")
+        wb.set_cell_contents(n, "B2", "=A1 + B1")
+        wb.set_cell_contents(n, "B3", "=IFERROR(B1, A1 * 2)")
+
+        source = compiler.compile_workbook(wb, [(n, "A1")], [(n, "B2"), (n, "B3")])
+        module = {}
+        exec(source, module)
+
+        b2, b3 = module["evaluate"]("4")
+        # the module has its own copy of CellErrorType
+        self.assertEqual(b2.get_type().name, "BAD_REFERENCE")
+        self.assertEqual(b3, decimal.Decimal(8))
+
+    def test_functions_match_batch_evaluation(self):
+        wb = sheets.Workbook()
+        _, n = wb.new_sheet()
+        wb.set_cell_contents(n, "A3", "4")
+
+        formulas = {
+            "and": "AND(A1, A2)",
+            "or": "OR(A1, A2)",
+            "xor": "XOR(A1, A2, TRUE)",
+            "not": "NOT(A1)",
+            "exact": "EXACT(A1, A2)",
+            "if": "IF(A1, A2, -A2)",
+            "iferror": "IFERROR(1/A1, A2)",
+            "choose": "CHOOSE(A1, A2, \"two\", A3)",
+            "isblank": "ISBLANK(A1)",
+            "iserror": "ISERROR(A1 + A2)",
+            "min": "MIN(A1:A3, A2)",
+            "max": "MAX(A1:A3)",
+            "sum": "SUM(A1:A3, 1)",
+            "average": "AVERAGE(A1:A3)",
+            "version": "VERSION()",
+        }
+        self.assertEqual(set(formulas), compiler.COMPILED_FUNCTIONS)
+
+        outputs = []
+        for row, name in enumerate(sorted(formulas), start=1):
+            wb.set_cell_contents(n, f"B{row}", "=" + formulas[name])
+            outputs.append((n, f"B{row}"))
+
+        inputs = [(n, "A1"), (n, "A2")]
+        source = compiler.compile_workbook(wb, inputs, outputs)
+        module = {}
+        exec(source, module)
+
+        contents = [None, "0", "1", "2", "3", "2.5", "x", "true", "FALSE", "#REF!", "#div/0!"]
+        rows = [(a1, a2) for a1 in contents for a2 in contents]
+
+        # the batch is given the values the contents give in a cell
+        scratch = sheets.Workbook()
+        _, m = scratch.new_sheet()
+
+        def value(c):
+            scratch.set_cell_contents(m, "A1", c)
+            return scratch.get_cell_value(m, "A1")
+
+        expected = wb.evaluate_batch(inputs, outputs, [[value(a1), value(a2)] for a1, a2 in rows])
+
+        def comparable(value):
+            if hasattr(value, "get_type"):
+                return (value.get_type().name, str(value.get_detail()))
+            return (type(value), value)
+
+        for (a1, a2), row in zip(rows, expected):
+            self.assertEqual([comparable(v) for v in module["evaluate"](a1, a2)],
+                             [comparable(v) for v in row], (a1, a2))
+
+if __name__ == "__main__":
+        unittest.main()
@@ -1,7 +1,10 @@
 import unittest
+import unittest.mock
 import decimal
 import sheets
 
+from sheets import interp
+
 from typing import Tuple
 
 def to_excel_column(index: int) -> str:
@@ -310,5 +313,86 @@ class TestClass(unittest.TestCase):
 
     # test $ on only row/only column?
 
+    def test_move_without_reparse(self):
+        wb = sheets.Workbook()
+        num, name = wb.new_sheet()
+
+        wb.set_cell_contents(name, "A1", "=B1 + $B$1 + 'Other Sheet'!B1")
+        wb.set_cell_contents(name, "A2", "=A1 * 2")
+        wb.set_cell_contents(name, "B2", "3")
+
+        with unittest.mock.patch.object(interp, "parse_formula", side_effect=AssertionError), \
+             unittest.mock.patch.object(interp, "print_formula", wraps=interp.print_formula) as print_formula:
+            wb.move_cells(name, "A1", "A2", "A2")
+
+            self.assertEqual(print_formula.call_count, 0)
+            self.assertEqual(wb.get_cell_value(name, "A2").get_type(), sheets.CellErrorType.BAD_REFERENCE)
+            wb.new_sheet("Other Sheet")
+            self.assertEqual(wb.get_cell_value(name, "A3"), decimal.Decimal(6))
+
+            self.assertEqual(wb.get_cell_contents(name, "A2"), "=b2 + $b$1 + 'Other Sheet'!b2")
+            self.assertEqual(wb.get_cell_contents(name, "A3"), "=a2 * 2")
+            self.assertEqual(print_formula.call_count, 2)
+
+    def test_move_out_of_bounds_literal(self):
+        wb = sheets.Workbook()
+        num, name = wb.new_sheet()
+
+        wb.set_cell_contents(name, "B2", "=A1")
+        wb.move_cells(name, "B2", "B2", "A1")
+
+        self.assertEqual(wb.get_cell_contents(name, "A1"), "=#REF!")
+        self.assertEqual(wb.get_cell_value(name, "A1").get_type(), sheets.CellErrorType.BAD_REFERENCE)
+
+    def test_move_range_out_of_bounds(self):
+        wb = sheets.Workbook()
+        num, name = wb.new_sheet()
+
+        wb.set_cell_contents(name, "B2", "=VLOOKUP(B3, A1:C3, 2)")
+        wb.set_cell_contents(name, "C2", "=SUM(A1:C3)")
+        wb.move_cells(name, "B2", "C2", "A1")
+
+        # the whole range is #REF!, as the formula's text would be parsed
+        self.assertEqual(wb.get_cell_contents(name, "A1"), "=VLOOKUP(a2, #REF!, 2)")
+        self.assertEqual(wb.get_cell_contents(name, "B1"), "=SUM(#REF!)")
+        for location in ["A1", "B1"]:
+            value = wb.get_cell_value(name, location)
+            wb.set_cell_contents(name, location, wb.get_cell_contents(name, location))
+            self.assertEqual(value.get_type(), wb.get_cell_value(name, location).get_type())
+
+    def test_move_block_notifies_once(self):
+        wb = sheets.Workbook()
+        num, name = wb.new_sheet()
+
+        wb.set_cell_contents(name, "A1", "1")
+        wb.set_cell_contents(name, "A2", "=A1 + 1")
+        wb.set_cell_contents(name, "C1", "7")
+        wb.set_cell_contents(name, "D1", "=B2 * 10")
+
+        calls = []
+        wb.notify_cells_changed(lambda _wb, locations: calls.append(sorted(locations)))
+
+        wb.move_cells(name, "A1", "A2", "B1")
+
+        # C1 isn't in the target area, and D1 picks up the moved value
+        self.assertEqual(calls, [[(name, "a1"), (name, "a2"), (name, "b1"), (name, "b2"), (name, "d1")]])
+        self.assertEqual(wb.get_cell_value(name, "B2"), decimal.Decimal(2))
+        self.assertEqual(wb.get_cell_value(name, "D1"), decimal.Decimal(20))
+        self.assertIsNone(wb.get_cell_contents(name, "A1"))
+        self.assertEqual(wb.get_cell_contents(name, "B2"), "=b1 + 1")
+
+    def test_move_target_out_of_bounds(self):
+        wb = sheets.Workbook()
+        num, name = wb.new_sheet()
+
+        wb.set_cell_contents(name, "A1", "1")
+        wb.set_cell_contents(name, "A2", "2")
+
+        with self.assertRaises(ValueError):
+            wb.move_cells(name, "A1", "A2", "A9999")
+
+        self.assertEqual(wb.get_cell_value(name, "A1"), decimal.Decimal(1))
+        self.assertIsNone(wb.get_cell_value(name, "A9999"))
+
 if __name__ == "__main__":
     unittest.main()
\ No newline at end of file
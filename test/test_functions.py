@@ -476,5 +476,224 @@ class TestClass(unittest.TestCase):
 
         self.assertEqual(wb.get_cell_value(n, "A1"), False)
 
+    def test_criteria_functions(self):
+        wb = sheets.Workbook()
+        _, n = wb.new_sheet()
+
+        rows = [("apple", "3", "x"), ("Banana", "5", "y"), ("apple", "7", "y"),
+                ("cherry", "2", ""), ("", "4", "x"), ("apricot", "1", "x")]
+        for row, (a, b, c) in enumerate(rows, 1):
+            wb.set_cell_contents(n, f"A{row}", a)
+            wb.set_cell_contents(n, f"B{row}", b)
+            wb.set_cell_contents(n, f"C{row}", c)
+
+        expected = {
+            '=SUMIF(A1:A6, "APPLE", B1:B6)': 10,
+            '=SUMIF(B1:B6, ">3")': 16,
+            '=SUMIF(A1:A6, "<>apple", B1:B6)': 12,
+            '=COUNTIF(A:A, "ap*")': 3,
+            '=COUNTIF(A1:A6, "")': 1,
+            '=COUNTIF(B1:B6, "<=4")': 4,
+            '=AVERAGEIF(A1:A6, "apple", B1:B6)': 5,
+            '=SUMIFS(B:B, A:A, "a*", C:C, "x")': 4,
+            '=COUNTIFS(A1:A6, "<>apple", C1:C6, "x")': 2,
+        }
+        for row, formula in enumerate(expected, 1):
+            wb.set_cell_contents(n, f"E{row}", formula)
+            self.assertEqual(wb.get_cell_value(n, f"E{row}"), decimal.Decimal(expected[formula]), formula)
+
+        # the column indexes and range links follow later changes
+        wb.set_cell_contents(n, "B3", "1")
+        wb.set_cell_contents(n, "A7", "apricot")
+        self.assertEqual(wb.get_cell_value(n, "E1"), decimal.Decimal(4))
+        self.assertEqual(wb.get_cell_value(n, "E2"), decimal.Decimal(9))
+        self.assertEqual(wb.get_cell_value(n, "E4"), decimal.Decimal(4))
+
+        wb.set_cell_contents(n, "F1", '=AVERAGEIF(A1:A6, "zzz", B1:B6)')
+        self.assertEqual(wb.get_cell_value(n, "F1").get_type(), sheets.CellErrorType.DIVIDE_BY_ZERO)
+        wb.set_cell_contents(n, "F2", '=SUMIFS(B1:B6, A1:A5, "x")')
+        self.assertEqual(wb.get_cell_value(n, "F2").get_type(), sheets.CellErrorType.TYPE_ERROR)
+        wb.set_cell_contents(n, "F3", '=COUNTIF(F1:F5, 1)')
+        self.assertEqual(wb.get_cell_value(n, "F3").get_type(), sheets.CellErrorType.CIRCULAR_REFERENCE)
+
+    def test_criteria_range_links(self):
+        wb = sheets.Workbook()
+        _, n = wb.new_sheet()
+
+        wb.set_cell_contents(n, "A1", '=COUNTIF(B1:B5000, ">0")')
+
+        # only the populated cells of the range are linked
+        a1 = wb.sheet_map[n.lower()].cells[(1, 1)]
+        self.assertEqual(len(wb.dependency_graph.get_forward_links(a1)), 0)
+
+        wb.set_cell_contents(n, "B4000", "2")
+        self.assertEqual(len(wb.dependency_graph.get_forward_links(a1)), 1)
+        self.assertEqual(wb.get_cell_value(n, "A1"), decimal.Decimal(1))
+
+        wb.move_cells(n, "A1", "A1", "C1")
+        self.assertEqual(wb.get_cell_contents(n, "C1"), '=COUNTIF(d1:d5000, ">0")')
+
+    def test_constant_folding(self):
+        wb = sheets.Workbook()
+        _, n = wb.new_sheet()
+
+        wb.set_cell_contents(n, "A1", "12")
+        wb.set_cell_contents(n, "B1", "=A1*(1+0.50)/(2*3)")
+        wb.set_cell_contents(n, "B2", "=IF(AND(TRUE, 1), A1, A2)")
+        wb.set_cell_contents(n, "B3", "=CHOOSE(1+1, A2, A1&\"!\", 1/0)")
+        wb.set_cell_contents(n, "B4", "=IF(\"x\", A1, A2) + (1/0 & #REF!)")
+        wb.set_cell_contents(n, "B5", "=MAX(1, -2) + SUM() + A1")
+
+        b1 = wb.sheet_map[n.lower()].cells[(2, 1)]
+        self.assertEqual([t.data for t in b1.formula_tree.iter_subtrees()].count("folded"), 2)
+
+        self.assertEqual(wb.get_cell_value(n, "B1"), decimal.Decimal(3))
+        self.assertEqual(wb.get_cell_value(n, "B2"), decimal.Decimal(12))
+        self.assertEqual(wb.get_cell_value(n, "B3"), "12!")
+        self.assertEqual(wb.get_cell_value(n, "B4").get_type(), sheets.CellErrorType.TYPE_ERROR)
+        self.assertEqual(wb.get_cell_value(n, "B5").get_type(), sheets.CellErrorType.TYPE_ERROR)
+
+        # the branch that's always picked is still linked
+        wb.set_cell_contents(n, "A1", "2")
+        self.assertEqual(wb.get_cell_value(n, "B2"), decimal.Decimal(2))
+        self.assertEqual(wb.get_cell_value(n, "B3"), "2!")
+
+        # and formulas are printed, moved and renamed as they were written
+        wb.move_cells(n, "B1", "B3", "C2")
+        self.assertEqual(wb.get_cell_contents(n, "C2"), "=b2 * (1 + 0.50) / (2 * 3)")
+        self.assertEqual(wb.get_cell_contents(n, "C3"), "=IF(AND(TRUE, 1), b2, b3)")
+        self.assertEqual(wb.get_cell_value(n, "C3"), decimal.Decimal(0))
+
+        wb.rename_sheet(n, "Renamed")
+        self.assertEqual(wb.get_cell_contents("Renamed", "C4"), '=CHOOSE(1 + 1, b3, b2 & "!", 1 / 0)')
+
+    def test_function_cache(self):
+        wb = sheets.Workbook()
+        _, n = wb.new_sheet()
+        _, d = wb.new_sheet("Data")
+
+        for row in range(1, 11):
+            wb.set_cell_contents(d, f"A{row}", str(row % 3))
+            wb.set_cell_contents(d, f"B{row}", str(row))
+
+        for row in range(1, 4):
+            wb.set_cell_contents(n, f"A{row}", f"=SUMIF(Data!A1:A10, {row - 1}, Data!B1:B10) + MAX(Data!B:B) + C1")
+        cache = wb.function_cache
+
+        # only the cell that changed is different
+        misses = cache.misses
+        wb.set_cell_contents(n, "C1", "1")
+        self.assertEqual(cache.misses, misses)
+        self.assertEqual(wb.get_cell_value(n, "A1"), decimal.Decimal(3 + 6 + 9 + 10 + 1))
+
+        # a change to a range's contents gets new results
+        wb.set_cell_contents(d, "B9", "9.0")
+        self.assertEqual(wb.get_cell_value(n, "A1"), decimal.Decimal(29))
+        wb.set_cell_contents(d, "B9", "=1+1")
+        self.assertEqual(wb.get_cell_value(n, "A1"), decimal.Decimal(22))
+
+        # as does one that only changes how a value is written
+        wb.set_cell_contents(n, "B1", "=MAX(Data!B1:B1)")
+        wb.set_cell_contents(n, "B2", "=SUM(Data!A1:A2) & B1")
+        wb.set_cell_contents(d, "B1", "10")
+        self.assertEqual(wb.get_cell_value(n, "B2"), "310")
+        wb.set_cell_contents(d, "B1", "1E+1")
+        self.assertEqual(wb.get_cell_value(n, "B2"), "31E+1")
+
+        self.assertFalse(sheets.functions.functions["indirect"].pure)
+        self.assertFalse(sheets.functions.functions["if"].cacheable())
+
+        wb.set_function_cache_size(0)
+        self.assertIsNone(wb.function_cache)
+        wb.set_cell_contents(d, "B10", "0")
+        self.assertEqual(wb.get_cell_value(n, "A1"), decimal.Decimal(22))
+
+    def test_user_functions(self):
+        calls = []
+
+        def double(batch):
+            calls.append(len(batch))
+            return [a * 2 for (a,) in batch]
+
+        sheets.register_function("Twice", double, batch=True, pure=True)
+        sheets.register_function("Total", lambda args: sum(v for row in args[0] for v in row if v is not None))
+        sheets.register_function("FirstNumber", lambda args: next(a() for a in args if isinstance(a(), decimal.Decimal)), lazy=True)
+        for name in ["Twice", "FirstNumber"]:
+            self.addCleanup(sheets.unregister_function, name)
+
+        with self.assertRaises(ValueError):
+            sheets.register_function("sum", sum)
+        with self.assertRaises(ValueError):
+            sheets.register_function("1x", sum)
+
+        wb = sheets.Workbook()
+        _, n = wb.new_sheet()
+
+        wb.set_manual_calculation(True)
+        for row in range(1, 11):
+            wb.set_cell_contents(n, f"A{row}", str(row))
+            wb.set_cell_contents(n, f"B{row}", f"=TWICE(A{row}) + twice(TWICE(A{row}))")
+        wb.set_cell_contents(n, "C1", "=Total(B1:B10)")
+        wb.set_cell_contents(n, "C2", "=FIRSTNUMBER(\"x\", A3, 1/0)")
+        wb.set_cell_contents(n, "C3", "=TOTAL(1)")
+        wb.set_manual_calculation(False)
+
+        # one call per round: the inner calls, then the outer ones that
+        # weren't made already
+        self.assertEqual(calls, [10, 5])
+        self.assertEqual(wb.get_cell_value(n, "B7"), decimal.Decimal(42))
+        self.assertEqual(wb.get_cell_value(n, "C1"), decimal.Decimal(330))
+        self.assertEqual(wb.get_cell_value(n, "C2"), decimal.Decimal(3))
+        self.assertEqual(wb.get_cell_value(n, "C3").get_type(), sheets.CellErrorType.TYPE_ERROR)
+
+        # calls made outside of a recalculation's levels go one at a time
+        wb.set_cell_contents(n, "D1", "=TWICE(100)")
+        self.assertEqual(wb.get_cell_value(n, "D1"), decimal.Decimal(200))
+        self.assertEqual(calls[-1], 1)
+
+        sheets.unregister_function("Total")
+        wb.set_cell_contents(n, "A1", "0")
+        self.assertEqual(wb.get_cell_value(n, "C1").get_type(), sheets.CellErrorType.BAD_NAME)
+        with self.assertRaises(KeyError):
+            sheets.unregister_function("sum")
+
+    def test_reregistered_function(self):
+        sheets.register_function("Triple", lambda args: args[0] * 3, pure=True)
+        self.addCleanup(sheets.unregister_function, "Triple")
+
+        wb = sheets.Workbook()
+        _, n = wb.new_sheet()
+        wb.set_cell_contents(n, "A1", "=TRIPLE(2)")
+        self.assertEqual(wb.get_cell_value(n, "A1"), decimal.Decimal(6))
+
+        # the cached result of the old function isn't used
+        sheets.register_function("Triple", lambda args: args[0] * 30, pure=True)
+        wb.set_cell_contents(n, "A2", "=TRIPLE(2)")
+        self.assertEqual(wb.get_cell_value(n, "A2"), decimal.Decimal(60))
+
+    def test_function_registered_after_use(self):
+        wb = sheets.Workbook()
+        _, n = wb.new_sheet()
+        wb.set_cell_contents(n, "B1", "2")
+        wb.set_cell_contents(n, "A1", "=DOUBLE(B1)")
+        wb.set_cell_contents(n, "A2", "=A1+1")
+        self.assertEqual(wb.get_cell_value(n, "A1").get_type(), sheets.CellErrorType.BAD_NAME)
+
+        sheets.register_function("Double", lambda args: args[0] * 2)
+        self.addCleanup(sheets.unregister_function, "Double")
+        self.assertEqual(wb.get_cell_value(n, "A1"), decimal.Decimal(4))
+        self.assertEqual(wb.get_cell_value(n, "A2"), decimal.Decimal(5))
+
+        wb.set_cell_contents(n, "B1", "5")
+        self.assertEqual(wb.get_cell_value(n, "A2"), decimal.Decimal(11))
+
+        # in manual calculation mode the cells are recomputed by recalculate()
+        wb.set_manual_calculation(True)
+        sheets.register_function("Double", lambda args: args[0] * 20)
+        self.assertEqual(wb.get_cell_value(n, "A1"), decimal.Decimal(10))
+        wb.recalculate()
+        self.assertEqual(wb.get_cell_value(n, "A1"), decimal.Decimal(100))
+        self.assertEqual(wb.get_cell_value(n, "A2"), decimal.Decimal(101))
+
 if __name__ == "__main__":
         unittest.main()
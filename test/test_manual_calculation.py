@@ -0,0 +1,170 @@
+#! /usr/bin/env python3
+import unittest
+import unittest.mock
+
+import sheets
+import decimal
+
+from sheets.cell import Cell
+
+class TestClass(unittest.TestCase):
+
+    def test_values_deferred(self):
+        wb = sheets.Workbook()
+        i, n = wb.new_sheet()
+
+        wb.set_cell_contents(n, "A1", "1")
+        wb.set_cell_contents(n, "B1", "=A1+1")
+
+        wb.set_manual_calculation(True)
+
+        wb.set_cell_contents(n, "A1", "5")
+        wb.set_cell_contents(n, "C1", "=B1*2")
+
+        self.assertEqual(wb.get_cell_value(n, "A1"), decimal.Decimal(5))
+        self.assertEqual(wb.get_cell_value(n, "B1"), decimal.Decimal(2))
+        self.assertEqual(wb.get_cell_value(n, "C1"), None)
+        self.assertEqual(wb.get_cell_contents(n, "C1"), "=B1*2")
+
+        wb.recalculate()
+
+        self.assertEqual(wb.get_cell_value(n, "B1"), decimal.Decimal(6))
+        self.assertEqual(wb.get_cell_value(n, "C1"), decimal.Decimal(12))
+
+    def test_one_notification_batch(self):
+        wb = sheets.Workbook()
+        i, n = wb.new_sheet()
+
+        wb.set_cell_contents(n, "A1", "1")
+        wb.set_cell_contents(n, "B1", "=A1+1")
+        wb.set_cell_contents(n, "D1", "7")
+
+        batches = []
+
+        def on_update(workbook, locations):
+            batches.append(set(locations))
+
+        wb.notify_cells_changed(on_update)
+        wb.set_manual_calculation(True)
+
+        wb.set_cell_contents(n, "A1", "2")
+        wb.set_cell_contents(n, "A1", "3")
+        wb.set_cell_contents(n, "C1", "=B1")
+        wb.set_cell_contents(n, "D1", "=7")
+
+        self.assertEqual(batches, [])
+
+        wb.recalculate()
+
+        self.assertEqual(batches, [set([(n, "a1"), (n, "b1"), (n, "c1")])])
+
+    def test_clean_cells_untouched(self):
+        wb = sheets.Workbook()
+        i, n = wb.new_sheet()
+
+        wb.set_cell_contents(n, "A1", "1")
+        wb.set_cell_contents(n, "B1", "=A1")
+        wb.set_cell_contents(n, "A2", "1")
+        wb.set_cell_contents(n, "B2", "=A2")
+
+        wb.set_manual_calculation(True)
+        wb.set_cell_contents(n, "A1", "2")
+
+        recomputed = []
+        original = Cell.recompute_value
+
+        def recompute_value(c, workbook):
+            recomputed.append(c.location.location_string())
+            original(c, workbook)
+
+        with unittest.mock.patch.object(Cell, "recompute_value", recompute_value):
+            wb.recalculate()
+
+        self.assertEqual(sorted(recomputed), ["a1", "b1"])
+        self.assertEqual(wb.get_cell_value(n, "B1"), decimal.Decimal(2))
+
+    def test_recalculate_sheet(self):
+        wb = sheets.Workbook()
+        i, n = wb.new_sheet()
+        j, m = wb.new_sheet()
+
+        wb.set_cell_contents(n, "A1", "1")
+        wb.set_cell_contents(n, "B1", "=A1")
+        wb.set_cell_contents(m, "A1", f"={n}!A1")
+
+        wb.set_manual_calculation(True)
+        wb.set_cell_contents(n, "A1", "2")
+
+        wb.recalculate(m)
+
+        self.assertEqual(wb.get_cell_value(m, "A1"), decimal.Decimal(2))
+        self.assertEqual(wb.get_cell_value(n, "B1"), decimal.Decimal(1))
+
+        wb.recalculate(n)
+
+        self.assertEqual(wb.get_cell_value(n, "B1"), decimal.Decimal(2))
+
+    def test_move_copy_sort(self):
+        wb = sheets.Workbook()
+        i, n = wb.new_sheet()
+
+        for row in range(1, 4):
+            wb.set_cell_contents(n, f"A{row}", str(4 - row))
+            wb.set_cell_contents(n, f"B{row}", f"=A{row}*10")
+
+        wb.set_manual_calculation(True)
+
+        wb.sort_region(n, "A1", "B3", [1])
+        wb.copy_cells(n, "A1", "B3", "D1")
+        wb.move_cells(n, "D1", "E3", "G1")
+        wb.set_cell_contents(n, "G1", "100")
+
+        self.assertEqual(wb.get_cell_value(n, "H1"), decimal.Decimal(10))
+
+        wb.set_manual_calculation(False)
+
+        for row in range(1, 4):
+            self.assertEqual(wb.get_cell_value(n, f"B{row}"), decimal.Decimal(row * 10))
+            self.assertEqual(wb.get_cell_value(n, f"D{row}"), None)
+
+        self.assertEqual(wb.get_cell_value(n, "H1"), decimal.Decimal(1000))
+        self.assertEqual(wb.get_cell_value(n, "H3"), decimal.Decimal(30))
+
+    def test_cycle(self):
+        wb = sheets.Workbook()
+        i, n = wb.new_sheet()
+
+        wb.set_manual_calculation(True)
+        wb.set_cell_contents(n, "A1", "=B1")
+        wb.set_cell_contents(n, "B1", "=A1")
+        wb.recalculate()
+
+        self.assertEqual(wb.get_cell_value(n, "A1").get_type(), sheets.CellErrorType.CIRCULAR_REFERENCE)
+        self.assertEqual(wb.get_cell_value(n, "B1").get_type(), sheets.CellErrorType.CIRCULAR_REFERENCE)
+
+    def test_condition_and_branch_edited(self):
+        wb = sheets.Workbook()
+        i, n = wb.new_sheet()
+
+        wb.set_cell_contents(n, "C1", "1")
+        wb.set_cell_contents(n, "A1", "=C1>2")
+        wb.set_cell_contents(n, "D1", "=C1+1")
+        wb.set_cell_contents(n, "E1", "=D1+1")
+        wb.set_cell_contents(n, "B1", "=E1*2")
+        wb.set_cell_contents(n, "X1", "=IF(A1, B1, 0)")
+        wb.set_cell_contents(n, "Y1", "=IF(C1>2, SUM(Y2:Y3), 0)")
+        wb.set_cell_contents(n, "Y2", "=Y1+1")
+
+        # the condition flips in the same pass as the branch's inputs change,
+        # and Y1's new branch closes a cycle
+        wb.set_manual_calculation(True)
+        wb.set_cell_contents(n, "C1", "4")
+        wb.set_cell_contents(n, "A1", "=C1>3")
+        wb.recalculate()
+
+        self.assertEqual(wb.get_cell_value(n, "X1"), decimal.Decimal(12))
+        self.assertEqual(wb.get_cell_value(n, "Y1").get_type(), sheets.CellErrorType.CIRCULAR_REFERENCE)
+        self.assertEqual(wb.get_cell_value(n, "Y2").get_type(), sheets.CellErrorType.CIRCULAR_REFERENCE)
+
+if __name__ == "__main__":
+        unittest.main()
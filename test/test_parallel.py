@@ -0,0 +1,241 @@
+#! /usr/bin/env python3
+import unittest
+import random
+
+import sheets
+import decimal
+
+class TestClass(unittest.TestCase):
+
+    def setUp(self):
+        self.wb = sheets.Workbook()
+        self.wb.set_parallel_recalculation(2, min_cells=5)
+
+    def tearDown(self):
+        self.wb.set_parallel_recalculation(0)
+
+    def test_independent_chains(self):
+        wb = self.wb
+        _, n = wb.new_sheet()
+        _, m = wb.new_sheet()
+
+        wb.set_manual_calculation(True)
+
+        for i in range(2, 20):
+            wb.set_cell_contents(n, f"A{i}", f"=A{i-1}+1")
+            wb.set_cell_contents(m, f"B{i}", f"=B{i-1}&\"x\"")
+
+        wb.set_cell_contents(n, "A1", "1")
+        wb.set_cell_contents(m, "B1", "'x")
+
+        updated = set()
+
+        def on_update(workbook, locations):
+            updated.update(locations)
+
+        wb.notify_cells_changed(on_update)
+        wb.set_manual_calculation(False)
+
+        for i in range(1, 20):
+            self.assertEqual(wb.get_cell_value(n, f"A{i}"), decimal.Decimal(i))
+            self.assertEqual(wb.get_cell_value(m, f"B{i}"), "x" * i)
+
+        self.assertEqual(len(updated), 38)
+
+    def test_inputs_and_errors(self):
+        wb = self.wb
+        _, n = wb.new_sheet()
+        _, m = wb.new_sheet()
+
+        wb.set_cell_contents(m, "A1", "10")
+        wb.set_cell_contents(n, "A1", "1")
+
+        for i in range(2, 10):
+            wb.set_cell_contents(n, f"A{i}", f"=A{i-1}+{m}!A1")
+
+        wb.set_cell_contents(n, "B1", "=A9/0")
+        wb.set_cell_contents(n, "B2", "=B1")
+        wb.set_cell_contents(n, "B3", "=NoSuchSheet!A1")
+
+        wb.set_cell_contents(n, "A1", "2")
+
+        self.assertEqual(wb.get_cell_value(n, "A9"), decimal.Decimal(82))
+        self.assertEqual(wb.get_cell_value(n, "B2").get_type(), sheets.CellErrorType.DIVIDE_BY_ZERO)
+        self.assertEqual(wb.get_cell_value(n, "B3").get_type(), sheets.CellErrorType.BAD_REFERENCE)
+
+    def test_runtime_links_merged(self):
+        wb = self.wb
+        _, n = wb.new_sheet()
+
+        wb.set_cell_contents(n, "B1", "5")
+        wb.set_cell_contents(n, "C1", "6")
+        wb.set_cell_contents(n, "A1", "1")
+
+        for i in range(2, 10):
+            wb.set_cell_contents(n, f"A{i}", f"=IF(A{i-1}>0, B1, C1) + A{i-1}")
+
+        wb.set_cell_contents(n, "A1", "2")
+
+        self.assertEqual(wb.get_cell_value(n, "A9"), decimal.Decimal(42))
+
+        # B1 was only linked at runtime, while evaluating in a worker
+        wb.set_cell_contents(n, "B1", "1")
+
+        self.assertEqual(wb.get_cell_value(n, "A9"), decimal.Decimal(10))
+
+    def test_cycle(self):
+        wb = self.wb
+        _, n = wb.new_sheet()
+
+        wb.set_manual_calculation(True)
+        for i in range(2, 10):
+            wb.set_cell_contents(n, f"A{i}", f"=A{i-1}")
+        wb.set_cell_contents(n, "A1", "=A9")
+        wb.set_manual_calculation(False)
+
+        for i in range(1, 10):
+            value = wb.get_cell_value(n, f"A{i}")
+            self.assertEqual(value.get_type(), sheets.CellErrorType.CIRCULAR_REFERENCE)
+
+    def test_sort(self):
+        wb = self.wb
+        wb.set_parallel_sort(4)
+
+        serial = sheets.Workbook()
+
+        rng = random.Random(130)
+        for workbook in (wb, serial):
+            workbook.new_sheet()
+
+        for row in range(1, 41):
+            a = rng.choice(["1", "2", "x", "X", "", "true", "#REF!"])
+            b = str(rng.randint(1, 5))
+            for workbook in (wb, serial):
+                workbook.set_cell_contents("Sheet1", f"A{row}", a)
+                workbook.set_cell_contents("Sheet1", f"B{row}", b)
+                workbook.set_cell_contents("Sheet1", f"C{row}", str(row))
+
+        for workbook in (wb, serial):
+            workbook.sort_region("Sheet1", "A1", "C40", [-2, 1])
+
+        for row in range(1, 41):
+            self.assertEqual(wb.get_cell_value("Sheet1", f"C{row}"), serial.get_cell_value("Sheet1", f"C{row}"))
+
+    def test_scenarios(self):
+        wb = self.wb
+        _, n = wb.new_sheet()
+        _, m = wb.new_sheet("Other")
+
+        wb.set_cell_contents(n, "A1", "1")
+        wb.set_cell_contents(n, "A2", "2")
+        wb.set_cell_contents(n, "B1", "=A1:A2*10")
+        wb.set_cell_contents(n, "C1", "=SUM(B:B)")
+        wb.set_cell_contents(n, "C2", "=IF(A1>1, Other!A1, 0)")
+        wb.set_cell_contents(m, "A1", f"={n}!A2+100")
+
+        # a fork has the same values, and changes to it stay in it
+        fork = wb.fork()
+        self.assertEqual(fork.get_cell_value(n, "B2"), decimal.Decimal(20))
+        fork.set_cell_contents(n, "A2", "3")
+        self.assertEqual(fork.get_cell_value(n, "C1"), decimal.Decimal(40))
+        self.assertEqual(fork.get_cell_value(m, "A1"), decimal.Decimal(103))
+        self.assertEqual(wb.get_cell_value(n, "C1"), decimal.Decimal(30))
+        self.assertEqual(wb.get_cell_value(m, "A1"), decimal.Decimal(102))
+
+        scenarios = [{(n, "A1"): "5"}, {(n, "a2"): "7", (n, "B2"): "x"}, {}]
+        outputs = [(n, "B2"), (n, "C1"), (n, "C2")]
+
+        results = wb.run_scenarios(scenarios, outputs)
+        wb.set_parallel_recalculation(0)
+        self.assertEqual([[str(v) for v in row] for row in results],
+                         [[str(v) for v in row] for row in wb.run_scenarios(scenarios, outputs)])
+
+        self.assertEqual(results[0], [decimal.Decimal(20), decimal.Decimal(70), decimal.Decimal(102)])
+        self.assertEqual(results[1][1].get_type(), sheets.CellErrorType.BAD_REFERENCE)
+        self.assertEqual(results[2], [decimal.Decimal(20), decimal.Decimal(30), decimal.Decimal(0)])
+        self.assertEqual(wb.get_cell_value(n, "C1"), decimal.Decimal(30))
+
+    def test_scenarios_lazy_ranges(self):
+        wb = self.wb
+        _, n = wb.new_sheet()
+
+        for i in range(1, 4):
+            wb.set_cell_contents(n, f"A{i}", str(i))
+            wb.set_cell_contents(n, f"B{i}", str(i * 10))
+        wb.set_cell_contents(n, "C1", "TRUE")
+        wb.set_cell_contents(n, "C2", "A1")
+        wb.set_cell_contents(n, "D1", "=IF(C1, SUM(A1:A3), SUM(B1:B3))")
+        wb.set_cell_contents(n, "D2", "=INDIRECT(C2)*2")
+        wb.set_cell_contents(n, "D3", "=IF(C1, A1:A3, B1:B3)")
+        wb.set_cell_contents(n, "E1", "=SUM(D3:D5)+D1")
+
+        # the scenarios change cells that the workbook's values don't read
+        # yet, so workers need the workbook's links as well as its values
+        scenarios = [{(n, "B2"): "100"}, {(n, "C1"): "FALSE", (n, "B1"): "5"},
+                     {(n, "C2"): "B3"}, {(n, "B3"): "1", (n, "C2"): "B3"}, {}]
+        outputs = [(n, "D1"), (n, "D2"), (n, "D4"), (n, "E1")]
+
+        results = wb.run_scenarios(scenarios, outputs)
+        wb.set_parallel_recalculation(0)
+        self.assertEqual(results, wb.run_scenarios(scenarios, outputs))
+
+        self.assertEqual(results[0], [decimal.Decimal(6), decimal.Decimal(2), decimal.Decimal(2), decimal.Decimal(12)])
+        self.assertEqual(results[1], [decimal.Decimal(55), decimal.Decimal(2), decimal.Decimal(20), decimal.Decimal(110)])
+        self.assertEqual(results[2][1], decimal.Decimal(60))
+        self.assertEqual(results[3][1], decimal.Decimal(2))
+
+    def test_user_functions(self):
+        wb = self.wb
+        _, n = wb.new_sheet()
+
+        # start the workers before the function is registered
+        wb.set_manual_calculation(True)
+        wb.set_cell_contents(n, "A1", "2")
+        for i in range(2, 10):
+            wb.set_cell_contents(n, f"A{i}", f"=A{i-1}*2")
+        wb.set_manual_calculation(False)
+
+        sheets.register_function("Double", lambda args: args[0] * 2)
+        self.addCleanup(sheets.unregister_function, "Double")
+
+        wb.set_manual_calculation(True)
+        for i in range(2, 10):
+            wb.set_cell_contents(n, f"A{i}", f"=DOUBLE(A{i-1})")
+        wb.set_manual_calculation(False)
+
+        for i in range(1, 10):
+            self.assertEqual(wb.get_cell_value(n, f"A{i}"), decimal.Decimal(2 ** i))
+
+        results = wb.run_scenarios([{(n, "A1"): "1"}, {(n, "A1"): "3"}], [(n, "A9")])
+        self.assertEqual(results, [[decimal.Decimal(256)], [decimal.Decimal(768)]])
+
+    def test_branch_in_other_group(self):
+        wb = self.wb
+        _, n = wb.new_sheet()
+
+        # X1 starts reading B1, in another group of cells evaluated at the
+        # same time, when A1 changes
+        wb.set_manual_calculation(True)
+        wb.set_cell_contents(n, "C1", "1")
+        wb.set_cell_contents(n, "A1", "=C1>2")
+        wb.set_cell_contents(n, "X1", "=IF(A1, B1, 0)")
+        for i in range(2, 6):
+            wb.set_cell_contents(n, f"X{i}", f"=X{i-1}+1")
+
+        wb.set_cell_contents(n, "F1", "1")
+        wb.set_cell_contents(n, "F2", "=F1+1")
+        wb.set_cell_contents(n, "F3", "=F2+1")
+        wb.set_cell_contents(n, "F4", "=F3+1")
+        wb.set_cell_contents(n, "B1", "=F4*2")
+        wb.set_manual_calculation(False)
+
+        wb.set_manual_calculation(True)
+        wb.set_cell_contents(n, "C1", "5")
+        wb.set_cell_contents(n, "F1", "10")
+        wb.set_manual_calculation(False)
+
+        self.assertEqual(wb.get_cell_value(n, "X1"), decimal.Decimal(26))
+        self.assertEqual(wb.get_cell_value(n, "X5"), decimal.Decimal(30))
+
+if __name__ == "__main__":
+        unittest.main()
@@ -5,6 +5,9 @@ import unittest.mock
 import sheets
 import decimal
 
+from sheets import base_types
+from sheets.column_index import ColumnIndex
+
 class TestClass(unittest.TestCase):
 
     def test_range_parse(self):
@@ -212,6 +215,45 @@ class TestClass(unittest.TestCase):
         self.assertIsInstance(wb.get_cell_value(n, "A4"), sheets.CellError)
         self.assertEqual(wb.get_cell_value(n, "A4").get_type(), sheets.CellErrorType.TYPE_ERROR)
 
+    def test_match_index_xlookup(self):
+        wb = sheets.Workbook()
+        i, n = wb.new_sheet()
+
+        for row, (key, value) in enumerate([(10, "a"), (20, "b"), (20, "bb"), (30, "c"), (40, "d")], 1):
+            wb.set_cell_contents(n, f"A{row}", str(key))
+            wb.set_cell_contents(n, f"B{row}", value)
+
+        expected = {
+            "=MATCH(20, A1:A5, 0)": decimal.Decimal(2),
+            "=MATCH(25, A:A)": decimal.Decimal(3),
+            "=MATCH(20, A1:A5)": decimal.Decimal(3),
+            '=MATCH("B*", B1:B5, 0)': decimal.Decimal(2),
+            "=INDEX(A1:B5, 2, 2)": "b",
+            "=INDEX(B1:B5, MATCH(40, A1:A5, 0))": "d",
+            "=XLOOKUP(30, A:A, B:B)": "c",
+            '=XLOOKUP(35, A1:A5, B1:B5, "none")': "none",
+            '=XLOOKUP(35, A1:A5, B1:B5, "none", -1)': "c",
+            '=XLOOKUP(35, A1:A5, B1:B5, "none", 1)': "d",
+            "=XLOOKUP(20, A1:A5, B1:B5, 0, 0, -1)": "bb",
+        }
+        for row, formula in enumerate(expected, 1):
+            wb.set_cell_contents(n, f"D{row}", formula)
+            self.assertEqual(wb.get_cell_value(n, f"D{row}"), expected[formula], formula)
+
+        wb.set_cell_contents(n, "A4", "35")
+        self.assertEqual(wb.get_cell_value(n, "D7").get_type(), sheets.CellErrorType.TYPE_ERROR)
+        self.assertEqual(wb.get_cell_value(n, "D8"), "c")
+
+        wb.set_cell_contents(n, "A6", "50")
+        wb.set_cell_contents(n, "B6", "e")
+        wb.set_cell_contents(n, "E1", "=XLOOKUP(50, A:A, B:B)")
+        self.assertEqual(wb.get_cell_value(n, "E1"), "e")
+
+        wb.set_cell_contents(n, "E2", "=INDEX(B1:B5, 9)")
+        self.assertEqual(wb.get_cell_value(n, "E2").get_type(), sheets.CellErrorType.BAD_REFERENCE)
+        wb.set_cell_contents(n, "E3", "=MATCH(1, A1:B5)")
+        self.assertEqual(wb.get_cell_value(n, "E3").get_type(), sheets.CellErrorType.TYPE_ERROR)
+
     def test_update_on_copy_sheet(self):
         wb = sheets.Workbook()
         i, n = wb.new_sheet()
@@ -227,6 +269,83 @@ class TestClass(unittest.TestCase):
 
         self.assertEqual(wb.get_cell_value(m, "A1"), decimal.Decimal(3))
 
+    def test_populated_cells_in_region(self):
+        wb = sheets.Workbook()
+        i, n = wb.new_sheet()
+
+        for location in ["C3", "A1", "E2", "B5", "D3", "Z9"]:
+            wb.set_cell_contents(n, location, "1")
+        wb.set_cell_contents(n, "D3", "")
+
+        wb.set_cell_contents(n, "F1", "=SUM(B2:E5)")
+        self.assertEqual(wb.get_cell_value(n, "F1"), decimal.Decimal(3))
+
+        sheet = wb.sheet_map[n.lower()]
+        locations = [location for location, _cell in sheet.get_cells_in_region((2, 2), (5, 5))]
+        self.assertEqual(locations, [(5, 2), (3, 3), (2, 5)])
+
+        wb.move_cells(n, "E2", "E2", "D4")
+        wb.set_cell_contents(n, "B4", "2")
+        self.assertEqual(wb.get_cell_value(n, "F1"), decimal.Decimal(5))
+
+        range_cells = sheets.range.CellRange(n, "A1", "E5").generate_populated(wb)
+        self.assertEqual([c.location.location_string() for c in range_cells], ["a1", "c3", "b4", "d4", "b5"])
+
+    def test_whole_column_and_row(self):
+        wb = sheets.Workbook()
+        i, n = wb.new_sheet()
+
+        wb.set_cell_contents(n, "A1", "1")
+        wb.set_cell_contents(n, "A2", "2")
+        wb.set_cell_contents(n, "B3", "4")
+        wb.set_cell_contents(n, "C1", "=SUM(A:A)")
+        wb.set_cell_contents(n, "E5", "=SUM(2:3)")
+        wb.set_cell_contents(n, "E6", '=SUM(INDIRECT("A:A"))')
+
+        self.assertEqual(wb.get_cell_value(n, "C1"), decimal.Decimal(3))
+        self.assertEqual(wb.get_cell_value(n, "E5"), decimal.Decimal(6))
+
+        # cells populated after the formula was entered are still picked up
+        wb.set_cell_contents(n, "A500", "10")
+        self.assertEqual(wb.get_cell_value(n, "C1"), decimal.Decimal(13))
+        self.assertEqual(wb.get_cell_value(n, "E6"), decimal.Decimal(13))
+
+        wb.move_cells(n, "C1", "C1", "D1")
+        self.assertEqual(wb.get_cell_contents(n, "D1"), "=SUM(b:b)")
+        self.assertEqual(wb.get_cell_value(n, "D1"), decimal.Decimal(4))
+
+        j, m = wb.new_sheet()
+        wb.set_cell_contents(m, "A1", f"=SUM({n}!A:A)")
+
+        wb.rename_sheet(n, "Renamed")
+        self.assertEqual(wb.get_cell_contents("Renamed", "E5"), "=SUM(2:3)")
+        self.assertEqual(wb.get_cell_contents(m, "A1"), "=SUM(Renamed!a:A)")
+
+        wb.set_cell_contents("Renamed", "A7", "5")
+        self.assertEqual(wb.get_cell_value(m, "A1"), decimal.Decimal(18))
+
+        wb.set_cell_contents("Renamed", "A3", "=SUM(A:A)")
+        value = wb.get_cell_value("Renamed", "A3")
+        self.assertEqual(value.get_type(), sheets.CellErrorType.CIRCULAR_REFERENCE)
+
+
+    def test_column_index_rows_between(self):
+        index = ColumnIndex()
+        values = {}
+        for row in range(1, 200):
+            value = decimal.Decimal(row * 7 % 50) if row % 3 else f"s{row % 11}"
+            index.add(row, value)
+            values[row] = base_types.sort_key(value)
+
+        for inclusive in [True, False]:
+            low, high = (values[4], inclusive), (values[7], not inclusive)
+            for first, last in [(1, 199), (20, 25), (100, 100), (150, 400)]:
+                # short ranges look at the range's rows rather than the keys
+                expected = [row for row in range(first, min(last, 199) + 1)
+                            if (low[0] < values[row] or (inclusive and low[0] == values[row]))
+                            and (values[row] < high[0] or (not inclusive and values[row] == high[0]))]
+                self.assertEqual(index.rows_between(low, high, first, last), expected)
+                self.assertGreater(len(index.rows_between(low, high, 1, 199)), 0)
 
 if __name__ == "__main__":
         unittest.main()
@@ -1,7 +1,10 @@
 import unittest
+import unittest.mock
 import sheets
 import decimal
 
+from sheets import cell
+
 
 class TestClass(unittest.TestCase):
     
@@ -128,6 +131,44 @@ class TestClass(unittest.TestCase):
         wb.set_cell_contents(name, "A1", "='sheet@bla'!A1")
         wb.rename_sheet(name2, "sheet2")
         self.assertEqual(wb.get_cell_value(name, "A1"), decimal.Decimal(0))
+
+    def test_rename_without_recompute(self):
+        wb = sheets.Workbook()
+        _, name = wb.new_sheet("Data")
+        _, other = wb.new_sheet()
+
+        wb.set_cell_contents(name, "A1", "5")
+        wb.set_cell_contents(name, "A2", "=A1 * 2")
+        wb.set_cell_contents(other, "A1", "=Data!A1 + Data!A2")
+        wb.set_cell_contents(other, "A2", "=A1 + 1")
+        wb.set_cell_contents(other, "B1", "=Renamed!A1")
+        wb.set_cell_contents(other, "B2", '=INDIRECT("Data!A1")')
+
+        updated = []
+        wb.notify_cells_changed(lambda _wb, locations: updated.extend(locations))
+
+        evaluated = []
+        original = cell.Cell.evaluate_formula
+
+        def evaluate_formula(c, workbook):
+            evaluated.append(c.location.location_string())
+            return original(c, workbook)
+
+        with unittest.mock.patch.object(cell.Cell, "evaluate_formula", evaluate_formula):
+            wb.rename_sheet(name, "Renamed")
+
+        # only the cells whose references resolve differently are recomputed
+        self.assertEqual(sorted(evaluated), ["b1", "b2"])
+        self.assertEqual(sorted(updated), [(other, "b1"), (other, "b2")])
+
+        self.assertEqual(wb.get_cell_contents(other, "A1"), "=Renamed!a1 + Renamed!a2")
+        self.assertEqual(wb.get_cell_value(other, "B1"), decimal.Decimal(5))
+        self.assertEqual(wb.get_cell_value(other, "B2").get_type(), sheets.CellErrorType.BAD_REFERENCE)
+
+        # links follow the sheet to its new name
+        wb.set_cell_contents("Renamed", "A1", "1")
+        self.assertEqual(wb.get_cell_value(other, "A2"), decimal.Decimal(4))
+        self.assertEqual(wb.get_cell_value(other, "B1"), decimal.Decimal(1))
     
 if __name__ == "__main__":
         unittest.main()
@@ -1,7 +1,10 @@
 import unittest
+import unittest.mock
 import decimal
 import sheets
 
+from sheets import interp
+
 class TestClass(unittest.TestCase):
 
     def test_correct_new_location(self):
@@ -172,5 +175,33 @@ class TestClass(unittest.TestCase):
         # self.assertEqual(wb.get_cell_value(copy_name, "A1"), decimal.Decimal(2))
 
 
+    def test_copy_shares_formulas(self):
+        wb = sheets.Workbook()
+        _, name = wb.new_sheet("Template")
+
+        wb.set_cell_contents(name, "A1", "2")
+        wb.set_cell_contents(name, "A2", "=A1 * 3")
+        wb.set_cell_contents(name, "A3", "=IF(A1 > 1, A2, A1)")
+
+        with unittest.mock.patch.object(interp, "parse_formula", side_effect=AssertionError):
+            _, copy_name = wb.copy_sheet(name)
+
+        source = wb.sheet_map[name.lower()].cells[(1, 2)]
+        clone = wb.sheet_map[copy_name.lower()].cells[(1, 2)]
+        self.assertIs(source.formula_tree, clone.formula_tree)
+        self.assertEqual(wb.get_cell_value(copy_name, "A3"), decimal.Decimal(6))
+
+        # the copy's references are to its own cells, including ones only
+        # used at runtime
+        wb.set_cell_contents(copy_name, "A1", "5")
+        self.assertEqual(wb.get_cell_value(copy_name, "A3"), decimal.Decimal(15))
+        self.assertEqual(wb.get_cell_value(name, "A3"), decimal.Decimal(6))
+
+        # moving the copy's formula doesn't touch the original's tree
+        wb.move_cells(copy_name, "A2", "A2", "B2")
+        self.assertEqual(wb.get_cell_contents(copy_name, "B2"), "=b1 * 3")
+        self.assertEqual(wb.get_cell_contents(name, "A2"), "=A1 * 3")
+        self.assertIsNot(source.formula_tree, wb.sheet_map[copy_name.lower()].cells[(2, 2)].formula_tree)
+
 if __name__ == "__main__":
         unittest.main()
\ No newline at end of file
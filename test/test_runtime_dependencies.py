@@ -0,0 +1,119 @@
+#! /usr/bin/env python3
+import unittest
+import unittest.mock
+
+import sheets
+import decimal
+
+from sheets import interp
+
+class TestClass(unittest.TestCase):
+
+    def test_no_relink_churn(self):
+        wb = sheets.Workbook()
+        _, n = wb.new_sheet()
+
+        wb.set_cell_contents(n, "A1", "1")
+        wb.set_cell_contents(n, "B1", "2")
+        for row in range(1, 50):
+            wb.set_cell_contents(n, f"C{row}", "=IF(A1 > 0, B1, 0)")
+
+        wb.dependency_graph.get_cycles()
+        self.assertFalse(wb.dependency_graph.cycles_dirty)
+
+        # the same branch is taken, so no runtime links change
+        wb.set_cell_contents(n, "A1", "2")
+
+        self.assertFalse(wb.dependency_graph.cycles_dirty)
+        self.assertEqual(wb.get_cell_value(n, "C49"), decimal.Decimal(2))
+
+    def test_branch_switch_unlinks(self):
+        wb = sheets.Workbook()
+        _, n = wb.new_sheet()
+
+        wb.set_cell_contents(n, "A1", "true")
+        wb.set_cell_contents(n, "B1", "1")
+        wb.set_cell_contents(n, "C1", "2")
+        wb.set_cell_contents(n, "D1", "=IF(A1, B1, C1)")
+
+        d1 = wb.sheet_map[n.lower()].cells[(4, 1)]
+        b1 = wb.sheet_map[n.lower()].cells[(2, 1)]
+        c1 = wb.sheet_map[n.lower()].cells[(3, 1)]
+
+        self.assertIn(b1, wb.dependency_graph.get_forward_links(d1))
+
+        wb.set_cell_contents(n, "A1", "false")
+
+        self.assertNotIn(b1, wb.dependency_graph.get_forward_links(d1))
+        self.assertIn(c1, wb.dependency_graph.get_forward_links(d1))
+        self.assertEqual(wb.get_cell_value(n, "D1"), decimal.Decimal(2))
+
+    def test_lazy_cycle_broken(self):
+        wb = sheets.Workbook()
+        _, n = wb.new_sheet()
+
+        wb.set_cell_contents(n, "B1", "true")
+        wb.set_cell_contents(n, "A1", "=IF(B1, C1, 5)")
+        wb.set_cell_contents(n, "C1", "=A1")
+
+        self.assertEqual(wb.get_cell_value(n, "A1").get_type(), sheets.CellErrorType.CIRCULAR_REFERENCE)
+
+        wb.set_cell_contents(n, "B1", "false")
+
+        self.assertEqual(wb.get_cell_value(n, "A1"), decimal.Decimal(5))
+
+    def test_indirect_sheet_created(self):
+        wb = sheets.Workbook()
+        _, n = wb.new_sheet()
+
+        wb.set_cell_contents(n, "A1", '=INDIRECT("Other!A1")')
+        self.assertEqual(wb.get_cell_value(n, "A1").get_type(), sheets.CellErrorType.BAD_REFERENCE)
+
+        wb.new_sheet("Other")
+
+        self.assertEqual(wb.get_cell_value(n, "A1"), decimal.Decimal(0))
+
+    def test_missing_sheet_in_branch(self):
+        wb = sheets.Workbook()
+        _, n = wb.new_sheet()
+
+        wb.set_cell_contents(n, "A1", "=IF(TRUE, Other!A1, 1)")
+        self.assertEqual(wb.get_cell_value(n, "A1").get_type(), sheets.CellErrorType.BAD_REFERENCE)
+
+    def test_branch_refs_precomputed(self):
+        wb = sheets.Workbook()
+        _, n = wb.new_sheet()
+
+        branches = ", ".join(f"B{row} * 2" for row in range(1, 30))
+        wb.set_cell_contents(n, "A1", "3")
+        wb.set_cell_contents(n, "C1", f"=CHOOSE(A1, {branches})")
+
+        for row in range(1, 30):
+            wb.set_cell_contents(n, f"B{row}", str(row))
+
+        visits = []
+        original = interp.CellRefFinder.visit
+
+        def visit(finder, tree):
+            visits.append(tree)
+            return original(finder, tree)
+
+        with unittest.mock.patch.object(interp.CellRefFinder, "visit", visit):
+            wb.set_cell_contents(n, "A1", "7")
+            wb.set_cell_contents(n, "B7", "10")
+
+        self.assertEqual(visits, [])
+        self.assertEqual(wb.get_cell_value(n, "C1"), decimal.Decimal(20))
+
+    def test_branch_refs_after_copy(self):
+        wb = sheets.Workbook()
+        _, n = wb.new_sheet()
+
+        wb.set_cell_contents(n, "A1", "=IF(TRUE, B1, C1)")
+        wb.copy_cells(n, "A1", "A1", "A2")
+        wb.set_cell_contents(n, "B2", "4")
+
+        self.assertEqual(wb.get_cell_value(n, "A2"), decimal.Decimal(4))
+
+if __name__ == "__main__":
+        unittest.main()
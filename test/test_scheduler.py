@@ -0,0 +1,127 @@
+#! /usr/bin/env python3
+import unittest
+
+import sheets
+import decimal
+
+from sheets import parallel
+from sheets import scheduler
+
+class TestClass(unittest.TestCase):
+
+    def test_levels(self):
+        wb = sheets.Workbook()
+        _, n = wb.new_sheet()
+
+        wb.set_cell_contents(n, "A1", "1")
+        wb.set_cell_contents(n, "B1", "=A1")
+        wb.set_cell_contents(n, "B2", "=A1")
+        wb.set_cell_contents(n, "C1", "=B1+B2")
+        wb.set_cell_contents(n, "Z99", "=5")
+
+        levels = []
+
+        def dispatch(workbook, cells):
+            levels.append(sorted(c.location.location_string() for c in cells))
+            scheduler.serial_dispatch(workbook, cells)
+
+        wb.scheduler.dispatch_level = dispatch
+        wb.set_cell_contents(n, "A1", "2")
+
+        self.assertEqual(levels, [["b1", "b2"], ["c1"]])
+        self.assertEqual([size for size, _seconds in wb.scheduler.level_stats], [2, 1])
+        self.assertEqual(wb.get_cell_value(n, "C1"), decimal.Decimal(4))
+
+    def test_cycle_last(self):
+        wb = sheets.Workbook()
+        _, n = wb.new_sheet()
+
+        wb.set_cell_contents(n, "A1", "1")
+        wb.set_cell_contents(n, "B1", "=A1+C1")
+        wb.set_cell_contents(n, "C1", "=B1")
+        wb.set_cell_contents(n, "D1", "=C1")
+        wb.set_cell_contents(n, "E1", "=A1")
+
+        wb.set_cell_contents(n, "A1", "2")
+
+        self.assertEqual([size for size, _seconds in wb.scheduler.level_stats], [1, 3])
+        self.assertEqual(wb.get_cell_value(n, "E1"), decimal.Decimal(2))
+        for location in ["B1", "C1", "D1"]:
+            value = wb.get_cell_value(n, location)
+            self.assertEqual(value.get_type(), sheets.CellErrorType.CIRCULAR_REFERENCE)
+
+    def test_dispatch_level_to_pool(self):
+        wb = sheets.Workbook()
+        wb.set_parallel_recalculation(2, min_cells=4)
+        wb.scheduler.dispatch_level = parallel.dispatch_level_to_pool
+
+        _, n = wb.new_sheet()
+
+        wb.set_cell_contents(n, "A1", "1")
+        for row in range(1, 11):
+            wb.set_cell_contents(n, f"B{row}", f"=A1*{row}")
+            wb.set_cell_contents(n, f"C{row}", f"=IF(B{row}>5, B{row}, INDIRECT(\"A1\"))")
+
+        wb.set_cell_contents(n, "A1", "3")
+
+        for row in range(1, 11):
+            self.assertEqual(wb.get_cell_value(n, f"B{row}"), decimal.Decimal(3 * row))
+            expected = 3 * row if 3 * row > 5 else 3
+            self.assertEqual(wb.get_cell_value(n, f"C{row}"), decimal.Decimal(expected))
+
+        wb.set_parallel_recalculation(0)
+
+    def test_shared_subexpressions(self):
+        wb = sheets.Workbook()
+        _, n = wb.new_sheet()
+        _, d = wb.new_sheet("Data")
+
+        for row in range(1, 21):
+            wb.set_cell_contents(d, f"A{row}", str(row))
+            wb.set_cell_contents(d, f"B{row}", str(row * 10))
+
+        wb.set_manual_calculation(True)
+        for row in range(1, 11):
+            wb.set_cell_contents(n, f"A{row}", f"=VLOOKUP(5, Data!$A$1:$B$20, 2) + SUM(Data!B:B) + {row}")
+            # the same calls, written from the Data sheet
+            wb.set_cell_contents(d, f"C{row}", "=sum(b:B) + VLOOKUP(5, A1:B20, 2)")
+        wb.set_manual_calculation(False)
+
+        # each call is evaluated once, by whichever cell comes first
+        self.assertEqual(wb.scheduler.memo_stats, (38, 2))
+        self.assertEqual(wb.get_cell_value(n, "A10"), decimal.Decimal(50 + 2100 + 10))
+        self.assertEqual(wb.get_cell_value(d, "C10"), decimal.Decimal(2150))
+
+        # every cell still depends on the cells the calls read at runtime
+        wb.set_cell_contents(d, "B5", "0")
+        wb.set_cell_contents(d, "B30", "1")
+        for row in range(1, 11):
+            self.assertEqual(wb.get_cell_value(n, f"A{row}"), decimal.Decimal(2051 + row))
+            self.assertEqual(wb.get_cell_value(d, f"C{row}"), decimal.Decimal(2051))
+
+        # and edits between recalculations aren't hidden by the memo
+        self.assertIsNone(wb.scheduler.memo)
+        wb.set_cell_contents(n, "B1", "=SUM(Data!B1:B20) + Data!B1")
+        wb.set_cell_contents(n, "B2", "=SUM(Data!B1:B20) + B1")
+        wb.set_cell_contents(d, "B1", "5")
+        self.assertEqual(wb.get_cell_value(n, "B2"), decimal.Decimal(2 * 2045 + 5))
+
+    def test_branch_read_before_recomputed(self):
+        wb = sheets.Workbook()
+        _, n = wb.new_sheet()
+
+        wb.set_cell_contents(n, "C1", "1")
+        wb.set_cell_contents(n, "A1", "=C1>2")
+        wb.set_cell_contents(n, "D1", "=C1+1")
+        wb.set_cell_contents(n, "E1", "=D1+1")
+        wb.set_cell_contents(n, "B1", "=E1*2")
+        wb.set_cell_contents(n, "X1", "=IF(A1, B1, 0)")
+        self.assertEqual(wb.get_cell_value(n, "X1"), decimal.Decimal(0))
+
+        # X1 is in the level after A1, but the branch it switches to is
+        # two levels further down
+        wb.set_cell_contents(n, "C1", "5")
+        self.assertEqual(wb.get_cell_value(n, "X1"), decimal.Decimal(14))
+
+if __name__ == "__main__":
+        unittest.main()
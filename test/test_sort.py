@@ -224,5 +224,29 @@ class TestClass(unittest.TestCase):
             self.assertEqual(wb.get_cell_value(n, "A" + str(new_row)), decimal.Decimal(new_row))
         pass
 
+    def test_sort_mixed_directions(self):
+        wb = sheets.Workbook()
+        i, n = wb.new_sheet()
+
+        rows = [("b", "1"), ("A", "2"), ("#DIV/0!", "3"), ("", "4"), ("a", "5"), ("true", "6"), ("2", "7")]
+        for row, (key, tag) in enumerate(rows, start=1):
+            wb.set_cell_contents(n, f"A{row}", key)
+            wb.set_cell_contents(n, f"B{row}", tag)
+            wb.set_cell_contents(n, f"C{row}", f"=B{row} * 10")
+
+        wb.set_cell_contents(n, "E1", "=B1")
+
+        # ascending on A, then descending on B for ties
+        wb.sort_region(n, "A1", "C7", [1, -2])
+
+        tags = [wb.get_cell_value(n, f"B{row}") for row in range(1, 8)]
+        self.assertEqual(tags, [decimal.Decimal(tag) for tag in [4, 3, 7, 5, 2, 1, 6]])
+
+        for row in range(1, 8):
+            self.assertEqual(wb.get_cell_value(n, f"C{row}"), tags[row - 1] * 10)
+
+        # formulas outside the region still reference the same location
+        self.assertEqual(wb.get_cell_value(n, "E1"), decimal.Decimal(4))
+
 if __name__ == "__main__":
         unittest.main()
@@ -265,7 +265,30 @@ class TestClass(unittest.TestCase):
         x = decimal.Decimal(x)
         k = decimal.Decimal(k)
         self.assertEqual(wb.get_cell_value(name, f"A{k}"), x**(2**(k-2)))
-        
+
+    def test_long_operator_chain(self):
+        wb = sheets.Workbook()
+        _, name = wb.new_sheet()
+        k = 2000
+        for i in range(1, 11):
+            wb.set_cell_contents(name, f"A{i}", str(i))
+
+        # deeper than the recursion limit if each operator were its own tree
+        wb.set_cell_contents(name, "B1", "=" + "+".join(f"A{i % 10 + 1}" for i in range(k)) + "-1/0*0")
+        wb.set_cell_contents(name, "B2", "=1-2" + "".join(f"-A{i % 10 + 1}*2" for i in range(k)))
+        wb.set_cell_contents(name, "B3", "=" + "&".join(f"A{i % 10 + 1}" for i in range(k)) + "&#REF!&1/0")
+
+        self.assertEqual(wb.get_cell_value(name, "B1").get_type(), sheets.CellErrorType.DIVIDE_BY_ZERO)
+        self.assertEqual(wb.get_cell_value(name, "B2"), decimal.Decimal(-1 - 11 * k))
+        self.assertEqual(wb.get_cell_value(name, "B3").get_type(), sheets.CellErrorType.BAD_REFERENCE)
+
+        wb.set_cell_contents(name, "B1", "=" + "+".join(f"A{i % 10 + 1}" for i in range(k)))
+        wb.set_cell_contents(name, "A1", "11")
+        self.assertEqual(wb.get_cell_value(name, "B1"), decimal.Decimal(65 * k // 10))
+
+        wb.move_cells(name, "B1", "B1", "C1")
+        self.assertEqual(wb.get_cell_contents(name, "C1"), "=" + " + ".join(f"b{i % 10 + 1}" for i in range(k)))
+
     def test_copy_cells(self):
         start_location = (1, 1)
         end_location = (300, 300)
@@ -339,6 +339,33 @@ class TestClass(unittest.TestCase):
 
                 self.assertEqual(wb.get_sheet_extent(n), (0, 0))
 
+        def test_extent_after_region_operations(self):
+                wb = sheets.Workbook()
+                i, n = wb.new_sheet(None)
+
+                wb.set_cell_contents(n, "B2", "1")
+                wb.set_cell_contents(n, "B3", "=B2")
+                wb.set_cell_contents(n, "D5", "'x")
+
+                wb.move_cells(n, "B2", "B3", "F8")
+                self.assertEqual(wb.get_sheet_extent(n), (6, 9))
+
+                wb.copy_cells(n, "F8", "F9", "A1")
+                i, copy_name = wb.copy_sheet(n)
+                self.assertEqual(wb.get_sheet_extent(copy_name), (6, 9))
+
+                wb.set_cell_contents(n, "F9", "")
+                wb.set_cell_contents(n, "F8", "")
+                self.assertEqual(wb.get_sheet_extent(n), (4, 5))
+                self.assertEqual(wb.get_sheet_extent(copy_name), (6, 9))
+
+                # D5 sorts to the top, leaving the last two rows empty
+                wb.sort_region(n, "A1", "D5", [-4])
+                self.assertEqual(wb.get_sheet_extent(n), (4, 3))
+
+                wb.move_cells(copy_name, "A1", "F9", "A2")
+                self.assertEqual(wb.get_sheet_extent(copy_name), (6, 10))
+
         def test_multiple_sheets(self):
                 wb = sheets.Workbook("wb")
                 sheet_num1, sheet_name1 = wb.new_sheet("Sheet1")